@@ -0,0 +1,2 @@
+# Benchmarks for flask_api.py: a synthetic warehouse data generator and a route latency runner.
+# Usage: python -m benchmarks.run --help
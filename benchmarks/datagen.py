@@ -0,0 +1,164 @@
+# Synthetic warehouse history for benchmarking. Everything is driven by a seeded RNG so the same
+# arguments always produce the same database, which keeps runs comparable across commits.
+import json
+import random
+import sqlite3
+from datetime import date, timedelta
+
+# Average rows per day for each history table, before --scale is applied
+DAILY_VOLUMES = {
+    'purchases': 40,
+    'stock_updates': 15,
+    'sales': 40,
+    'b_grade_sales': 6,
+    'dump_sales': 3,
+    'mandi_resales': 3,
+    'rejection_received': 2,
+    'vendor_rejections': 2,
+    'lmd_data': 6,
+    'fmd_data': 6,
+    'generated_pos': 20,
+    'generated_sos': 8,
+}
+UNIT = 'Kg'
+PAYMENT_STATUSES = ['Paid', 'Unpaid', 'Partial Paid']
+PAYMENT_MODES = ['Cash', 'UPI', 'Bank Transfer']
+# Outgoing stock and grading draw on this many of an item's latest crate tags
+RECENT_LOTS = 12
+
+
+def skewed(rng, values):
+    # A few items, vendors and clients account for most of the traffic, as in the real data
+    weights = [1 / (rank + 1) for rank in range(len(values))]
+    return rng.choices(values, weights)[0]
+
+
+def daily_count(rng, mean, scale):
+    return max(0, int(rng.gauss(mean * scale, mean * scale * 0.25)))
+
+
+def payment_fields(rng, total):
+    status = rng.choice(PAYMENT_STATUSES)
+    paid = total if status == 'Paid' else 0.0 if status == 'Unpaid' else round(total * rng.uniform(0.2, 0.8), 2)
+    return status, (rng.choice(PAYMENT_MODES) if status != 'Unpaid' else None), paid, round(total - paid, 2)
+
+
+def item_tag(vendor, day, sequences):
+    # Same shape the purchase screen allocates: two-letter vendor prefix (padded with X), day of month, counter
+    prefix, day_part = vendor.ljust(2, 'X')[:2].upper(), day[8:10]
+    sequences[prefix, day_part] = sequences.get((prefix, day_part), 0) + 1
+    return f'{prefix}-{day_part}-{sequences[prefix, day_part]:04d}'
+
+
+def recent_lot(rng, lots, item):
+    # (tag, po_number, vendor) of one of the item's latest receipts, or Nones before its first
+    recent = lots.get(item)
+    return rng.choice(recent[-RECENT_LOTS:]) if recent else (None, None, None)
+
+
+def grade_tags(rng, lots, item, quantity):
+    # JSON list in the stock update screen's format, splitting the grade's quantity over one or two crates
+    if not quantity or not lots.get(item):
+        return '[]'
+    picked = [recent_lot(rng, lots, item) for _ in range(rng.randint(1, 2))]
+    return json.dumps([{'tag': tag, 'po': po_number, 'qty': str(round(quantity / len(picked), 1)), 'pcs': ''} for tag, po_number, _ in picked])
+
+
+def generate(path, years=1.0, scale=1.0, seed=42, end_date=date(2025, 12, 31)):
+    # Fills an initialised database (init_db() must have run) and returns row counts per table
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    items = [row[0] for row in cursor.execute('SELECT name FROM items ORDER BY id')]
+    vendors = [row[0] for row in cursor.execute('SELECT name FROM purchase_vendors ORDER BY id')]
+    clients = [row[0] for row in cursor.execute('SELECT name FROM vendors ORDER BY id')]
+    managers = [row[0] for row in cursor.execute('SELECT name FROM product_managers ORDER BY id')]
+    rows = {table: [] for table in DAILY_VOLUMES}
+    so_items = []
+    payments = []
+    days = int(365 * years)
+    start = end_date - timedelta(days=days - 1)
+    po_seq = so_seq = 0
+    sequences = {}
+    lots = {}
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).isoformat()
+        count = lambda table: daily_count(rng, DAILY_VOLUMES[table], scale)
+        for _ in range(count('generated_pos')):
+            po_seq += 1
+            rows['generated_pos'].append((skewed(rng, managers), skewed(rng, items), f'PO-{po_seq:06d}', round(rng.uniform(20, 500), 1), round(rng.uniform(10, 120), 2), UNIT, skewed(rng, vendors), day, 'Standard', None))
+        for _ in range(count('purchases')):
+            item, vendor = skewed(rng, items), skewed(rng, vendors)
+            received = round(rng.uniform(10, 400), 1)
+            rejected = round(received * rng.uniform(0, 0.1), 1)
+            rate = round(rng.uniform(10, 120), 2)
+            tag, po_number = item_tag(vendor, day, sequences), f'PO-{rng.randint(1, max(po_seq, 1)):06d}'
+            lots.setdefault(item, []).append((tag, po_number, vendor))
+            total = round((received - rejected) * rate, 2)
+            status, mode, paid, due = payment_fields(rng, total)
+            rows['purchases'].append((item, vendor, po_number, received, UNIT, None, received - rejected, UNIT, None, rejected, UNIT, None, 'Quality' if rejected else None, day, '10:00', day, tag, status, mode, paid, due, rate, total))
+        for _ in range(count('stock_updates')):
+            item = skewed(rng, items)
+            grades = [round(rng.uniform(0, 100), 1) for _ in range(5)]
+            tags = [grade_tags(rng, lots, item, quantity) for quantity in grades]
+            rows['stock_updates'].append((item, grades[0], UNIT, None, grades[1], UNIT, None, grades[2], UNIT, None, grades[3], UNIT, None, grades[4], UNIT, None, sum(grades), day, '18:00', None, *tags))
+        for table in ('sales', 'b_grade_sales'):
+            for _ in range(count(table)):
+                quantity = round(rng.uniform(5, 200), 1)
+                rate = round(rng.uniform(10, 150), 2)
+                total = round(quantity * rate, 2)
+                status, mode, paid, due = payment_fields(rng, total)
+                item = skewed(rng, items)
+                rows[table].append((item, skewed(rng, clients), quantity, UNIT, None, day, '12:00', f'SO-{rng.randint(1, max(so_seq, 1)):06d}', recent_lot(rng, lots, item)[0], status, mode, paid, due, rate, total))
+        for table in ('dump_sales', 'mandi_resales'):
+            for _ in range(count(table)):
+                item = skewed(rng, items)
+                rows[table].append((item, round(rng.uniform(1, 50), 1), UNIT, None, day, '16:00', recent_lot(rng, lots, item)[0]))
+        for _ in range(count('rejection_received')):
+            rows['rejection_received'].append((skewed(rng, clients), skewed(rng, items), round(rng.uniform(1, 40), 1), UNIT, None, 0.0, 'Quality', day, '11:00', day, None, None))
+        for _ in range(count('vendor_rejections')):
+            item = skewed(rng, items)
+            tag, po_number, vendor = recent_lot(rng, lots, item)
+            rows['vendor_rejections'].append((item, vendor or skewed(rng, vendors), po_number, round(rng.uniform(1, 40), 1), UNIT, None, day, '11:00', tag))
+        for table, party in (('lmd_data', clients), ('fmd_data', vendors)):
+            for _ in range(count(table)):
+                km = round(rng.uniform(10, 350), 1)
+                total = round(km * 25 + rng.uniform(0, 500), 2)
+                status, mode, paid, due = payment_fields(rng, total)
+                rows[table].append((skewed(rng, party), 'Location', f'DL{rng.randint(1, 99):02d}AB{rng.randint(1000, 9999)}', f'Driver {rng.randint(1, 30)}', None, 'Pickup', 'Desk', km, 25.0, 0.0, None, total, status, mode, paid, due, day, '09:00', day))
+        for _ in range(count('generated_sos')):
+            so_seq += 1
+            rows['generated_sos'].append((so_seq, skewed(rng, clients), f'SO-{so_seq:06d}', day))
+            for _ in range(rng.randint(1, 5)):
+                so_items.append((so_seq, skewed(rng, items), round(rng.uniform(5, 200), 1), 0.0))
+    cursor.execute('BEGIN')
+    cursor.executemany('INSERT INTO generated_pos (product_manager, item_name, po_number, qty_ordered, rate, unit, vendor_name, expected_date, quality_specifications, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['generated_pos'])
+    cursor.executemany('INSERT INTO purchases (item, vendor, po_number, qty_receive, unit_receive, pcs_receive, qty_accept, unit_accept, pcs_accept, qty_reject, unit_reject, pcs_reject, reason_for_rejection, date, time, ctrl_date, item_tag, payment_status, mode_of_payment, amount_paid, amount_due, rate, total_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['purchases'])
+    cursor.executemany('INSERT INTO stock_updates (item, a_grade_qty, a_grade_unit, pcs_a_grade, b_grade_qty, b_grade_unit, pcs_b_grade, c_grade_qty, c_grade_unit, pcs_c_grade, ungraded_qty, ungraded_unit, pcs_ungraded, dump_qty, dump_unit, pcs_dump, total_qty, date, time, po_number, a_grade_tags, b_grade_tags, c_grade_tags, ungraded_tags, dump_tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['stock_updates'])
+    for table in ('sales', 'b_grade_sales'):
+        cursor.executemany(f'INSERT INTO {table} (item, clint, quantity, unit, pcs, date, time, po_number, item_tag, payment_status, mode_of_payment, amount_paid, amount_due, rate, total_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows[table])
+    for table in ('dump_sales', 'mandi_resales'):
+        cursor.executemany(f'INSERT INTO {table} (item, quantity, unit, pcs, date, time, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?)', rows[table])
+    cursor.executemany('INSERT INTO rejection_received (client_name, item, quantity, unit, pcs, sample_quantity, reason, date, time, ctrl_date, po_number, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['rejection_received'])
+    # Revisions from before vendor returns were tagged have no vendor_rejections.item_tag
+    if 'item_tag' in {row[1] for row in cursor.execute('PRAGMA table_info(vendor_rejections)')}:
+        cursor.executemany('INSERT INTO vendor_rejections (item, vendor, po_number, quantity_sent, unit, pcs, date, time, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['vendor_rejections'])
+    else:
+        cursor.executemany('INSERT INTO vendor_rejections (item, vendor, po_number, quantity_sent, unit, pcs, date, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [row[:-1] for row in rows['vendor_rejections']])
+    cursor.executemany('INSERT INTO lmd_data (client_name, client_location, vehicle_number, driver_name, po_number, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['lmd_data'])
+    cursor.executemany('INSERT INTO fmd_data (vendor_name, vendor_location, vehicle_number, driver_name, po_number, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows['fmd_data'])
+    so_base = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM generated_sos').fetchone()[0]
+    cursor.executemany('INSERT INTO generated_sos (id, client_name, so_number, date_of_dispatch) VALUES (?, ?, ?, ?)', [(so_base + so_id, *rest) for so_id, *rest in rows['generated_sos']])
+    cursor.executemany('INSERT INTO so_items (so_id, item_name, quantity_kg, quantity_pcs) VALUES (?, ?, ?, ?)', [(so_base + so_id, *rest) for so_id, *rest in so_items])
+    # Instalments against a share of the part-paid purchases, sales and transport rows
+    for table in ('purchases', 'sales', 'b_grade_sales', 'lmd_data', 'fmd_data'):
+        for parent_id, day in cursor.execute(f"SELECT id, date FROM {table} WHERE payment_status = 'Partial Paid'").fetchall():
+            for _ in range(rng.randint(1, 3)):
+                payments.append((table, parent_id, round(rng.uniform(100, 5000), 2), rng.choice(PAYMENT_MODES), day, '15:00'))
+    cursor.executemany('INSERT INTO payment_history (parent_table_name, parent_id, amount_paid, mode_of_payment, payment_date, payment_time) VALUES (?, ?, ?, ?, ?, ?)', payments)
+    conn.commit()
+    counts = {table: len(table_rows) for table, table_rows in rows.items()}
+    counts['so_items'] = len(so_items)
+    counts['payment_history'] = len(payments)
+    conn.close()
+    return counts
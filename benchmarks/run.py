@@ -0,0 +1,197 @@
+# Drives the real flask_api routes through the Flask test client against a generated database
+# and reports p50/p95/p99 latency and rows/s per endpoint.
+#
+#   python -m benchmarks.run --years 2 --out bench.json
+#   python -m benchmarks.run --years 2 --compare bench.json
+#
+# The database is rebuilt from a fixed seed on every run, so results from different commits
+# measure the same data and the same requests.
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+from benchmarks.datagen import generate
+
+# (name, method, path, query args or JSON body); reads first, writes last so reads see the seeded data
+SCENARIOS = [
+    ('get_items', 'GET', '/get_items', {}),
+    ('get_purchase_vendors', 'GET', '/get_purchase_vendors', {}),
+    ('get_latest_purchases', 'GET', '/get_latest_purchases', {}),
+    ('get_all_purchases', 'GET', '/get_all_purchases', {}),
+    ('get_all_purchases_page', 'GET', '/get_all_purchases', {'limit': 100}),
+    ('get_all_sales_by_item', 'GET', '/get_all_sales', {'item': 'Papaya', 'limit': 100}),
+    ('get_all_stock_updates', 'GET', '/get_all_stock_updates', {}),
+    ('get_all_lmd_data', 'GET', '/get_all_lmd_data', {}),
+    ('get_filtered_fmd_data', 'GET', '/get_filtered_fmd_data', {'payment_status': 'Unpaid'}),
+    ('get_all_generated_pos', 'GET', '/get_all_generated_pos', {'po_number': '0001'}),
+    ('get_all_generated_sos_with_items', 'GET', '/get_all_generated_sos_with_items', {'limit': 50}),
+    ('get_available_pos_for_purchase', 'GET', '/get_available_pos_for_purchase', {}),
+    ('get_available_sos_for_sale', 'GET', '/get_available_sos_for_sale', {}),
+    ('get_payment_history', 'GET', '/get_payment_history', {'table_name': 'purchases', 'parent_id': 1}),
+    ('get_single_value', 'GET', '/get_single_value', {'table': 'sales', 'column': 'quantity', 'where': 'item = ? AND date = ?', 'where_args[0]': 'Papaya', 'where_args[1]': '2025-06-01'}),
+    ('get_po_number_by_tag', 'GET', '/get_po_number_by_tag', {'item_name': 'Papaya', 'tag': 'SI-01-0001'}),
+    ('get_next_item_tag_sequence', 'GET', '/get_next_item_tag_sequence', {'vendor_prefix': 'SI', 'day_part': '01'}),
+    ('get_available_tags_for_item', 'GET', '/get_available_tags_for_item', {'item_name': 'Papaya', 'with_balance': 1}),
+    ('trace_tag', 'GET', '/trace/SI-01-0001', {}),
+    ('inventory_reconcile_day', 'GET', '/inventory/reconcile', {'date': '2025-06-01'}),
+    ('inventory_reconcile_month', 'GET', '/inventory/reconcile', {'item': 'Papaya', 'start_date': '2025-06-01', 'end_date': '2025-06-30'}),
+    ('reports_rollup_monthly', 'GET', '/reports/rollup', {'period': 'month', 'source': 'sales', 'group_by': 'item'}),
+    ('batch_generate_po_page', 'POST', '/batch', [{'path': '/get_product_managers'}, {'path': '/get_items'}, {'path': '/get_purchase_vendors'}, {'path': '/get_last_po_number'}, {'path': '/get_all_po_numbers'}]),
+    ('insert_sale', 'POST', '/insert_sale', {'item': 'Papaya', 'clint': 'B2B', 'quantity': 10, 'unit': 'Kg', 'date': '2025-12-31', 'time': '12:00'}),
+    ('insert_purchase', 'POST', '/insert_purchase', {'item': 'Papaya', 'vendor': 'Siya ram', 'qty_receive': 50, 'qty_accept': 50, 'date': '2025-12-31', 'ctrl_date': '2025-12-31'}),
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def count_rows(response):
+    if response.mimetype == 'application/x-ndjson':
+        return response.get_data().count(b'\n')
+    body = response.get_json(silent=True)
+    return len(body) if isinstance(body, list) else 1
+
+
+def run_scenario(client, method, path, payload, iterations, warmup):
+    samples = []
+    rows = 0
+    for index in range(warmup + iterations):
+        started = time.perf_counter()
+        if method == 'GET':
+            response = client.get(path, query_string=payload)
+        else:
+            response = client.open(path, method=method, json=payload)
+        body_rows = count_rows(response)
+        elapsed = time.perf_counter() - started
+        if index == 0 and response.status_code in (404, 405):
+            # The route does not exist in this revision
+            return None
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+        if index >= warmup:
+            samples.append(elapsed)
+            rows += body_rows
+    total = sum(samples)
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'rows_per_request': rows // iterations,
+        'rows_per_s': round(rows / total, 1) if total else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def open_app(workdir, path):
+    # Revisions before the app factory run init_db() on ./mydata.db at import, so import from the scratch dir
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import flask_api
+    finally:
+        os.chdir(cwd)
+    if hasattr(flask_api, 'create_app'):
+        return flask_api, flask_api.create_app(path)
+    flask_api.db_path = path
+    if hasattr(flask_api, 'ConnectionPool'):
+        flask_api.db_pool.close_all()
+        flask_api.db_pool = flask_api.ConnectionPool(path)
+    flask_api.init_db()
+    return flask_api, flask_api.app
+
+
+def close_app(flask_api):
+    if hasattr(flask_api, 'writer'):
+        flask_api.writer.stop()
+    if hasattr(flask_api, 'close_db_pool'):
+        flask_api.close_db_pool()
+    elif hasattr(flask_api, 'db_pool'):
+        flask_api.db_pool.close_all()
+
+
+def run(years, scale, seed, iterations, warmup, only=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.db')
+        flask_api, app = open_app(workdir, path)
+        started = time.perf_counter()
+        counts = generate(path, years=years, scale=scale, seed=seed)
+        generate_s = time.perf_counter() - started
+        client = app.test_client()
+        results = {}
+        for name, method, route, payload in SCENARIOS:
+            if only and name not in only:
+                continue
+            result = run_scenario(client, method, route, payload, iterations, warmup)
+            if result is not None:
+                results[name] = result
+        close_app(flask_api)
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'params': {'years': years, 'scale': scale, 'seed': seed, 'iterations': iterations, 'warmup': warmup},
+        'generated_rows': counts,
+        'generate_s': round(generate_s, 2),
+        'results': results,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"revision {report['revision']}  python {report['python']}  sqlite {report['sqlite']}  params {report['params']}")
+    print(f"generated {sum(report['generated_rows'].values())} rows in {report['generate_s']}s")
+    header = f"{'endpoint':36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rows':>7} {'rows/s':>11}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for name, result in report['results'].items():
+        line = f"{name:36} {result['p50_ms']:9.3f} {result['p95_ms']:9.3f} {result['p99_ms']:9.3f} {result['rows_per_request']:7d} {result['rows_per_s']:11.1f}"
+        base = (baseline or {}).get('results', {}).get(name)
+        if base and base['p50_ms']:
+            line += f" {(result['p50_ms'] / base['p50_ms'] - 1) * 100:+11.1f}%"
+        print(line)
+    missing = sorted(set((baseline or {}).get('results', {})) - set(report['results']))
+    if missing:
+        print(f"not in this revision: {', '.join(missing)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark flask_api routes against synthetic warehouse data')
+    parser.add_argument('--years', type=float, default=1.0, help='years of history to generate')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier on the daily row volumes')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--out', help='write the report as JSON to this file')
+    parser.add_argument('--compare', help='JSON report from an earlier run to compare p50 against')
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['params'] != {'years': args.years, 'scale': args.scale, 'seed': args.seed, 'iterations': args.iterations, 'warmup': args.warmup}:
+            print(f"warning: baseline was run with different params {baseline['params']}")
+    report = run(args.years, args.scale, args.seed, args.iterations, args.warmup, args.only)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
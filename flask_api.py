@@ -1,17 +1,543 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_app_context, has_request_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import re
 import sqlite3
 import os
 import json
+import queue
+import atexit
+import hashlib
+import threading
+import gzip
+import time
+import logging
+from logging.handlers import WatchedFileHandler
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
+from datetime import datetime, timedelta
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Before-Id', 'ETag'])
+
+db_path = os.environ.get('WAREHOUSE_DB_PATH', 'mydata.db')
+
+# Connection pool settings; the pragmas run once per physical connection
+DB_POOL_SIZE = int(os.environ.get('WAREHOUSE_DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = 5000
+DB_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}',
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Sources summed per item/day by /inventory/reconcile: (key, table, column, date column)
+RECONCILE_SOURCES = [
+    ('purchase_received', 'purchases', 'qty_receive', 'ctrl_date'),
+    ('rejection_received', 'rejection_received', 'quantity', 'ctrl_date'),
+    ('vendor_rejection', 'vendor_rejections', 'quantity_sent', 'date'),
+    ('sales', 'sales', 'quantity', 'date'),
+    ('dump_sale', 'dump_sales', 'quantity', 'date'),
+    ('mandi_resale', 'mandi_resales', 'quantity', 'date'),
+    ('b_grade_sales', 'b_grade_sales', 'quantity', 'date'),
+]
+RECONCILE_INFLOW_KEYS = ('purchase_received', 'rejection_received')
+STOCK_TOTAL_EXPR = 'a_grade_qty + b_grade_qty + c_grade_qty + ungraded_qty + dump_qty'
+
+# stock_ledger sources: (table, date column, ledger column, quantity expression)
+LEDGER_SOURCES = [(table, date_column, 'inflow' if key in RECONCILE_INFLOW_KEYS else 'outflow', column) for key, table, column, date_column in RECONCILE_SOURCES]
+LEDGER_SOURCES.append(('stock_updates', 'date', 'closing', STOCK_TOTAL_EXPR))
+
+def _ledger_parts(item=None, day=None):
+    # One (inflow, outflow, closing) SELECT per source, narrowed to a single item and day when given
+    parts = []
+    for table, date_column, ledger_column, expr in LEDGER_SOURCES:
+        values = ', '.join(f'{f"COALESCE({expr}, 0)" if column == ledger_column else "0"} AS {column}' for column in ('inflow', 'outflow', 'closing'))
+        where = f'item = {item} AND {date_column} = {day}' if item else f'item IS NOT NULL AND {date_column} IS NOT NULL'
+        parts.append(f'SELECT item, {date_column} AS date, {values} FROM {table} WHERE {where}')
+    return parts
+
+def _stock_ledger_refresh(item, day):
+    # Recomputed from the (item, date) indexes rather than patched with deltas, so closing cannot drift;
+    # a day left with no entries is dropped, as the rebuild would leave it
+    totals = f'SELECT SUM(inflow) AS inflow, SUM(outflow) AS outflow, SUM(closing) AS closing, COUNT(*) AS entries FROM ({" UNION ALL ".join(_ledger_parts(item, day))})'
+    return f'DELETE FROM stock_ledger WHERE item = {item} AND date = {day}; INSERT INTO stock_ledger (item, date, inflow, outflow, closing) SELECT {item}, {day}, inflow, outflow, closing FROM ({totals}) WHERE entries > 0;'
+
+def stock_ledger_triggers():
+    # Triggers keep the ledger in step with every write path, including delete_multiple_entries
+    statements = []
+    for table, date_column, _, expr in LEDGER_SOURCES:
+        columns = ', '.join(['item', date_column, *(column.strip() for column in expr.split('+'))])
+        old, new = _stock_ledger_refresh('OLD.item', f'OLD.{date_column}'), _stock_ledger_refresh('NEW.item', f'NEW.{date_column}')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_ledger_insert AFTER INSERT ON {table} BEGIN {new} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_ledger_delete AFTER DELETE ON {table} BEGIN {old} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_ledger_update AFTER UPDATE OF {columns} ON {table} BEGIN {old} {new} END')
+    return statements
+
+def stock_ledger_rebuild():
+    return [
+        'DELETE FROM stock_ledger',
+        f'INSERT INTO stock_ledger (item, date, inflow, outflow, closing) SELECT item, date, SUM(inflow), SUM(outflow), SUM(closing) FROM ({" UNION ALL ".join(_ledger_parts())}) GROUP BY item, date',
+    ]
+
+# po_fulfilment: purchases received against each generated_pos line, matched on (po_number, item)
+PO_FULFILMENT_COLUMNS = [
+    ('qty_received', 'qty_receive'),
+    ('qty_accepted', 'qty_accept'),
+    ('qty_rejected', 'qty_reject'),
+    ('pcs_received', 'pcs_receive'),
+    ('pcs_accepted', 'pcs_accept'),
+    ('pcs_rejected', 'pcs_reject'),
+]
+# Lines ordered in pcs are measured by pieces received, everything else by quantity
+PO_RECEIVED = 'CASE WHEN {0}by_pcs = 1 THEN {0}pcs_received ELSE {0}qty_received END'
+# A line stays open until it has a receipt covering the ordered quantity; the partial index holds only open lines.
+# Spelt out with OR because SQLite will not match a partial index whose condition contains a CASE.
+PO_OPEN_CONDITION = '{0}receipts = 0 OR ({0}by_pcs = 1 AND {0}pcs_received < {0}qty_ordered) OR ({0}by_pcs = 0 AND {0}qty_received < {0}qty_ordered)'
+
+def _po_totals(po_number, item):
+    sums = ', '.join(f'COALESCE(SUM({column}), 0)' for _, column in PO_FULFILMENT_COLUMNS)
+    return f'SELECT {sums}, COUNT(*), MAX(date) FROM purchases WHERE po_number = {po_number} AND item = {item}'
+
+def _po_refresh(po_number, item):
+    columns = ', '.join(column for column, _ in PO_FULFILMENT_COLUMNS)
+    return f"""UPDATE po_fulfilment SET ({columns}, receipts, last_received_date) = ({_po_totals(po_number, item)}) WHERE po_id IN (SELECT id FROM generated_pos WHERE po_number = {po_number} AND item_name = {item});"""
+
+def po_fulfilment_schema():
+    return [
+        f'CREATE TABLE IF NOT EXISTS po_fulfilment (po_id INTEGER PRIMARY KEY, qty_ordered REAL NOT NULL DEFAULT 0, by_pcs INTEGER NOT NULL DEFAULT 0, {", ".join(f"{column} REAL NOT NULL DEFAULT 0" for column, _ in PO_FULFILMENT_COLUMNS)}, receipts INTEGER NOT NULL DEFAULT 0, last_received_date TEXT)',
+        f'CREATE INDEX IF NOT EXISTS idx_po_fulfilment_open ON po_fulfilment (po_id) WHERE {PO_OPEN_CONDITION.format("")}',
+    ]
+
+def po_fulfilment_triggers():
+    columns = ', '.join(column for column, _ in PO_FULFILMENT_COLUMNS)
+    add_line = f"""INSERT OR REPLACE INTO po_fulfilment (po_id, qty_ordered, by_pcs, {columns}, receipts, last_received_date) SELECT NEW.id, COALESCE(NEW.qty_ordered, 0), COALESCE(lower(NEW.unit) = 'pcs', 0), * FROM ({_po_totals('NEW.po_number', 'NEW.item_name')});"""
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS trg_generated_pos_fulfilment_insert AFTER INSERT ON generated_pos BEGIN {add_line} END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_generated_pos_fulfilment_update AFTER UPDATE ON generated_pos BEGIN {add_line} END',
+        'CREATE TRIGGER IF NOT EXISTS trg_generated_pos_fulfilment_delete AFTER DELETE ON generated_pos BEGIN DELETE FROM po_fulfilment WHERE po_id = OLD.id; END',
+        f"CREATE TRIGGER IF NOT EXISTS trg_purchases_fulfilment_insert AFTER INSERT ON purchases BEGIN {_po_refresh('NEW.po_number', 'NEW.item')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_purchases_fulfilment_delete AFTER DELETE ON purchases BEGIN {_po_refresh('OLD.po_number', 'OLD.item')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_purchases_fulfilment_update AFTER UPDATE ON purchases BEGIN {_po_refresh('OLD.po_number', 'OLD.item')} {_po_refresh('NEW.po_number', 'NEW.item')} END",
+    ]
+
+def po_fulfilment_rebuild():
+    columns = ', '.join(column for column, _ in PO_FULFILMENT_COLUMNS)
+    sums = ', '.join(f'COALESCE(SUM(p.{column}), 0)' for _, column in PO_FULFILMENT_COLUMNS)
+    return [
+        'DELETE FROM po_fulfilment',
+        f"INSERT INTO po_fulfilment (po_id, qty_ordered, by_pcs, {columns}, receipts, last_received_date) SELECT g.id, COALESCE(g.qty_ordered, 0), COALESCE(lower(g.unit) = 'pcs', 0), {sums}, COUNT(p.id), MAX(p.date) FROM generated_pos g LEFT JOIN purchases p ON p.po_number = g.po_number AND p.item = g.item_name GROUP BY g.id",
+    ]
+
+# so_fulfilment: sales against each so_items line, matched on the SO number (sales.po_number) and item
+# Only the dimensions a line was ordered in keep it open, so kg lines sold without a pcs count still close
+SO_OPEN_CONDITION = '{0}sales = 0 OR ({0}qty_kg > 0 AND {0}sold_kg < {0}qty_kg) OR ({0}qty_pcs > 0 AND {0}sold_pcs < {0}qty_pcs)'
+
+def _so_totals(so_number, item):
+    return f'SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(pcs), 0), COUNT(*) FROM sales WHERE po_number = {so_number} AND item = {item}'
+
+def _so_refresh(so_number, item):
+    return f"""UPDATE so_fulfilment SET (sold_kg, sold_pcs, sales) = ({_so_totals(so_number, item)}) WHERE item_id IN (SELECT i.id FROM generated_sos so JOIN so_items i ON i.so_id = so.id WHERE so.so_number = {so_number} AND i.item_name = {item});"""
+
+def so_fulfilment_triggers():
+    add_line = f"""INSERT OR REPLACE INTO so_fulfilment (item_id, so_id, qty_kg, qty_pcs, sold_kg, sold_pcs, sales) SELECT NEW.id, NEW.so_id, COALESCE(NEW.quantity_kg, 0), COALESCE(NEW.quantity_pcs, 0), * FROM ({_so_totals('(SELECT so_number FROM generated_sos WHERE id = NEW.so_id)', 'NEW.item_name')});"""
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS trg_so_items_fulfilment_insert AFTER INSERT ON so_items BEGIN {add_line} END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_so_items_fulfilment_update AFTER UPDATE ON so_items BEGIN {add_line} END',
+        'CREATE TRIGGER IF NOT EXISTS trg_so_items_fulfilment_delete AFTER DELETE ON so_items BEGIN DELETE FROM so_fulfilment WHERE item_id = OLD.id; END',
+        f"""CREATE TRIGGER IF NOT EXISTS trg_generated_sos_fulfilment_update AFTER UPDATE OF so_number ON generated_sos BEGIN UPDATE so_fulfilment SET (sold_kg, sold_pcs, sales) = (SELECT COALESCE(SUM(s.quantity), 0), COALESCE(SUM(s.pcs), 0), COUNT(s.id) FROM so_items i LEFT JOIN sales s ON s.po_number = NEW.so_number AND s.item = i.item_name WHERE i.id = so_fulfilment.item_id) WHERE so_id = NEW.id; END""",
+        'CREATE TRIGGER IF NOT EXISTS trg_generated_sos_fulfilment_delete AFTER DELETE ON generated_sos BEGIN DELETE FROM so_fulfilment WHERE so_id = OLD.id; END',
+        f"CREATE TRIGGER IF NOT EXISTS trg_sales_fulfilment_insert AFTER INSERT ON sales BEGIN {_so_refresh('NEW.po_number', 'NEW.item')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_sales_fulfilment_delete AFTER DELETE ON sales BEGIN {_so_refresh('OLD.po_number', 'OLD.item')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_sales_fulfilment_update AFTER UPDATE ON sales BEGIN {_so_refresh('OLD.po_number', 'OLD.item')} {_so_refresh('NEW.po_number', 'NEW.item')} END",
+    ]
+
+def so_fulfilment_rebuild():
+    return [
+        'DELETE FROM so_fulfilment',
+        'INSERT INTO so_fulfilment (item_id, so_id, qty_kg, qty_pcs, sold_kg, sold_pcs, sales) SELECT i.id, i.so_id, COALESCE(i.quantity_kg, 0), COALESCE(i.quantity_pcs, 0), COALESCE(SUM(s.quantity), 0), COALESCE(SUM(s.pcs), 0), COUNT(s.id) FROM so_items i JOIN generated_sos so ON so.id = i.so_id LEFT JOIN sales s ON s.po_number = so.so_number AND s.item = i.item_name GROUP BY i.id',
+    ]
+
+# Item tags look like VE-07-0012 (vendor prefix, day of month, sequence); tag_sequences holds the next sequence
+def _tag_parts(tag):
+    rest = f"substr({tag}, instr({tag}, '-') + 1)"
+    return f"substr({tag}, 1, instr({tag}, '-') - 1)", f"substr({rest}, 1, instr({rest}, '-') - 1)", f"substr({rest}, instr({rest}, '-') + 1)"
+
+def _tag_is_sequenced(tag):
+    _, day_part, sequence = _tag_parts(tag)
+    return f"{tag} LIKE '%_-%_-%_' AND {day_part} <> '' AND {sequence} NOT GLOB '*[^0-9]*'"
+
+def tag_sequence_triggers():
+    # Tags typed by hand or issued before the counter existed still move it past themselves
+    prefix, day_part, sequence = _tag_parts('NEW.item_tag')
+    bump = f"INSERT INTO tag_sequences (vendor_prefix, day_part, next_value) VALUES ({prefix}, {day_part}, CAST({sequence} AS INTEGER) + 1) ON CONFLICT (vendor_prefix, day_part) DO UPDATE SET next_value = MAX(next_value, excluded.next_value);"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_purchases_tag_sequence_insert AFTER INSERT ON purchases WHEN {_tag_is_sequenced('NEW.item_tag')} BEGIN {bump} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_purchases_tag_sequence_update AFTER UPDATE OF item_tag ON purchases WHEN {_tag_is_sequenced('NEW.item_tag')} BEGIN {bump} END",
+    ]
 
-db_path = 'mydata.db'
+def tag_sequence_rebuild():
+    prefix, day_part, sequence = _tag_parts('item_tag')
+    return [
+        'DELETE FROM tag_sequences',
+        f'INSERT INTO tag_sequences (vendor_prefix, day_part, next_value) SELECT {prefix}, {day_part}, MAX(CAST({sequence} AS INTEGER)) + 1 FROM purchases WHERE {_tag_is_sequenced("item_tag")} GROUP BY 1, 2',
+    ]
+
+# Tables carrying payment state: (table, party type, party column, document total column)
+PAYMENT_SOURCES = [
+    ('purchases', 'vendor', 'vendor', 'total_value'),
+    ('sales', 'client', 'clint', 'total_value'),
+    ('b_grade_sales', 'client', 'clint', 'total_value'),
+    ('lmd_data', 'transporter', 'vehicle_number', 'total_amount'),
+    ('fmd_data', 'transporter', 'vehicle_number', 'total_amount'),
+]
+PAYMENT_PARTY_TYPES = ['vendor', 'client', 'transporter']
+# Rows that still owe something; the partial indexes hold only these, so aging cost follows the open balance
+UNPAID_CONDITION = "payment_status IS NOT 'Paid'"
+
+# rollups: day/week/month totals per source table, item and party, kept current by triggers.
+# Each source is (table, item column, party column, kg, pcs, value, rejected, freight); None means not tracked.
+ROLLUP_SOURCES = [
+    ('purchases', 'item', 'vendor', 'qty_receive', 'pcs_receive', 'total_value', 'qty_reject', None),
+    ('sales', 'item', 'clint', 'quantity', 'pcs', 'total_value', None, None),
+    ('b_grade_sales', 'item', 'clint', 'quantity', 'pcs', 'total_value', None, None),
+    ('rejection_received', 'item', 'client_name', None, 'pcs', None, 'quantity', None),
+    ('vendor_rejections', 'item', 'vendor', None, 'pcs', None, 'quantity_sent', None),
+    ('dump_sales', 'item', None, 'quantity', 'pcs', None, None, None),
+    ('mandi_resales', 'item', None, 'quantity', 'pcs', None, None, None),
+    ('lmd_data', None, 'client_name', None, None, None, None, 'total_amount'),
+    ('fmd_data', None, 'vendor_name', None, None, None, None, 'total_amount'),
+]
+ROLLUP_MEASURES = ['kg', 'pcs', 'value', 'rejected', 'freight']
+# Weeks start on Monday
+ROLLUP_PERIODS = {
+    'day': 'date({0})',
+    'week': "date({0}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m-01', {0})",
+}
+
+def _rollup_values(source, alias):
+    table, item, party, *measures = source
+    keys = [f"COALESCE({alias}.{column}, '')" if column else "''" for column in (item, party)]
+    return keys, [f'COALESCE({alias}.{column}, 0)' if column else '0' for column in measures]
+
+def rollup_triggers():
+    statements = []
+    measures = ', '.join(ROLLUP_MEASURES)
+    for source in ROLLUP_SOURCES:
+        table = source[0]
+        add = []
+        subtract = []
+        for period, start in ROLLUP_PERIODS.items():
+            (item, party), values = _rollup_values(source, 'NEW')
+            period_start = start.format('NEW.date')
+            updates = ', '.join(f'{measure} = {measure} + excluded.{measure}' for measure in ROLLUP_MEASURES)
+            add.append(f"INSERT INTO rollups (period, period_start, source, item, party, {measures}, entries) SELECT '{period}', {period_start}, '{table}', {item}, {party}, {', '.join(values)}, 1 WHERE {period_start} IS NOT NULL ON CONFLICT (period, period_start, source, item, party) DO UPDATE SET {updates}, entries = entries + 1;")
+            (item, party), values = _rollup_values(source, 'OLD')
+            match = f"period = '{period}' AND period_start = {start.format('OLD.date')} AND source = '{table}' AND item = {item} AND party = {party}"
+            updates = ', '.join(f'{measure} = {measure} - {value}' for measure, value in zip(ROLLUP_MEASURES, values))
+            subtract.append(f'UPDATE rollups SET {updates}, entries = entries - 1 WHERE {match}; DELETE FROM rollups WHERE {match} AND entries <= 0;')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_insert AFTER INSERT ON {table} BEGIN {" ".join(add)} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_delete AFTER DELETE ON {table} BEGIN {" ".join(subtract)} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_update AFTER UPDATE ON {table} BEGIN {" ".join(subtract)} {" ".join(add)} END')
+    return statements
+
+def rollup_rebuild():
+    statements = ['DELETE FROM rollups']
+    for source in ROLLUP_SOURCES:
+        table = source[0]
+        (item, party), values = _rollup_values(source, table)
+        sums = ', '.join(f'SUM({value})' for value in values)
+        for period, start in ROLLUP_PERIODS.items():
+            period_start = start.format(f'{table}.date')
+            statements.append(f"INSERT INTO rollups (period, period_start, source, item, party, {', '.join(ROLLUP_MEASURES)}, entries) SELECT '{period}', {period_start}, '{table}', {item}, {party}, {sums}, COUNT(*) FROM {table} WHERE {period_start} IS NOT NULL GROUP BY 2, 4, 5")
+    return statements
+
+# stock_update_tags: one row per crate tag listed in the JSON *_tags columns of stock_updates
+STOCK_TAG_GRADES = [('a', 'a_grade_tags'), ('b', 'b_grade_tags'), ('c', 'c_grade_tags'), ('ungraded', 'ungraded_tags'), ('dump', 'dump_tags')]
+# Tables that record the crate tag a movement came from, traced by /trace/<tag>
+TAGGED_TABLES = ['purchases', 'rejection_received', 'sales', 'b_grade_sales', 'dump_sales', 'mandi_resales']
+
+def _stock_tag_rows(alias, from_tables=''):
+    # Entries are {"tag", "po", "qty", "pcs"} objects from the stock update screen; bare strings and bad JSON are tolerated
+    entry = "CASE WHEN json_each.type = 'object' THEN json_each.value END"
+    tag = f"TRIM(CASE WHEN json_each.type = 'object' THEN json_extract(json_each.value, '$.tag') ELSE json_each.value END)"
+    parts = []
+    for grade, column in STOCK_TAG_GRADES:
+        source = f"json_each(CASE WHEN json_valid({alias}.{column}) THEN {alias}.{column} ELSE '[]' END)"
+        parts.append(f"SELECT {alias}.id, '{grade}', {tag}, json_extract({entry}, '$.po'), CAST(json_extract({entry}, '$.qty') AS REAL), CAST(json_extract({entry}, '$.pcs') AS REAL) FROM {from_tables}{source} WHERE {tag} <> ''")
+    return parts
+
+def stock_tag_triggers():
+    add = ' '.join(f'INSERT INTO stock_update_tags (stock_update_id, grade, tag, po_number, qty, pcs) {part};' for part in _stock_tag_rows('NEW'))
+    remove = 'DELETE FROM stock_update_tags WHERE stock_update_id = OLD.id;'
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS trg_stock_updates_tags_insert AFTER INSERT ON stock_updates BEGIN {add} END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_stock_updates_tags_delete AFTER DELETE ON stock_updates BEGIN {remove} END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_stock_updates_tags_update AFTER UPDATE OF {", ".join(column for _, column in STOCK_TAG_GRADES)} ON stock_updates BEGIN {remove} {add} END',
+    ]
+
+def stock_tag_rebuild():
+    return ['DELETE FROM stock_update_tags', *(f'INSERT INTO stock_update_tags (stock_update_id, grade, tag, po_number, qty, pcs) {part}' for part in _stock_tag_rows('stock_updates', 'stock_updates, '))]
+
+# tag_balances: accepted quantity per (item, crate tag) against everything dispatched from that tag
+TAG_INFLOW = ('purchases', 'COALESCE(qty_accept, qty_receive, 0)')
+TAG_OUTFLOWS = [
+    ('sales', 'quantity'),
+    ('b_grade_sales', 'quantity'),
+    ('dump_sales', 'quantity'),
+    ('mandi_resales', 'quantity'),
+    ('vendor_rejections', 'quantity_sent'),
+]
+TAG_OPEN_CONDITION = 'received > dispatched'
+
+def _tag_balance_refresh(item, tag):
+    # Recomputed from the item_tag indexes rather than patched with deltas, so balances cannot drift
+    table, expr = TAG_INFLOW
+    dispatched = ' + '.join(f'(SELECT COALESCE(SUM({column}), 0) FROM {outflow} WHERE item_tag = {tag} AND item = {item})' for outflow, column in TAG_OUTFLOWS)
+    totals = f'SELECT COALESCE(SUM({expr}), 0), {dispatched}, MIN(date) FROM {table} WHERE item_tag = {tag} AND item = {item}'
+    return f"""INSERT INTO tag_balances (item, tag, received, dispatched, first_date) SELECT {item}, {tag}, * FROM ({totals}) WHERE {item} IS NOT NULL AND {tag} <> '' ON CONFLICT (item, tag) DO UPDATE SET received = excluded.received, dispatched = excluded.dispatched, first_date = excluded.first_date;"""
+
+def tag_balance_triggers():
+    statements = []
+    for table in [TAG_INFLOW[0], *(outflow for outflow, _ in TAG_OUTFLOWS)]:
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_tag_balance_insert AFTER INSERT ON {table} WHEN NEW.item_tag <> '' BEGIN {_tag_balance_refresh('NEW.item', 'NEW.item_tag')} END")
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_tag_balance_delete AFTER DELETE ON {table} WHEN OLD.item_tag <> '' BEGIN {_tag_balance_refresh('OLD.item', 'OLD.item_tag')} END")
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_tag_balance_update AFTER UPDATE ON {table} BEGIN {_tag_balance_refresh('OLD.item', 'OLD.item_tag')} {_tag_balance_refresh('NEW.item', 'NEW.item_tag')} END")
+    return statements
+
+def tag_balance_rebuild():
+    table, expr = TAG_INFLOW
+    movements = [f"SELECT item, item_tag, {expr} AS received, 0 AS dispatched, date FROM {table}"]
+    movements.extend(f"SELECT item, item_tag, 0, COALESCE({column}, 0), NULL FROM {outflow}" for outflow, column in TAG_OUTFLOWS)
+    return [
+        'DELETE FROM tag_balances',
+        f"INSERT INTO tag_balances (item, tag, received, dispatched, first_date) SELECT item, item_tag, SUM(received), SUM(dispatched), MIN(date) FROM ({' UNION ALL '.join(movements)}) WHERE item IS NOT NULL AND item_tag <> '' GROUP BY item, item_tag",
+    ]
+
+# Type-ahead search: distinct names and PO/SO numbers in search_terms, with a trigram FTS5 index over them
+SEARCH_SOURCES = [
+    ('item', 'items', 'name'),
+    ('vendor', 'vendors', 'name'),
+    ('purchase_vendor', 'purchase_vendors', 'name'),
+    ('b_grade_client', 'b_grade_clients', 'name'),
+    ('po_number', 'generated_pos', 'po_number'),
+    ('so_number', 'generated_sos', 'so_number'),
+]
+
+def search_triggers():
+    statements = [
+        'CREATE TRIGGER IF NOT EXISTS trg_search_terms_insert AFTER INSERT ON search_terms BEGIN INSERT INTO search_fts (rowid, term) VALUES (NEW.id, NEW.term); END',
+        "CREATE TRIGGER IF NOT EXISTS trg_search_terms_delete AFTER DELETE ON search_terms BEGIN INSERT INTO search_fts (search_fts, rowid, term) VALUES ('delete', OLD.id, OLD.term); END",
+    ]
+    for kind, table, column in SEARCH_SOURCES:
+        # refs counts the source rows sharing a term, since one PO number spans several generated_pos lines
+        add = f"INSERT INTO search_terms (kind, term, refs) SELECT '{kind}', NEW.{column}, 1 WHERE NEW.{column} <> '' ON CONFLICT (kind, term) DO UPDATE SET refs = refs + 1;"
+        remove = f"UPDATE search_terms SET refs = refs - 1 WHERE kind = '{kind}' AND term = OLD.{column}; DELETE FROM search_terms WHERE kind = '{kind}' AND term = OLD.{column} AND refs <= 0;"
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table} BEGIN {add} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table} BEGIN {remove} END')
+        statements.append(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE OF {column} ON {table} BEGIN {remove} {add} END')
+    return statements
+
+def search_rebuild():
+    statements = ['DELETE FROM search_terms']
+    for kind, table, column in SEARCH_SOURCES:
+        statements.append(f"INSERT INTO search_terms (kind, term, refs) SELECT '{kind}', {column}, COUNT(*) FROM {table} WHERE {column} <> '' GROUP BY {column}")
+    return statements
+
+# Tables whose writes bump table_versions; the counters back the ETags of the GET routes
+VERSIONED_TABLES = ['product_managers', 'generated_sos', 'so_items', 'generated_pos', 'lmd_data', 'fmd_data', 'payment_history', 'purchases', 'stock_updates', 'b_grade_sales', 'sales', 'sales_waitlist', 'rejection_received', 'vendor_rejections', 'dump_sales', 'mandi_resales', 'items', 'vendors', 'purchase_vendors', 'b_grade_clients']
+
+def table_version_triggers():
+    statements = []
+    for table in VERSIONED_TABLES:
+        statements.append(f"INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('{table}', 0)")
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            statements.append(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{operation.lower()} AFTER {operation} ON {table} BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}'; END")
+    return statements
+
+def change_log_triggers():
+    # One row per mutated row; the change_log rowid is the global, monotonically increasing change version
+    statements = []
+    for table in VERSIONED_TABLES:
+        for operation, alias in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            statements.append(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_change_{operation.lower()} AFTER {operation} ON {table} BEGIN INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {alias}.id, '{operation.lower()}'); END")
+    return statements
+
+def drop_triggers(statements):
+    # DROP statements for the triggers a *_triggers() helper creates, so a migration can redefine them
+    names = [re.match(r'CREATE TRIGGER IF NOT EXISTS (\w+)', statement) for statement in statements]
+    return [f'DROP TRIGGER IF EXISTS {name.group(1)}' for name in names if name]
+
+# Versioned schema migrations, applied in order by init_db() and tracked in PRAGMA user_version
+MIGRATIONS = [
+    (1, [
+        'CREATE INDEX IF NOT EXISTS idx_purchases_item_tag ON purchases (item, item_tag)',
+        'CREATE INDEX IF NOT EXISTS idx_purchases_item_ctrl_date ON purchases (item, ctrl_date)',
+        'CREATE INDEX IF NOT EXISTS idx_purchases_po_item ON purchases (po_number, item)',
+        'CREATE INDEX IF NOT EXISTS idx_rejection_received_item_ctrl_date ON rejection_received (item, ctrl_date)',
+        'CREATE INDEX IF NOT EXISTS idx_vendor_rejections_item_date ON vendor_rejections (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_item_date ON sales (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_po_number ON sales (po_number)',
+        'CREATE INDEX IF NOT EXISTS idx_dump_sales_item_date ON dump_sales (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_mandi_resales_item_date ON mandi_resales (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_b_grade_sales_item_date ON b_grade_sales (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_updates_item_date ON stock_updates (item, date)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_history_parent ON payment_history (parent_table_name, parent_id)',
+        'CREATE INDEX IF NOT EXISTS idx_so_items_so_id ON so_items (so_id)',
+        'CREATE INDEX IF NOT EXISTS idx_lmd_data_date ON lmd_data (date)',
+        'CREATE INDEX IF NOT EXISTS idx_fmd_data_date ON fmd_data (date)',
+        'CREATE INDEX IF NOT EXISTS idx_generated_pos_po_item ON generated_pos (po_number, item_name)',
+    ]),
+    # Per-item daily stock: inflow/outflow from the movement tables, closing from the day's stock count
+    (2, [
+        'CREATE TABLE IF NOT EXISTS stock_ledger (item TEXT NOT NULL, date TEXT NOT NULL, inflow REAL NOT NULL DEFAULT 0, outflow REAL NOT NULL DEFAULT 0, closing REAL NOT NULL DEFAULT 0, PRIMARY KEY (item, date)) WITHOUT ROWID',
+        *stock_ledger_triggers(),
+        *stock_ledger_rebuild(),
+    ]),
+    # Per-table change counters, bumped by triggers so every worker process sees the same versions
+    (3, [
+        'CREATE TABLE IF NOT EXISTS table_versions (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID',
+        *table_version_triggers(),
+    ]),
+    # Ordered vs received/accepted/rejected per PO line, so open POs come from an index instead of a diff
+    (4, [
+        *po_fulfilment_schema(),
+        'CREATE INDEX IF NOT EXISTS idx_generated_pos_vendor ON generated_pos (vendor_name, expected_date)',
+        *po_fulfilment_triggers(),
+        *po_fulfilment_rebuild(),
+    ]),
+    # Ordered vs sold kg/pcs per SO line; an SO is open while any of its lines is
+    (5, [
+        'CREATE TABLE IF NOT EXISTS so_fulfilment (item_id INTEGER PRIMARY KEY, so_id INTEGER NOT NULL, qty_kg REAL NOT NULL DEFAULT 0, qty_pcs REAL NOT NULL DEFAULT 0, sold_kg REAL NOT NULL DEFAULT 0, sold_pcs REAL NOT NULL DEFAULT 0, sales INTEGER NOT NULL DEFAULT 0)',
+        f'CREATE INDEX IF NOT EXISTS idx_so_fulfilment_open ON so_fulfilment (so_id) WHERE {SO_OPEN_CONDITION.format("")}',
+        'CREATE INDEX IF NOT EXISTS idx_generated_sos_so_number ON generated_sos (so_number)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_po_item ON sales (po_number, item)',
+        *so_fulfilment_triggers(),
+        *so_fulfilment_rebuild(),
+    ]),
+    # Per vendor/day tag counters, so tags are allocated in constant time and never handed out twice
+    (6, [
+        'CREATE TABLE IF NOT EXISTS tag_sequences (vendor_prefix TEXT NOT NULL, day_part TEXT NOT NULL, next_value INTEGER NOT NULL, PRIMARY KEY (vendor_prefix, day_part)) WITHOUT ROWID',
+        *tag_sequence_triggers(),
+        *tag_sequence_rebuild(),
+    ]),
+    # Server-side type-ahead over master data and PO/SO numbers
+    (7, [
+        'CREATE TABLE IF NOT EXISTS search_terms (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, term TEXT NOT NULL, refs INTEGER NOT NULL DEFAULT 1, UNIQUE (kind, term))',
+        'CREATE INDEX IF NOT EXISTS idx_search_terms_prefix ON search_terms (term COLLATE NOCASE)',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(term, content='search_terms', content_rowid='id', tokenize='trigram')",
+        *search_triggers(),
+        *search_rebuild(),
+    ]),
+    # Unpaid documents per party, for the aging report
+    (8, [f'CREATE INDEX IF NOT EXISTS idx_{table}_unpaid ON {table} ({party_column}, date) WHERE {UNPAID_CONDITION}' for table, _, party_column, _ in PAYMENT_SOURCES]),
+    # Period totals, so trend reports read a few rows per period instead of the raw history
+    (9, [
+        f'CREATE TABLE IF NOT EXISTS rollups (period TEXT NOT NULL, period_start TEXT NOT NULL, source TEXT NOT NULL, item TEXT NOT NULL, party TEXT NOT NULL, {", ".join(f"{measure} REAL NOT NULL DEFAULT 0" for measure in ROLLUP_MEASURES)}, entries INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (period, period_start, source, item, party)) WITHOUT ROWID',
+        *rollup_triggers(),
+        *rollup_rebuild(),
+    ]),
+    # Normalised crate tags from grading, plus tag indexes on every table a lot moves through
+    (10, [
+        'CREATE TABLE IF NOT EXISTS stock_update_tags (id INTEGER PRIMARY KEY, stock_update_id INTEGER NOT NULL, grade TEXT NOT NULL, tag TEXT NOT NULL, po_number TEXT, qty REAL, pcs REAL)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_update_tags_tag ON stock_update_tags (tag)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_update_tags_stock_update ON stock_update_tags (stock_update_id)',
+        *(f'CREATE INDEX IF NOT EXISTS idx_{table}_tag ON {table} (item_tag)' for table in TAGGED_TABLES),
+        'CREATE INDEX IF NOT EXISTS idx_vendor_rejections_po_item ON vendor_rejections (po_number, item)',
+        *stock_tag_triggers(),
+        *stock_tag_rebuild(),
+    ]),
+    # Remaining quantity per crate tag; vendor returns gain an optional item_tag so they can count against a lot
+    (11, [
+        'ALTER TABLE vendor_rejections ADD COLUMN item_tag TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_vendor_rejections_tag ON vendor_rejections (item_tag)',
+        'CREATE TABLE IF NOT EXISTS tag_balances (item TEXT NOT NULL, tag TEXT NOT NULL, received REAL NOT NULL DEFAULT 0, dispatched REAL NOT NULL DEFAULT 0, first_date TEXT, PRIMARY KEY (item, tag)) WITHOUT ROWID',
+        f'CREATE INDEX IF NOT EXISTS idx_tag_balances_open ON tag_balances (item, first_date) WHERE {TAG_OPEN_CONDITION}',
+        *tag_balance_triggers(),
+        *tag_balance_rebuild(),
+    ]),
+    # Row-level change feed behind /events
+    (12, [
+        "CREATE TABLE IF NOT EXISTS change_log (version INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, row_id INTEGER NOT NULL, op TEXT NOT NULL, changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')))",
+        *change_log_triggers(),
+    ]),
+    # so_items declares ON DELETE CASCADE but foreign_keys is off, so enforce it here and let the child deletes reach change_log
+    (13, [
+        'CREATE TRIGGER IF NOT EXISTS trg_generated_sos_cascade_so_items AFTER DELETE ON generated_sos BEGIN DELETE FROM so_items WHERE so_id = OLD.id; END',
+        'CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at)',
+    ]),
+    # Vendors were re-inserted with REPLACE, whose implicit delete skips triggers and left search_terms.refs inflated
+    (14, search_rebuild()),
+    # The same REPLACE minted new vendor ids without logging the old ones as deleted; tombstone every logged row that is gone
+    (15, [f"INSERT INTO change_log (table_name, row_id, op) SELECT '{table}', row_id, 'delete' FROM (SELECT row_id, op, MAX(version) FROM change_log WHERE table_name = '{table}' GROUP BY row_id) WHERE op <> 'delete' AND row_id NOT IN (SELECT id FROM {table})" for table in VERSIONED_TABLES]),
+    # po_fulfilment gains by_pcs, so lines ordered in pcs are measured by pieces received
+    (16, [
+        *drop_triggers(po_fulfilment_triggers()),
+        'DROP TABLE IF EXISTS po_fulfilment',
+        *po_fulfilment_schema(),
+        *po_fulfilment_triggers(),
+        *po_fulfilment_rebuild(),
+    ]),
+    # so_fulfilment lines only stay open on the dimensions they were ordered in
+    (17, [
+        'DROP INDEX IF EXISTS idx_so_fulfilment_open',
+        f'CREATE INDEX IF NOT EXISTS idx_so_fulfilment_open ON so_fulfilment (so_id) WHERE {SO_OPEN_CONDITION.format("")}',
+    ]),
+    # stock_ledger rows are recomputed per (item, date) instead of adjusted by deltas, and emptied days are dropped
+    (18, [
+        *drop_triggers(stock_ledger_triggers()),
+        *stock_ledger_triggers(),
+        *stock_ledger_rebuild(),
+    ]),
+]
+
+def apply_migrations(cursor):
+    current = cursor.execute('PRAGMA user_version').fetchone()[0]
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(f'PRAGMA user_version = {version}')
+
+# Hot queries from the routes, used by check_query_plans() to confirm each one hits an index
+HOT_QUERIES = [
+    ('get_po_number_by_tag', 'SELECT po_number FROM purchases WHERE item = ? AND item_tag = ? ORDER BY id DESC LIMIT 1', ('x', 'x')),
+    ('purchases by ctrl_date', 'SELECT SUM(qty_receive) FROM purchases WHERE item = ? AND ctrl_date = ?', ('x', 'x')),
+    ('rejection_received by ctrl_date', 'SELECT SUM(quantity) FROM rejection_received WHERE item = ? AND ctrl_date = ?', ('x', 'x')),
+    ('vendor_rejections by date', 'SELECT SUM(quantity_sent) FROM vendor_rejections WHERE item = ? AND date = ?', ('x', 'x')),
+    ('sales by date', 'SELECT SUM(quantity) FROM sales WHERE item = ? AND date = ?', ('x', 'x')),
+    ('dump_sales by date', 'SELECT SUM(quantity) FROM dump_sales WHERE item = ? AND date = ?', ('x', 'x')),
+    ('mandi_resales by date', 'SELECT SUM(quantity) FROM mandi_resales WHERE item = ? AND date = ?', ('x', 'x')),
+    ('b_grade_sales by date', 'SELECT SUM(quantity) FROM b_grade_sales WHERE item = ? AND date = ?', ('x', 'x')),
+    ('get_stock_update_total_for_date', 'SELECT SUM(a_grade_qty + b_grade_qty + c_grade_qty + ungraded_qty + dump_qty) FROM stock_updates WHERE item = ? AND date = ?', ('x', 'x')),
+    ('get_payment_history', 'SELECT * FROM payment_history WHERE parent_table_name = ? AND parent_id = ? ORDER BY payment_date DESC, payment_time DESC', ('x', 1)),
+    ('so_items join', 'SELECT item.id FROM generated_sos so JOIN so_items item ON so.id = item.so_id WHERE so.id = ?', (1,)),
+]
+
+def check_query_plans(cursor):
+    report = []
+    for name, query, params in HOT_QUERIES:
+        plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()]
+        # A plain SCAN of a table means the filter columns are not indexed
+        uses_index = not any(step.startswith('SCAN') and 'USING' not in step for step in plan)
+        report.append({'query': name, 'plan': plan, 'uses_index': uses_index})
+    return report
 
 def init_db():
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, timeout=30)
     cursor = conn.cursor()
+    # WAL lets readers keep going while a writer commits; the mode is stored in the db file
+    cursor.execute('PRAGMA journal_mode = WAL')
+    # Hold the write lock for the whole setup so workers starting together run it one at a time
+    cursor.execute('BEGIN IMMEDIATE')
     # Create all tables as per _createAllTables
     cursor.execute('''CREATE TABLE IF NOT EXISTS product_managers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE)''')
     cursor.execute('''CREATE TABLE IF NOT EXISTS generated_sos (id INTEGER PRIMARY KEY AUTOINCREMENT, client_name TEXT, so_number TEXT, date_of_dispatch TEXT)''')
@@ -77,29 +603,1103 @@ def init_db():
         ("ZOMATO RAJPURA", "Near Hashampur, Punjab 140417", 256),
     ]
     for client_name, location, km in new_clients:
-        cursor.execute('INSERT OR REPLACE INTO vendors (name, location, km) VALUES (?, ?, ?)', (client_name, location, km))
+        cursor.execute('INSERT INTO vendors (name, location, km) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET location = excluded.location, km = excluded.km WHERE location IS NOT excluded.location OR km IS NOT excluded.km', (client_name, location, km))
         cursor.execute('INSERT OR IGNORE INTO b_grade_clients (name) VALUES (?)', (client_name,))
 
+    apply_migrations(cursor)
     conn.commit()
     conn.close()
 
+# Prometheus-style metrics, kept per process and rendered by /metrics. Collection is off until the
+# first scrape (or WAREHOUSE_METRICS=1), so an unscraped server only pays a flag check per call.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'http_requests_total': ('counter', 'Requests by endpoint, method and status'),
+    'http_request_bytes_total': ('counter', 'Request body bytes by endpoint'),
+    'http_response_bytes_total': ('counter', 'Response body bytes sent by endpoint, after compression'),
+    'sqlite_statement_duration_seconds': ('histogram', 'SQLite statement execution time by endpoint and statement kind'),
+    'sqlite_rows_fetched_total': ('counter', 'Rows fetched from SQLite by endpoint'),
+    'sqlite_lock_wait_seconds': ('histogram', 'Time the writer waited for the SQLite write lock (BEGIN IMMEDIATE)'),
+    'sqlite_write_queue_wait_seconds': ('histogram', 'Time a write waited in the writer queue before running'),
+    'sqlite_write_batch_size': ('histogram', 'Jobs committed per writer transaction'),
+}
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class Metrics:
+    def __init__(self):
+        self.enabled = os.environ.get('WAREHOUSE_METRICS') == '1'
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[1][index] += 1
+                    break
+            entry[2] += value
+            entry[3] += 1
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        with self._lock:
+            histograms = {key: (entry[0], list(entry[1]), entry[2], entry[3]) for key, entry in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_label_text(labels)} {value}')
+            for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{_label_text(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_label_text(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_label_text(labels)} {total}')
+                lines.append(f'{name}_count{_label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"' for key, value in labels) + '}'
+
+metrics = Metrics()
+_trace = threading.local()
+
+def trace_endpoint():
+    # Writes run on the writer thread, which records the endpoint of the job it is running
+    endpoint = getattr(_trace, 'endpoint', None)
+    if endpoint is None and has_request_context():
+        endpoint = request.endpoint
+    return endpoint or 'none'
+
+# Statements slower than the threshold are written with their parameters and query plan to a
+# log file, and summarised per SQL text for /admin/slow_queries. A threshold of 0 turns it off.
+SLOW_QUERY_MS = float(os.environ.get('WAREHOUSE_SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG = os.environ.get('WAREHOUSE_SLOW_QUERY_LOG', 'slow_queries.log')
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, path):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self._lock = threading.Lock()
+        self._logger = None
+        self._summary = {}
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def _get_logger(self):
+        # Created on first use so servers that never see a slow statement leave no file behind
+        if self._logger is None:
+            logger = logging.getLogger('warehouse.slow_queries')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            # Every gunicorn worker appends to the same file, so rotation is left to logrotate; the
+            # handler reopens the path once the file has been moved away
+            handler = WatchedFileHandler(self.path)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def check(self, conn, sql, params, seconds, executions=1):
+        duration_ms = seconds * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        plan = explain_plan(conn, sql, params)
+        endpoint = trace_endpoint()
+        entry = {'time': datetime.now().isoformat(timespec='milliseconds'), 'endpoint': endpoint, 'duration_ms': round(duration_ms, 3), 'sql': ' '.join(sql.split()), 'params': params, 'plan': plan}
+        if executions > 1:
+            entry['executions'] = executions
+        with self._lock:
+            self._get_logger().info(json.dumps(entry, default=str))
+            stats = self._summary.get(entry['sql'])
+            if stats is None:
+                stats = self._summary[entry['sql']] = {'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': set()}
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['endpoints'].add(endpoint)
+            if duration_ms >= stats['max_ms']:
+                stats['max_ms'] = duration_ms
+                stats['slowest_params'] = params
+                stats['plan'] = plan
+                stats['last_seen'] = entry['time']
+
+    def worst(self, order_by, limit):
+        with self._lock:
+            summary = [dict(stats, endpoints=sorted(stats['endpoints'])) for stats in self._summary.values()]
+        for stats in summary:
+            stats['avg_ms'] = stats['total_ms'] / stats['count']
+            stats['uses_index'] = not any(step.startswith('SCAN') and 'USING' not in step for step in stats['plan'])
+        summary.sort(key=lambda stats: stats[order_by], reverse=True)
+        return summary[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._summary.clear()
+
+slow_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG)
+
+def explain_plan(conn, sql, params):
+    if statement_kind(sql) not in EXPLAINABLE:
+        return []
+    try:
+        # A plain cursor, so the EXPLAIN itself is not traced
+        cursor = conn.cursor(sqlite3.Cursor)
+        return [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+    except sqlite3.Error as e:
+        return [f'EXPLAIN failed: {e}']
+
+def statement_kind(sql):
+    return sql.lstrip().split(None, 1)[0].upper()
+
+class TracingCursor(sqlite3.Cursor):
+    # A SELECT does most of its work while rows are fetched, so its slow-query check waits for the
+    # first fetch; statements that return no rows are checked straight after execute
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        if not (metrics.enabled or slow_log.enabled):
+            return super().execute(sql, parameters)
+        self._pending = None
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            if metrics.enabled:
+                metrics.observe('sqlite_statement_duration_seconds', (('endpoint', trace_endpoint()), ('statement', statement_kind(sql))), elapsed)
+        if slow_log.enabled:
+            if self.description is None:
+                slow_log.check(self.connection, sql, parameters, elapsed)
+            else:
+                self._pending = (sql, parameters, elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not (metrics.enabled or slow_log.enabled):
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            if metrics.enabled:
+                metrics.observe('sqlite_statement_duration_seconds', (('endpoint', trace_endpoint()), ('statement', statement_kind(sql))), elapsed)
+        # Timed as one statement; the first row's parameters stand in for the plan
+        if slow_log.enabled and seq_of_parameters:
+            slow_log.check(self.connection, sql, seq_of_parameters[0], elapsed, len(seq_of_parameters))
+        return self
+
+    def _fetched(self, count, started):
+        if metrics.enabled and count:
+            metrics.inc('sqlite_rows_fetched_total', (('endpoint', trace_endpoint()),), count)
+        if self._pending is not None:
+            sql, parameters, elapsed = self._pending
+            self._pending = None
+            slow_log.check(self.connection, sql, parameters, elapsed + time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(0 if row is None else 1, started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), started)
+        return rows
+
+class PooledConnection(sqlite3.Connection):
+    # Routes call close() when done; for pooled connections that hands them back instead
+    pool = None
+    in_use = False
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+class ConnectionPool:
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        # LIFO so the most recently used (warm cache) connection is handed out first
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        conn.in_use = True
+        return conn
+
+    def release(self, conn):
+        if not conn.in_use:
+            return
+        conn.in_use = False
+        # Never hand out a connection with a half-finished transaction or a route's row factory
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.discard()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().discard()
+            except queue.Empty:
+                return
+
+db_pool = ConnectionPool(db_path)
+
+def close_db_pool():
+    db_pool.close_all()
+
+atexit.register(close_db_pool)
+
+# Group commit: all mutating routes hand their statements to one writer thread per process
+WRITE_BATCH_WINDOW = 0.002
+WRITE_BATCH_MAX = 64
+# A write still queued after this long is cancelled and the request answered with 503
+WRITE_TIMEOUT_SECONDS = float(os.environ.get('WAREHOUSE_WRITE_TIMEOUT', '30'))
+
+class WriteTimeout(Exception):
+    pass
+
+class WriteQueue:
+    # Jobs are callables taking a cursor. Jobs that arrive within WRITE_BATCH_WINDOW of each other
+    # share one transaction and one fsync; each runs in its own savepoint so a failing job only
+    # rolls back itself.
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        self._ensure_started()
+        future = Future()
+        endpoint = request.endpoint if has_request_context() else None
+        self._jobs.put((job, future, endpoint, time.perf_counter()))
+        return future
+
+    def _ensure_started(self):
+        # Started lazily, and again in a forked worker, where the parent's thread does not exist
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                # A forked child starts empty; a restart in the same process keeps the jobs still waiting
+                if self._pid != os.getpid():
+                    self._jobs = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(db_pool.path, self._jobs), name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._jobs.put(None)
+            thread.join()
+        self._thread = None
+
+    def _run(self, path, jobs):
+        conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None, factory=PooledConnection)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        running = True
+        try:
+            while running:
+                first = jobs.get()
+                if first is None:
+                    break
+                batch = [first]
+                deadline = time.monotonic() + WRITE_BATCH_WINDOW
+                while len(batch) < WRITE_BATCH_MAX:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+        finally:
+            # Also on a crash, so the write lock is released for the thread that replaces this one
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        try:
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            if metrics.enabled:
+                metrics.observe('sqlite_lock_wait_seconds', (), time.perf_counter() - started)
+                metrics.observe('sqlite_write_batch_size', (), len(batch), BATCH_BUCKETS)
+            for job, future, endpoint, submitted in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                _trace.endpoint = endpoint or 'writer'
+                if metrics.enabled:
+                    metrics.observe('sqlite_write_queue_wait_seconds', (('endpoint', _trace.endpoint),), time.perf_counter() - submitted)
+                cursor = conn.cursor()
+                cursor.execute('SAVEPOINT job')
+                try:
+                    results.append((future, job(cursor), None))
+                    cursor.execute('RELEASE job')
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO job')
+                    cursor.execute('RELEASE job')
+                    results.append((future, None, e))
+            _trace.endpoint = 'writer'
+            conn.execute('COMMIT')
+            with change_signal:
+                change_signal.notify_all()
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+writer = WriteQueue()
+atexit.register(writer.stop)
+# Woken after every commit so /events streams in this process push at once; other processes are caught by polling
+change_signal = threading.Condition()
+
+# Holds the writer's cursor while /batch runs its write sub-requests, so their run_write() calls join its transaction
+_batch_write = threading.local()
+
+def run_write(job):
+    cursor = getattr(_batch_write, 'cursor', None)
+    if cursor is not None:
+        return job(cursor)
+    future = writer.submit(job)
+    try:
+        return future.result(timeout=WRITE_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        if future.cancel():
+            raise WriteTimeout()
+        # Already running, so it is about to finish either way
+        return future.result()
+
+@app.errorhandler(WriteTimeout)
+def write_timeout(e):
+    response = jsonify({'error': 'The database is busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 # Helper function to get db connection
+class BatchConnection:
+    # What get_db() hands out during a /batch write transaction: the writer's own connection, so reads
+    # see the batch's uncommitted writes. Commit and close are left to the writer.
+    in_use = True
+    in_transaction = True
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.row_factory = None
+
+    def cursor(self, *args):
+        cursor = self._conn.cursor(*args)
+        cursor.row_factory = self.row_factory
+        return cursor
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
 def get_db():
-    return sqlite3.connect(db_path)
+    # One pooled connection per request context, shared by every get_db() call in it
+    cursor = getattr(_batch_write, 'cursor', None)
+    if cursor is not None:
+        return BatchConnection(cursor.connection)
+    if not has_app_context():
+        return db_pool.acquire()
+    conn = g.get('db')
+    if conn is None or not conn.in_use:
+        conn = g.db = db_pool.acquire()
+    return conn
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+# Filterable columns of the history tables served by the get_all_* routes: query arg -> column
+HISTORY_FILTERS = {
+    'purchases': {'item': 'item', 'vendor': 'vendor', 'po_number': 'po_number', 'payment_status': 'payment_status'},
+    'sales': {'item': 'item', 'client': 'clint', 'po_number': 'po_number', 'payment_status': 'payment_status'},
+    'b_grade_sales': {'item': 'item', 'client': 'clint', 'po_number': 'po_number', 'payment_status': 'payment_status'},
+    'stock_updates': {'item': 'item', 'po_number': 'po_number'},
+    'lmd_data': {'client': 'client_name', 'po_number': 'po_number', 'payment_status': 'payment_status'},
+    'fmd_data': {'vendor': 'vendor_name', 'po_number': 'po_number', 'payment_status': 'payment_status'},
+    'rejection_received': {'item': 'item', 'client': 'client_name', 'po_number': 'po_number'},
+    'vendor_rejections': {'item': 'item', 'vendor': 'vendor', 'po_number': 'po_number'},
+    'dump_sales': {'item': 'item', 'po_number': 'po_number'},
+    'mandi_resales': {'item': 'item'},
+}
+MAX_PAGE_SIZE = 1000
+
+def page_args():
+    # Keyset pagination: rows with id < before_id, newest first; no limit keeps the old full-table response
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return before_id, limit
+
+def page_response(results, limit, id_key='id'):
+    response = jsonify(results)
+    if limit and len(results) == limit:
+        response.headers['X-Next-Before-Id'] = str(results[-1][id_key])
+    return response
+
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'json_stream': 'application/json'}
+STREAM_BATCH_SIZE = 500
+
+def stream_rows(query, args, stream_format):
+    # The generator outlives the request context, so it holds its own pooled connection
+    def generate():
+        conn = db_pool.acquire()
+        try:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(query, args)
+            first = True
+            if stream_format == 'json_stream':
+                yield '['
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                if stream_format == 'ndjson':
+                    yield ''.join(json.dumps(dict(row)) + '\n' for row in rows)
+                else:
+                    chunk = ','.join(json.dumps(dict(row)) for row in rows)
+                    yield chunk if first else ',' + chunk
+                first = False
+            if stream_format == 'json_stream':
+                yield ']'
+        finally:
+            conn.close()
+    return Response(generate(), mimetype=STREAM_FORMATS[stream_format])
+
+def fetch_history_page(table):
+    before_id, limit = page_args()
+    where_clause = []
+    where_args = []
+    if before_id is not None:
+        where_clause.append('id < ?')
+        where_args.append(before_id)
+    for arg, column in HISTORY_FILTERS[table].items():
+        value = request.args.get(arg)
+        if value:
+            where_clause.append(f'{column} = ?')
+            where_args.append(value)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if start_date:
+        where_clause.append('date >= ?')
+        where_args.append(start_date)
+    if end_date:
+        where_clause.append('date <= ?')
+        where_args.append(end_date)
+    query = f'SELECT * FROM {table} {"WHERE " + " AND ".join(where_clause) if where_clause else ""} ORDER BY id DESC'
+    if limit:
+        query += ' LIMIT ?'
+        where_args.append(limit)
+    stream_format = request.args.get('format')
+    if stream_format in STREAM_FORMATS:
+        return stream_rows(query, where_args, stream_format)
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(query, where_args)
+    rows = cursor.fetchall()
+    conn.close()
+    results = [dict(row) for row in rows]
+    return page_response(results, limit)
+
+# Column -> default for the row-insert routes, shared by the single and batch variants
+INSERT_COLUMNS = {
+    'purchases': {'item': None, 'vendor': None, 'po_number': None, 'qty_receive': None, 'unit_receive': None, 'pcs_receive': None, 'qty_accept': None, 'unit_accept': None, 'pcs_accept': None, 'qty_reject': None, 'unit_reject': None, 'pcs_reject': None, 'reason_for_rejection': None, 'date': None, 'time': None, 'ctrl_date': None, 'item_tag': None, 'payment_status': 'Unpaid', 'mode_of_payment': None, 'amount_paid': 0.0, 'amount_due': 0.0, 'rate': 0.0, 'total_value': 0.0},
+    'sales': {'item': None, 'clint': None, 'po_number': None, 'quantity': None, 'unit': None, 'pcs': None, 'date': None, 'time': None, 'item_tag': None, 'payment_status': 'Unpaid', 'mode_of_payment': None, 'amount_paid': 0.0, 'amount_due': 0.0, 'rate': 0.0, 'total_value': 0.0},
+    'b_grade_sales': {'item': None, 'clint': None, 'quantity': None, 'rate': None, 'unit': None, 'total_value': None, 'date': None, 'time': None, 'po_number': None, 'pcs': None, 'item_tag': None, 'payment_status': None, 'mode_of_payment': None, 'amount_paid': None, 'amount_due': None},
+    'stock_updates': {'item': None, 'a_grade_qty': None, 'a_grade_unit': None, 'pcs_a_grade': None, 'b_grade_qty': None, 'b_grade_unit': None, 'pcs_b_grade': None, 'c_grade_qty': None, 'c_grade_unit': None, 'pcs_c_grade': None, 'ungraded_qty': None, 'ungraded_unit': None, 'pcs_ungraded': None, 'dump_qty': None, 'dump_unit': None, 'pcs_dump': None, 'total_qty': None, 'date': None, 'time': None, 'po_number': None, 'a_grade_tags': None, 'b_grade_tags': None, 'c_grade_tags': None, 'ungraded_tags': None, 'dump_tags': None},
+    'dump_sales': {'item': None, 'quantity': None, 'unit': None, 'pcs': None, 'item_tag': None, 'date': None, 'time': None},
+    'mandi_resales': {'item': None, 'quantity': None, 'unit': None, 'pcs': None, 'item_tag': None, 'date': None, 'time': None},
+}
+MAX_BATCH_ROWS = 1000
+
+def insert_sql(table):
+    columns = INSERT_COLUMNS[table]
+    return f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+def insert_params(table, row):
+    return tuple(row.get(column, default) for column, default in INSERT_COLUMNS[table].items())
+
+def insert_row(table, row):
+    def write(cursor):
+        cursor.execute(insert_sql(table), insert_params(table, row))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
+
+def insert_batch(table, rows):
+    if not isinstance(rows, list):
+        return jsonify({'error': 'Request body must be a JSON array of rows'}), 400
+    if len(rows) > MAX_BATCH_ROWS:
+        return jsonify({'error': f'A batch cannot exceed {MAX_BATCH_ROWS} rows'}), 400
+    ids = [None] * len(rows)
+    errors = []
+    valid = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'index': index, 'error': 'Row must be a JSON object'})
+        elif not row.get('item'):
+            errors.append({'index': index, 'error': 'item is required'})
+        else:
+            valid.append(index)
+    def write(cursor):
+        query = insert_sql(table)
+        cursor.execute('SAVEPOINT batch_all')
+        try:
+            # One executemany in one transaction; AUTOINCREMENT ids are contiguous while we hold the write lock
+            cursor.executemany(query, [insert_params(table, rows[index]) for index in valid])
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            for offset, index in enumerate(valid):
+                ids[index] = last_id - len(valid) + 1 + offset
+        except sqlite3.Error:
+            # Fall back to row-by-row savepoints so one bad row does not sink the batch
+            cursor.execute('ROLLBACK TO batch_all')
+            for index in valid:
+                cursor.execute('SAVEPOINT batch_row')
+                try:
+                    cursor.execute(query, insert_params(table, rows[index]))
+                    ids[index] = cursor.lastrowid
+                except sqlite3.Error as e:
+                    cursor.execute('ROLLBACK TO batch_row')
+                    errors.append({'index': index, 'error': str(e)})
+                cursor.execute('RELEASE batch_row')
+        cursor.execute('RELEASE batch_all')
+    run_write(write)
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({'ids': ids, 'inserted': sum(1 for id in ids if id is not None), 'errors': errors})
+
+LIST_CACHE_MAX_ENTRIES = 256
+
+class ListCache:
+    # Whole-response cache for small master-data lists, dropped by table when a route writes to it.
+    # Entries also remember the table-version ETag they were built under, so a write made by
+    # another worker process is picked up on the next request.
+    def __init__(self, max_entries=LIST_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[3] != version:
+            return None
+        return entry
+
+    def put(self, key, tables, body, version, generation):
+        entry = (tables, body, hashlib.sha1(body).hexdigest(), version)
+        with self._lock:
+            # Skip the store if a write invalidated anything while the body was being loaded
+            if generation == self.generation:
+                # One entry per query string, so drop the oldest once that many are held
+                self._entries.pop(key, None)
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                self._entries[key] = entry
+        return entry
+
+    def invalidate(self, *tables):
+        with self._lock:
+            self.generation += 1
+            for key, entry in list(self._entries.items()):
+                if set(entry[0]) & set(tables):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+master_cache = ListCache()
+
+def cached_list(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper():
+            # Inside a write batch the view sees uncommitted rows, which must never reach the cache
+            if getattr(_batch_write, 'cursor', None) is not None:
+                return view()
+            version = g.get('etag')
+            # Keyed by query string too, so reports with parameters keep one entry per parameter set
+            key = (view.__name__, request.query_string)
+            entry = master_cache.get(key, version)
+            if entry is None:
+                generation = master_cache.generation
+                response = view()
+                # Error responses come back as (body, status) and are never cached
+                if isinstance(response, tuple):
+                    return response
+                entry = master_cache.put(key, tables, response.get_data(), version, generation)
+            _, body, etag, _ = entry
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Registered before finish_response, so it runs after it and sees the compressed size
+    started = g.get('request_started')
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('http_request_duration_seconds', (('endpoint', endpoint), ('method', request.method)), time.perf_counter() - started)
+    metrics.inc('http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+    if request.content_length:
+        metrics.inc('http_request_bytes_total', (('endpoint', endpoint),), request.content_length)
+    if response.content_length:
+        metrics.inc('http_response_bytes_total', (('endpoint', endpoint),), response.content_length)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    metrics.enabled = True
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Tables read by each GET route, for its ETag; routes not listed here depend on every table
+ROUTE_TABLES = {
+    'get_latest_generated_sos_with_items': ['generated_sos', 'so_items', 'vendors'],
+    'get_all_generated_sos_with_items': ['generated_sos', 'so_items', 'vendors'],
+    'get_available_sos_for_sale': ['generated_sos', 'so_items', 'sales'],
+    'get_all_generated_pos': ['generated_pos'],
+    'get_latest_generated_pos': ['generated_pos'],
+    'get_last_po_number': ['generated_pos'],
+    'get_all_po_numbers': ['generated_pos'],
+    'get_last_so_number': ['generated_sos'],
+    'get_available_pos_for_purchase': ['generated_pos', 'purchases'],
+    'get_po_fulfilment': ['generated_pos', 'purchases'],
+    'get_payment_history': ['payment_history'],
+    'get_payment_aging': [table for table, _, _, _ in PAYMENT_SOURCES],
+    'search': [table for _, table, _ in SEARCH_SOURCES],
+    'get_product_managers': ['product_managers'],
+    'get_items': ['items'],
+    'get_purchased_items': ['purchases'],
+    'get_vendors': ['vendors'],
+    'get_vendors_with_details': ['vendors'],
+    'get_purchase_vendors': ['purchase_vendors'],
+    'get_b_grade_clients': ['b_grade_clients'],
+    'get_filtered_lmd_data': ['lmd_data'],
+    'get_filtered_fmd_data': ['fmd_data'],
+    'get_waitlisted_sales': ['sales_waitlist'],
+    'get_purchased_tags_for_item': ['purchases'],
+    'get_available_tags_for_item': [TAG_INFLOW[0], *(outflow for outflow, _ in TAG_OUTFLOWS)],
+    'trace_tag': [*TAGGED_TABLES, 'stock_updates', 'vendor_rejections'],
+    'get_po_number_by_tag': ['purchases'],
+    'get_stock_update_total_for_date': ['stock_updates'],
+    'inventory_reconcile': ['items', 'stock_updates'] + [table for _, table, _, _ in RECONCILE_SOURCES],
+    'get_stock_ledger': [table for table, _, _, _ in LEDGER_SOURCES],
+    'get_rollup': [table for table, *_ in ROLLUP_SOURCES],
+}
+for _table in HISTORY_FILTERS:
+    ROUTE_TABLES[f'get_all_{_table}'] = [_table]
+    ROUTE_TABLES[f'get_latest_{_table}'] = [_table]
+# Routes served without ETags; the tag counter behind get_next_item_tag_sequence is not a versioned table
+NO_ETAG_ENDPOINTS = {'check_indexes', 'get_metrics', 'get_slow_queries', 'get_next_item_tag_sequence', 'events', 'sync'}
+# Routes whose default answer depends on today's date, so their tags roll over at midnight
+DATED_ENDPOINTS = {'get_payment_aging'}
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def table_versions(cursor, tables=None):
+    if tables:
+        cursor.execute(f'SELECT table_name, version FROM table_versions WHERE table_name IN ({",".join("?" * len(tables))}) ORDER BY table_name', tables)
+    else:
+        cursor.execute('SELECT table_name, version FROM table_versions ORDER BY table_name')
+    return cursor.fetchall()
+
+@app.before_request
+def check_etag():
+    if request.method != 'GET' or request.endpoint is None or request.endpoint in NO_ETAG_ENDPOINTS:
+        return None
+    # Reads in a write batch run before the batch commits, so their versions may yet be rolled back
+    if getattr(_batch_write, 'cursor', None) is not None:
+        return None
+    conn = get_db()
+    versions = table_versions(conn.cursor(), ROUTE_TABLES.get(request.endpoint))
+    conn.close()
+    # Versions are read before the view runs, so a concurrent write can only make the tag older, never stale
+    key = f'{request.endpoint}?{request.query_string.decode()}|{versions}'
+    if request.endpoint in DATED_ENDPOINTS:
+        key += f'|{datetime.now().strftime("%Y-%m-%d")}'
+    g.etag = hashlib.sha1(key.encode()).hexdigest()
+    if any(f'{g.etag}{suffix}' in request.if_none_match for suffix in ('', '-br', '-gzip')):
+        response = Response(status=304)
+        response.set_etag(g.etag)
+        return response
+    return None
+
+@app.after_request
+def finish_response(response):
+    etag = g.get('etag')
+    if etag and response.status_code == 200 and not response.headers.get('ETag'):
+        response.set_etag(etag)
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    accepted = request.accept_encodings
+    encoding = next((e for e in COMPRESS_ENCODINGS if accepted[e]), None)
+    if encoding is None:
+        return response
+    response.set_data(brotli.compress(data) if encoding == 'br' else gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    current, weak = response.get_etag()
+    if current and not weak:
+        # The encoded body is a different representation, so it needs its own strong tag
+        response.set_etag(f'{current}-{encoding}')
+    return response
+
+EVENTS_POLL_SECONDS = 1.0
+EVENTS_KEEPALIVE_SECONDS = 15
+# Streams end after this long and the client reconnects with Last-Event-ID, so no worker thread is held forever
+EVENTS_MAX_SECONDS = 300
+EVENTS_BATCH_SIZE = 500
+# Each stream holds a worker thread, so only this many run per process and the other threads stay free
+# for normal requests; gunicorn.conf.py derives the default from its thread count
+EVENTS_MAX_STREAMS = int(os.environ.get('WAREHOUSE_EVENTS_MAX_STREAMS', '2'))
+EVENTS_RETRY_MS = 10000
+events_slots = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
+
+def read_changes(since, limit):
+    conn = db_pool.acquire()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT version, table_name, row_id, op, changed_at FROM change_log WHERE version > ? ORDER BY version LIMIT ?', (since, limit))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+@app.route('/events', methods=['GET'])
+def events():
+    # Server-sent events: one 'change' event per mutated row, resumable from any change version
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    tables = set(table for table in request.args.getlist('table') if table)
+    if tables - set(VERSIONED_TABLES):
+        return jsonify({'error': f'Unknown table: {", ".join(sorted(tables - set(VERSIONED_TABLES)))}'}), 400
+    if since is None:
+        conn = get_db()
+        since = conn.cursor().execute('SELECT COALESCE(MAX(version), 0) FROM change_log').fetchone()[0]
+        conn.close()
+    if not events_slots.acquire(blocking=False):
+        response = Response(f'retry: {EVENTS_RETRY_MS}\n\n', status=503, mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(EVENTS_RETRY_MS // 1000)
+        return response
+
+    def generate():
+        last = since
+        yield f'retry: 3000\nid: {last}\nevent: ready\ndata: {json.dumps({"version": last})}\n\n'
+        started = quiet_since = time.monotonic()
+        while time.monotonic() - started < EVENTS_MAX_SECONDS:
+            rows = read_changes(last, EVENTS_BATCH_SIZE)
+            if rows:
+                last = rows[-1][0]
+                chunks = [f'id: {version}\nevent: change\ndata: {json.dumps({"version": version, "table": table, "id": row_id, "op": op, "changed_at": changed_at})}\n\n' for version, table, row_id, op, changed_at in rows if not tables or table in tables]
+                if chunks:
+                    yield ''.join(chunks)
+                    quiet_since = time.monotonic()
+                if len(rows) == EVENTS_BATCH_SIZE:
+                    continue
+            if time.monotonic() - quiet_since >= EVENTS_KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                quiet_since = time.monotonic()
+            with change_signal:
+                change_signal.wait(EVENTS_POLL_SECONDS)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Called by the server when the stream ends or the client goes away
+    response.call_on_close(events_slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+SYNC_PAGE_SIZE = 2000
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('WAREHOUSE_CHANGE_LOG_DAYS', '30'))
+SYNC_ID_CHUNK = 500
+
+def change_log_floor(cursor):
+    # Oldest version still replayable; anything at or below it may have been pruned
+    return cursor.execute("SELECT COALESCE((SELECT MIN(version) FROM change_log) - 1, (SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)").fetchone()[0]
+
+@app.route('/sync', methods=['GET'])
+def sync():
+    # Delta sync: current rows for everything changed after `since`, plus tombstones for deleted ids.
+    # A missing or pruned `since` answers reset=true with the version to resume from after a full reload.
+    since = request.args.get('since', type=int)
+    tables = set(table for table in request.args.getlist('table') if table)
+    if tables - set(VERSIONED_TABLES):
+        return jsonify({'error': f'Unknown table: {", ".join(sorted(tables - set(VERSIONED_TABLES)))}'}), 400
+    limit = max(1, min(request.args.get('limit', SYNC_PAGE_SIZE, type=int), SYNC_PAGE_SIZE))
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    # One snapshot for the whole response, unless this already runs inside a /batch transaction
+    if not conn.in_transaction:
+        cursor.execute('BEGIN')
+    latest = cursor.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)").fetchone()[0]
+    if since is None or since < change_log_floor(cursor):
+        conn.commit()
+        conn.close()
+        return jsonify({'reset': True, 'version': latest, 'more': False, 'changes': {}, 'deleted': {}})
+    cursor.execute('SELECT version, table_name, row_id, op FROM change_log WHERE version > ? ORDER BY version LIMIT ?', (since, limit))
+    log = cursor.fetchall()
+    version = log[-1]['version'] if log else max(since, latest)
+    # Last operation per row wins; later pages replay anything that changes again
+    last_op = {}
+    for entry in log:
+        if not tables or entry['table_name'] in tables:
+            last_op[(entry['table_name'], entry['row_id'])] = entry['op']
+    changes, deleted = {}, {}
+    for table in sorted(set(table for table, _ in last_op)):
+        ids = [row_id for (name, row_id), op in last_op.items() if name == table and op != 'delete']
+        rows = []
+        for start in range(0, len(ids), SYNC_ID_CHUNK):
+            chunk = ids[start:start + SYNC_ID_CHUNK]
+            cursor.execute(f'SELECT * FROM {table} WHERE id IN ({",".join("?" * len(chunk))}) ORDER BY id', chunk)
+            rows.extend(dict(row) for row in cursor.fetchall())
+        present = set(row['id'] for row in rows)
+        # Rows changed and then removed by a later (not yet paged) delete are tombstoned now
+        gone = sorted(row_id for (name, row_id), op in last_op.items() if name == table and (op == 'delete' or row_id not in present))
+        if rows:
+            changes[table] = rows
+        if gone:
+            deleted[table] = gone
+    conn.commit()
+    conn.close()
+    return jsonify({'reset': False, 'version': version, 'more': len(log) == limit, 'changes': changes, 'deleted': deleted})
+
+def prune_change_log(days=None):
+    days = CHANGE_LOG_RETENTION_DAYS if days is None else days
+    def write(cursor):
+        cursor.execute("DELETE FROM change_log WHERE changed_at < strftime('%Y-%m-%dT%H:%M:%fZ', 'now', ?)", (f'-{days} days',))
+        return cursor.rowcount
+    return run_write(write)
+
+@app.route('/admin/prune_change_log', methods=['POST'])
+def prune_change_log_route():
+    days = (request.get_json(silent=True) or {}).get('days')
+    if days is not None and (not isinstance(days, int) or days < 0):
+        return jsonify({'error': 'days must be a non-negative integer'}), 400
+    return jsonify({'deleted': prune_change_log(days)})
+
+@app.cli.command('prune-change-log')
+def prune_change_log_command():
+    print(f'change_log pruned: {prune_change_log()} rows')
+
+BATCH_MAX_REQUESTS = 20
+BATCH_READ_WORKERS = max(1, DB_POOL_SIZE // 2)
+BATCH_EXCLUDED_ENDPOINTS = {'batch', 'events', 'static'}
+
+class BatchAborted(Exception):
+    def __init__(self, index):
+        super().__init__(index)
+        self.index = index
+
+def dispatch_subrequest(method, path, args, body):
+    # Runs on a worker or the writer thread, so the sub-request gets its own app context and g
+    options = {'method': method, 'query_string': args}
+    if body is not None:
+        options['json'] = body
+    with app.test_request_context(path, **options):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            return {'status': 500, 'body': {'error': str(e)}}
+    data = response.get_data()
+    try:
+        payload = json.loads(data) if data else None
+    except ValueError:
+        payload = data.decode('utf-8', 'replace')
+    result = {'status': response.status_code, 'body': payload}
+    headers = {key: value for key, value in response.headers.items() if key.startswith('X-')}
+    if headers:
+        result['headers'] = headers
+    return result
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    # Sub-requests go through the normal view functions. A batch of reads runs concurrently on pooled
+    # connections. A batch with any write runs every sub-request in the order given, on the writer thread
+    # and in one transaction: reads see the writes before them, and a failed write rolls the whole batch
+    # back. NDJSON/stream exports always read committed data through their own connection.
+    specs = request.json
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'Expected a non-empty list of sub-requests'}), 400
+    if len(specs) > BATCH_MAX_REQUESTS:
+        return jsonify({'error': f'At most {BATCH_MAX_REQUESTS} sub-requests per batch'}), 400
+    adapter = app.url_map.bind('localhost')
+    results = [None] * len(specs)
+    planned = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not isinstance(spec.get('path'), str) or not spec['path'].startswith('/'):
+            return jsonify({'error': f'Sub-request {index} needs a path starting with /'}), 400
+        method = str(spec.get('method', 'GET')).upper()
+        path, _, query = spec['path'].partition('?')
+        try:
+            endpoint, _ = adapter.match(path, method)
+        except HTTPException as e:
+            results[index] = {'status': e.code, 'body': {'error': e.description}}
+            continue
+        if endpoint in BATCH_EXCLUDED_ENDPOINTS:
+            results[index] = {'status': 400, 'body': {'error': f'{path} cannot be batched'}}
+            continue
+        planned.append((index, (method, path, spec.get('args') or query, spec.get('body')), method not in ('GET', 'HEAD')))
+
+    if any(is_write for _, _, is_write in planned):
+        def write(cursor):
+            _batch_write.cursor = cursor
+            try:
+                for index, sub, is_write in planned:
+                    results[index] = dispatch_subrequest(*sub)
+                    if is_write and results[index]['status'] >= 400:
+                        raise BatchAborted(index)
+            finally:
+                _batch_write.cursor = None
+        try:
+            run_write(write)
+        except BatchAborted as e:
+            for index, _, _ in planned:
+                if index != e.index:
+                    results[index] = {'status': 409, 'body': {'error': f'Not applied: sub-request {e.index} failed'}}
+    elif planned:
+        with ThreadPoolExecutor(max_workers=min(len(planned), BATCH_READ_WORKERS)) as pool:
+            for (index, _, _), result in zip(planned, pool.map(lambda item: dispatch_subrequest(*item[1]), planned)):
+                results[index] = result
+    return jsonify(results)
+
+@app.route('/admin/check_indexes', methods=['GET'])
+def check_indexes():
+    conn = get_db()
+    cursor = conn.cursor()
+    report = check_query_plans(cursor)
+    conn.close()
+    return jsonify({'ok': all(entry['uses_index'] for entry in report), 'queries': report})
+
+SLOW_QUERY_ORDERS = ('total_ms', 'max_ms', 'avg_ms', 'count')
+
+@app.route('/admin/slow_queries', methods=['GET'])
+def get_slow_queries():
+    order_by = request.args.get('order_by', 'total_ms')
+    if order_by not in SLOW_QUERY_ORDERS:
+        return jsonify({'error': f'order_by must be one of {", ".join(SLOW_QUERY_ORDERS)}'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'threshold_ms': slow_log.threshold_ms, 'log': slow_log.path, 'queries': slow_log.worst(order_by, limit)})
+
+@app.route('/admin/slow_queries', methods=['POST'])
+def configure_slow_queries():
+    data = request.json or {}
+    if 'threshold_ms' in data:
+        try:
+            slow_log.threshold_ms = float(data['threshold_ms'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'threshold_ms must be a number'}), 400
+    if data.get('reset'):
+        slow_log.clear()
+    return jsonify({'threshold_ms': slow_log.threshold_ms})
 
 @app.route('/insert_generated_so', methods=['POST'])
 def insert_generated_so():
     data = request.json
     so_data = data['so_data']
     items_data = data['items_data']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO generated_sos (client_name, so_number, date_of_dispatch) VALUES (?, ?, ?)', (so_data['client_name'], so_data['so_number'], so_data['date_of_dispatch']))
-    so_id = cursor.lastrowid
-    for item in items_data:
-        cursor.execute('INSERT INTO so_items (so_id, item_name, quantity_kg, quantity_pcs) VALUES (?, ?, ?, ?)', (so_id, item['item_name'], item['quantity_kg'], item['quantity_pcs']))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('INSERT INTO generated_sos (client_name, so_number, date_of_dispatch) VALUES (?, ?, ?)', (so_data['client_name'], so_data['so_number'], so_data['date_of_dispatch']))
+        so_id = cursor.lastrowid
+        for item in items_data:
+            cursor.execute('INSERT INTO so_items (so_id, item_name, quantity_kg, quantity_pcs) VALUES (?, ?, ?, ?)', (so_id, item['item_name'], item['quantity_kg'], item['quantity_pcs']))
+        return so_id
+    so_id = run_write(write)
     return jsonify({'so_id': so_id})
 
 @app.route('/get_latest_generated_sos_with_items', methods=['GET'])
@@ -119,34 +1719,11 @@ def get_latest_generated_sos_with_items():
 
 @app.route('/insert_b_grade_sale', methods=['POST'])
 def insert_b_grade_sale():
-    row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    query = '''INSERT INTO b_grade_sales
-               (item, clint, quantity, rate, unit, total_value, date, time, po_number, pcs, item_tag, payment_status, mode_of_payment, amount_paid, amount_due)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
-    params = (
-        row.get('item'),
-        row.get('clint'),
-        row.get('quantity'),
-        row.get('rate'),
-        row.get('unit'),
-        row.get('total_value'),
-        row.get('po_number'),
-        row.get('pcs'),
-        row.get('date'),
-        row.get('time'),
-        row.get('item_tag'),
-        row.get('payment_status'),
-        row.get('mode_of_payment'),
-        row.get('amount_paid'),
-        row.get('amount_due')
-    )
-    cursor.execute(query, params)
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
-    return jsonify({'id': last_id})
+    return insert_row('b_grade_sales', request.json)
+
+@app.route('/insert_b_grade_sale_batch', methods=['POST'])
+def insert_b_grade_sale_batch():
+    return insert_batch('b_grade_sales', request.json)
 
 @app.route('/get_latest_b_grade_sales', methods=['GET'])
 def get_latest_b_grade_sales():
@@ -160,6 +1737,49 @@ def get_latest_b_grade_sales():
     return jsonify(results)
 
 
+SEARCH_KINDS = [kind for kind, _, _ in SEARCH_SOURCES]
+SEARCH_TRIGRAM_MIN = 3
+SEARCH_MAX_LIMIT = 50
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def search_contains(column, kind, value):
+    # Substring filters long enough for trigrams use the FTS index instead of a LIKE scan.
+    # CROSS JOIN keeps the MATCH as the outer loop; otherwise SQLite runs one MATCH per search_terms row of the kind.
+    if len(value) >= SEARCH_TRIGRAM_MIN:
+        return f'{column} IN (SELECT t.term FROM search_fts CROSS JOIN search_terms t ON t.id = search_fts.rowid WHERE search_fts MATCH ? AND t.kind = ?)', [fts_phrase(value), kind]
+    return f'{column} LIKE ?', [f'%{value}%']
+
+@app.route('/search', methods=['GET'])
+def search():
+    text = request.args.get('q', '').strip()
+    kinds = [kind for kind in request.args.getlist('kind') if kind]
+    unknown = [kind for kind in kinds if kind not in SEARCH_KINDS]
+    if unknown:
+        return jsonify({'error': f'kind must be one of {", ".join(SEARCH_KINDS)}'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), SEARCH_MAX_LIMIT))
+    if not text:
+        return jsonify([])
+    kinds = kinds or SEARCH_KINDS
+    kind_filter = f't.kind IN ({",".join("?" * len(kinds))})'
+    # Prefix matches rank first, then FTS rank, then shorter terms
+    order = 'lower(substr(t.term, 1, ?)) = lower(?) DESC'
+    if len(text) >= SEARCH_TRIGRAM_MIN:
+        query = f'SELECT t.kind, t.term FROM search_fts CROSS JOIN search_terms t ON t.id = search_fts.rowid WHERE search_fts MATCH ? AND {kind_filter} ORDER BY {order}, search_fts.rank, length(t.term), t.term LIMIT ?'
+        args = [fts_phrase(text), *kinds, len(text), text, limit]
+    else:
+        # Too short for trigrams: a prefix range over the NOCASE index
+        query = f'SELECT t.kind, t.term FROM search_terms t WHERE t.term COLLATE NOCASE >= ? AND t.term COLLATE NOCASE < ? AND {kind_filter} ORDER BY length(t.term), t.term LIMIT ?'
+        args = [text, text + '\U0010ffff', *kinds, limit]
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(query, args)
+    results = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return jsonify(results)
+
 @app.route('/get_all_generated_pos', methods=['GET'])
 def get_all_generated_pos():
     start_date = request.args.get('start_date')
@@ -170,8 +1790,7 @@ def get_all_generated_pos():
     where_clause = ''
     where_args = []
     if po_number:
-        where_clause += 'po_number LIKE ?'
-        where_args.append(f'%{po_number}%')
+        where_clause, where_args = search_contains('po_number', 'po_number', po_number)
     if item_name:
         if where_clause: where_clause += ' AND '
         where_clause += 'item_name = ?'
@@ -188,15 +1807,23 @@ def get_all_generated_pos():
         if where_clause: where_clause += ' AND '
         where_clause += 'expected_date <= ?'
         where_args.append(end_date)
+    before_id, limit = page_args()
+    if before_id is not None:
+        if where_clause: where_clause += ' AND '
+        where_clause += 'id < ?'
+        where_args.append(before_id)
     conn = get_db()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     query = f'SELECT * FROM generated_pos {f"WHERE {where_clause}" if where_clause else ""} ORDER BY id DESC'
+    if limit:
+        query += ' LIMIT ?'
+        where_args.append(limit)
     cursor.execute(query, where_args)
     rows = cursor.fetchall()
     conn.close()
     results = [dict(row) for row in rows]
-    return jsonify(results)
+    return page_response(results, limit)
 
 @app.route('/get_all_generated_sos_with_items', methods=['GET'])
 def get_all_generated_sos_with_items():
@@ -208,8 +1835,7 @@ def get_all_generated_sos_with_items():
     where_clause = ''
     where_args = []
     if so_number:
-        where_clause += 'so.so_number LIKE ?'
-        where_args.append(f'%{so_number}%')
+        where_clause, where_args = search_contains('so.so_number', 'so_number', so_number)
     if item_name:
         if where_clause: where_clause += ' AND '
         where_clause += 'item.item_name = ?'
@@ -226,6 +1852,15 @@ def get_all_generated_sos_with_items():
         if where_clause: where_clause += ' AND '
         where_clause += 'so.date_of_dispatch <= ?'
         where_args.append(end_date)
+    before_id, limit = page_args()
+    if before_id is not None:
+        if where_clause: where_clause += ' AND '
+        where_clause += 'so.id < ?'
+        where_args.append(before_id)
+    if limit:
+        # Pages are counted in SOs, not item rows, so an SO is never split across pages
+        where_clause = f'so.id IN (SELECT DISTINCT so.id FROM generated_sos so JOIN so_items item ON so.id = item.so_id {f"WHERE {where_clause}" if where_clause else ""} ORDER BY so.id DESC LIMIT ?)'
+        where_args.append(limit)
     conn = get_db()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
@@ -234,43 +1869,56 @@ def get_all_generated_sos_with_items():
     rows = cursor.fetchall()
     conn.close()
     results = [dict(row) for row in rows]
-    return jsonify(results)
+    response = jsonify(results)
+    if limit and len({row['so_id'] for row in results}) == limit:
+        response.headers['X-Next-Before-Id'] = str(results[-1]['so_id'])
+    return response
 
 @app.route('/get_available_sos_for_sale', methods=['GET'])
 def get_available_sos_for_sale():
+    # Open SO lines, newest SO first; pages are counted in SOs so an SO's lines stay together
+    where_clause = [f'({SO_OPEN_CONDITION.format("f.")})']
+    where_args = []
+    client_name = request.args.get('client_name')
+    if client_name:
+        where_clause.append('f.so_id IN (SELECT id FROM generated_sos WHERE client_name = ?)')
+        where_args.append(client_name)
+    before_id, limit = page_args()
+    if before_id is not None:
+        where_clause.append('f.so_id < ?')
+        where_args.append(before_id)
+    open_sos = f'SELECT DISTINCT f.so_id FROM so_fulfilment f WHERE {" AND ".join(where_clause)} ORDER BY f.so_id DESC'
+    if limit:
+        open_sos += f' LIMIT {limit}'
     conn = get_db()
-    cursor = conn.cursor()
-    all_sos = cursor.execute('SELECT * FROM generated_sos').fetchall()
-    used_sos = cursor.execute('SELECT po_number FROM sales').fetchall()
-    used_so_numbers = set(row[0] for row in used_sos)
-    available_sos = [so for so in all_sos if so[2] not in used_so_numbers]
-    if not available_sos:
-        conn.close()
-        return jsonify([])
-    so_ids = [so[0] for so in available_sos]
-    placeholders = ','.join('?' * len(so_ids))
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    query = f'SELECT so.id as so_id, so.client_name, so.so_number, so.date_of_dispatch, item.id as item_id, item.item_name, item.quantity_kg, item.quantity_pcs FROM generated_sos so JOIN so_items item ON so.id = item.so_id WHERE so.id IN ({placeholders}) ORDER BY so.id DESC, item.id ASC'
-    cursor.execute(query, so_ids)
+    query = f"""SELECT so.id as so_id, so.client_name, so.so_number, so.date_of_dispatch, item.id as item_id, item.item_name, item.quantity_kg, item.quantity_pcs,
+        f.sold_kg, f.sold_pcs, MAX(f.qty_kg - f.sold_kg, 0) AS pending_kg, MAX(f.qty_pcs - f.sold_pcs, 0) AS pending_pcs
+        FROM so_fulfilment f JOIN generated_sos so ON so.id = f.so_id JOIN so_items item ON item.id = f.item_id
+        WHERE f.so_id IN ({open_sos}) AND ({SO_OPEN_CONDITION.format("f.")}) ORDER BY so.id DESC, item.id ASC"""
+    cursor.execute(query, where_args)
     rows = cursor.fetchall()
     conn.close()
     results = [dict(row) for row in rows]
-    return jsonify(results)
+    response = jsonify(results)
+    if limit and len({row['so_id'] for row in results}) == limit:
+        response.headers['X-Next-Before-Id'] = str(results[-1]['so_id'])
+    return response
 
 @app.route('/insert_product_manager', methods=['POST'])
 def insert_product_manager():
     name = request.json['name']
     if not name.strip():
         return jsonify({'error': 'Name cannot be empty'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO product_managers (name) VALUES (?)', (name.strip(),))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('INSERT OR IGNORE INTO product_managers (name) VALUES (?)', (name.strip(),))
+    run_write(write)
+    master_cache.invalidate('product_managers')
     return jsonify({'success': True})
 
 @app.route('/get_product_managers', methods=['GET'])
+@cached_list('product_managers')
 def get_product_managers():
     conn = get_db()
     cursor = conn.cursor()
@@ -282,12 +1930,11 @@ def get_product_managers():
 @app.route('/add_payment_history_record', methods=['POST'])
 def add_payment_history_record():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO payment_history (parent_table_name, parent_id, amount_paid, mode_of_payment, payment_date, payment_time) VALUES (?, ?, ?, ?, ?, ?)', (row['parent_table_name'], row['parent_id'], row['amount_paid'], row['mode_of_payment'], row['payment_date'], row['payment_time']))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO payment_history (parent_table_name, parent_id, amount_paid, mode_of_payment, payment_date, payment_time) VALUES (?, ?, ?, ?, ?, ?)', (row['parent_table_name'], row['parent_id'], row['amount_paid'], row['mode_of_payment'], row['payment_date'], row['payment_time']))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/get_payment_history', methods=['GET'])
 def get_payment_history():
@@ -319,36 +1966,74 @@ def update_payment_status():
         'mode_of_payment': mode_of_payment if status != 'Unpaid' else None
     }
 
+    def write(cursor):
+        keys = list(update_fields.keys())
+        set_clause = ', '.join([f"{k} = ?" for k in keys])
+        values = [update_fields[k] for k in keys]
+        values.append(id)
+
+        cursor.execute(f'UPDATE {table_name} SET {set_clause} WHERE id = ?', values)
+    run_write(write)
+    return jsonify({'success': True})
+
+AGING_BUCKETS = [('0-7', 0, 7), ('8-30', 8, 30), ('31-60', 31, 60), ('60+', 61, None)]
+
+def _outstanding_expr(total_column):
+    # Partial payments carry their balance in amount_due; unpaid rows owe the total less anything recorded as paid
+    return f"CASE WHEN payment_status = 'Partial Paid' THEN COALESCE(amount_due, {total_column} - COALESCE(amount_paid, 0)) ELSE COALESCE({total_column}, 0) - COALESCE(amount_paid, 0) END"
+
+@app.route('/reports/payment_aging', methods=['GET'])
+@cached_list(*[table for table, _, _, _ in PAYMENT_SOURCES])
+def get_payment_aging():
+    as_of = request.args.get('as_of') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(as_of, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'as_of must be in YYYY-MM-DD format'}), 400
+    party_types = [party_type for party_type in request.args.getlist('party_type') if party_type] or PAYMENT_PARTY_TYPES
+    if any(party_type not in PAYMENT_PARTY_TYPES for party_type in party_types):
+        return jsonify({'error': f'party_type must be one of {", ".join(PAYMENT_PARTY_TYPES)}'}), 400
+    parts = []
+    args = []
+    for table, party_type, party_column, total_column in PAYMENT_SOURCES:
+        if party_type not in party_types:
+            continue
+        parts.append(f"SELECT '{party_type}' AS party_type, {party_column} AS party, date, {_outstanding_expr(total_column)} AS outstanding FROM {table} WHERE {UNPAID_CONDITION} AND {party_column} IS NOT NULL AND date <= ?")
+        args.append(as_of)
+    buckets = []
+    for label, low, high in AGING_BUCKETS:
+        age_filter = f'age >= {low}' + (f' AND age <= {high}' if high is not None else '')
+        buckets.append(f'SUM(CASE WHEN {age_filter} THEN outstanding ELSE 0.0 END) AS "{label}"')
+    query = f"""SELECT party_type, party, SUM(outstanding) AS outstanding, {", ".join(buckets)}, COUNT(*) AS entries, MIN(date) AS oldest_date
+        FROM (SELECT *, CAST(julianday(?) - julianday(date) AS INTEGER) AS age FROM ({" UNION ALL ".join(parts)}))
+        WHERE outstanding > 0 GROUP BY party_type, party ORDER BY party_type, outstanding DESC"""
     conn = get_db()
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    keys = list(update_fields.keys())
-    set_clause = ', '.join([f"{k} = ?" for k in keys])
-    values = [update_fields[k] for k in keys]
-    values.append(id)
-
-    cursor.execute(f'UPDATE {table_name} SET {set_clause} WHERE id = ?', values)
-    conn.commit()
+    cursor.execute(query, [as_of, *args])
+    parties = [dict(row) for row in cursor.fetchall()]
     conn.close()
-    return jsonify({'success': True})
+    totals = {}
+    for party in parties:
+        total = totals.setdefault(party['party_type'], {'outstanding': 0.0, **{label: 0.0 for label, _, _ in AGING_BUCKETS}})
+        for key in total:
+            total[key] += party[key]
+    return jsonify({'as_of': as_of, 'buckets': [label for label, _, _ in AGING_BUCKETS], 'totals': totals, 'parties': parties})
 
 @app.route('/delete_lmd_data', methods=['DELETE'])
 def delete_lmd_data():
     id = request.json['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM lmd_data WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('DELETE FROM lmd_data WHERE id = ?', (id,))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/delete_fmd_data', methods=['DELETE'])
 def delete_fmd_data():
     id = request.json['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM fmd_data WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('DELETE FROM fmd_data WHERE id = ?', (id,))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/delete_vendor', methods=['DELETE'])
@@ -359,14 +2044,13 @@ def delete_vendor():
     name = request.json['name']
     if not name:
         return jsonify({'error': 'Vendor name is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    # Delete from vendors table
-    cursor.execute('DELETE FROM vendors WHERE name = ?', (name,))
-    # Also delete from b_grade_clients if exists
-    cursor.execute('DELETE FROM b_grade_clients WHERE name = ?', (name,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        # Delete from vendors table
+        cursor.execute('DELETE FROM vendors WHERE name = ?', (name,))
+        # Also delete from b_grade_clients if exists
+        cursor.execute('DELETE FROM b_grade_clients WHERE name = ?', (name,))
+    run_write(write)
+    master_cache.invalidate('vendors', 'b_grade_clients')
     return jsonify({'success': True})
 
 @app.route('/delete_client', methods=['DELETE'])
@@ -374,14 +2058,13 @@ def delete_client():
     name = request.json.get('name')
     if not name:
         return jsonify({'error': 'Client name is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    # Delete from vendors table
-    cursor.execute('DELETE FROM vendors WHERE name = ?', (name,))
-    # Also delete from b_grade_clients if exists
-    cursor.execute('DELETE FROM b_grade_clients WHERE name = ?', (name,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        # Delete from vendors table
+        cursor.execute('DELETE FROM vendors WHERE name = ?', (name,))
+        # Also delete from b_grade_clients if exists
+        cursor.execute('DELETE FROM b_grade_clients WHERE name = ?', (name,))
+    run_write(write)
+    master_cache.invalidate('vendors', 'b_grade_clients')
     return jsonify({'success': True})
 
 @app.route('/delete_so_item', methods=['DELETE'])
@@ -389,11 +2072,9 @@ def delete_so_item():
     id = request.json.get('id')
     if not id:
         return jsonify({'error': 'Item ID is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM so_items WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('DELETE FROM so_items WHERE id = ?', (id,))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/delete_so', methods=['DELETE'])
@@ -401,14 +2082,12 @@ def delete_so():
     id = request.json.get('id')
     if not id:
         return jsonify({'error': 'SO ID is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    # Delete so_items first (child records)
-    cursor.execute('DELETE FROM so_items WHERE so_id = ?', (id,))
-    # Delete the so record
-    cursor.execute('DELETE FROM generated_sos WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        # Delete so_items first (child records)
+        cursor.execute('DELETE FROM so_items WHERE so_id = ?', (id,))
+        # Delete the so record
+        cursor.execute('DELETE FROM generated_sos WHERE id = ?', (id,))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/delete_purchase_vendor', methods=['DELETE'])
@@ -419,33 +2098,28 @@ def delete_purchase_vendor():
     name = request.json['name']
     if not name:
         return jsonify({'error': 'Vendor name is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM purchase_vendors WHERE name = ?', (name,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('DELETE FROM purchase_vendors WHERE name = ?', (name,))
+    run_write(write)
+    master_cache.invalidate('purchase_vendors')
     return jsonify({'success': True})
 
 @app.route('/update_lmd_data', methods=['PUT'])
 def update_lmd_data():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE lmd_data SET client_name=?, po_number=?, vehicle_number=?, driver_name=?, client_location=?, vehicle_type=?, booking_person=?, km=?, price_per_km=?, extra_expenses=?, reason=?, total_amount=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, date=?, time=? WHERE id=?', (row['client_name'], row['po_number'], row['vehicle_number'], row['driver_name'], row['client_location'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], id))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('UPDATE lmd_data SET client_name=?, po_number=?, vehicle_number=?, driver_name=?, client_location=?, vehicle_type=?, booking_person=?, km=?, price_per_km=?, extra_expenses=?, reason=?, total_amount=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, date=?, time=? WHERE id=?', (row['client_name'], row['po_number'], row['vehicle_number'], row['driver_name'], row['client_location'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], id))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_fmd_data', methods=['PUT'])
 def update_fmd_data():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE fmd_data SET vendor_name=?, vendor_location=?, vehicle_number=?, driver_name=?, po_number=?, items=?, vehicle_type=?, booking_person=?, km=?, price_per_km=?, extra_expenses=?, reason=?, total_amount=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, date=?, time=? WHERE id=?', (row['vendor_name'], row['vendor_location'], row['vehicle_number'], row['driver_name'], row['po_number'], row['items'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], id))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('UPDATE fmd_data SET vendor_name=?, vendor_location=?, vehicle_number=?, driver_name=?, po_number=?, items=?, vehicle_type=?, booking_person=?, km=?, price_per_km=?, extra_expenses=?, reason=?, total_amount=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, date=?, time=? WHERE id=?', (row['vendor_name'], row['vendor_location'], row['vehicle_number'], row['driver_name'], row['po_number'], row['items'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], id))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/get_filtered_lmd_data', methods=['GET'])
@@ -481,15 +2155,23 @@ def get_filtered_lmd_data():
         if where_clause: where_clause += ' AND '
         where_clause += 'payment_status = ?'
         where_args.append(payment_status)
+    before_id, limit = page_args()
+    if before_id is not None:
+        if where_clause: where_clause += ' AND '
+        where_clause += 'id < ?'
+        where_args.append(before_id)
     conn = get_db()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     query = f'SELECT * FROM lmd_data {f"WHERE {where_clause}" if where_clause else ""} ORDER BY id DESC'
+    if limit:
+        query += ' LIMIT ?'
+        where_args.append(limit)
     cursor.execute(query, where_args)
     rows = cursor.fetchall()
     conn.close()
     results = [dict(row) for row in rows]
-    return jsonify(results)
+    return page_response(results, limit)
 
 @app.route('/get_filtered_fmd_data', methods=['GET'])
 def get_filtered_fmd_data():
@@ -524,26 +2206,33 @@ def get_filtered_fmd_data():
         if where_clause: where_clause += ' AND '
         where_clause += 'payment_status = ?'
         where_args.append(payment_status)
+    before_id, limit = page_args()
+    if before_id is not None:
+        if where_clause: where_clause += ' AND '
+        where_clause += 'id < ?'
+        where_args.append(before_id)
     conn = get_db()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     query = f'SELECT * FROM fmd_data {f"WHERE {where_clause}" if where_clause else ""} ORDER BY id DESC'
+    if limit:
+        query += ' LIMIT ?'
+        where_args.append(limit)
     cursor.execute(query, where_args)
     rows = cursor.fetchall()
     conn.close()
     results = [dict(row) for row in rows]
-    return jsonify(results)
+    return page_response(results, limit)
 
 @app.route('/insert_item', methods=['POST'])
 def insert_item():
     name = request.json['name']
     if not name.strip():
         return jsonify({'error': 'Name cannot be empty'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO items (name) VALUES (?)', (name.strip(),))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('INSERT OR IGNORE INTO items (name) VALUES (?)', (name.strip(),))
+    run_write(write)
+    master_cache.invalidate('items')
     return jsonify({'success': True})
 
 @app.route('/insert_vendor', methods=['POST'])
@@ -553,12 +2242,12 @@ def insert_vendor():
     km = request.json.get('km')
     if not name.strip():
         return jsonify({'error': 'Name cannot be empty'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO vendors (name, location, km) VALUES (?, ?, ?)', (name.strip(), location, km))
-    cursor.execute('INSERT OR IGNORE INTO b_grade_clients (name) VALUES (?)', (name.strip(),))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        # Upsert rather than REPLACE, so the row keeps its id and its delete triggers never need to fire
+        cursor.execute('INSERT INTO vendors (name, location, km) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET location = excluded.location, km = excluded.km', (name.strip(), location, km))
+        cursor.execute('INSERT OR IGNORE INTO b_grade_clients (name) VALUES (?)', (name.strip(),))
+    run_write(write)
+    master_cache.invalidate('vendors', 'b_grade_clients')
     return jsonify({'success': True})
 
 @app.route('/insert_purchase_vendor', methods=['POST'])
@@ -566,22 +2255,20 @@ def insert_purchase_vendor():
     name = request.json['name']
     if not name.strip():
         return jsonify({'error': 'Name cannot be empty'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO purchase_vendors (name) VALUES (?)', (name.strip(),))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('INSERT OR IGNORE INTO purchase_vendors (name) VALUES (?)', (name.strip(),))
+    run_write(write)
+    master_cache.invalidate('purchase_vendors')
     return jsonify({'success': True})
 
 @app.route('/insert_generated_po', methods=['POST'])
 def insert_generated_po():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO generated_pos (product_manager, item_name, po_number, qty_ordered, rate, unit, vendor_name, expected_date, quality_specifications, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['product_manager'], row['item_name'], row['po_number'], row['qty_ordered'], row['rate'], row['unit'], row['vendor_name'], row['expected_date'], row['quality_specifications'], row['note']))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO generated_pos (product_manager, item_name, po_number, qty_ordered, rate, unit, vendor_name, expected_date, quality_specifications, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['product_manager'], row['item_name'], row['po_number'], row['qty_ordered'], row['rate'], row['unit'], row['vendor_name'], row['expected_date'], row['quality_specifications'], row['note']))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/get_latest_generated_pos', methods=['GET'])
 def get_latest_generated_pos():
@@ -622,19 +2309,54 @@ def get_last_so_number():
     conn.close()
     return jsonify({'so_number': result[0] if result else None})
 
-@app.route('/get_available_pos_for_purchase', methods=['GET'])
-def get_available_pos_for_purchase():
+PO_FULFILMENT_SELECT = f"""SELECT g.*, {", ".join(f"f.{column}" for column, _ in PO_FULFILMENT_COLUMNS)}, f.receipts, f.last_received_date,
+    MAX(f.qty_ordered - {PO_RECEIVED.format("f.")}, 0) AS qty_pending,
+    CASE WHEN f.receipts = 0 THEN 'open' WHEN {PO_RECEIVED.format("f.")} < f.qty_ordered THEN 'partial' ELSE 'received' END AS status
+    FROM po_fulfilment f JOIN generated_pos g ON g.id = f.po_id"""
+PO_FULFILMENT_FILTERS = {'vendor': 'g.vendor_name', 'item': 'g.item_name', 'po_number': 'g.po_number', 'expected_date': 'g.expected_date'}
+
+def fetch_po_fulfilment(open_only):
+    before_id, limit = page_args()
+    where_clause = []
+    where_args = []
+    if open_only:
+        # Written to match the partial index condition so only open lines are visited
+        where_clause.append(f'({PO_OPEN_CONDITION.format("f.")})')
+    for arg, column in PO_FULFILMENT_FILTERS.items():
+        value = request.args.get(arg)
+        if value:
+            where_clause.append(f'{column} = ?')
+            where_args.append(value)
+    if request.args.get('expected_from'):
+        where_clause.append('g.expected_date >= ?')
+        where_args.append(request.args['expected_from'])
+    if request.args.get('expected_to'):
+        where_clause.append('g.expected_date <= ?')
+        where_args.append(request.args['expected_to'])
+    if before_id is not None:
+        where_clause.append('f.po_id < ?')
+        where_args.append(before_id)
+    query = f'{PO_FULFILMENT_SELECT} {"WHERE " + " AND ".join(where_clause) if where_clause else ""} ORDER BY f.po_id DESC'
+    if limit:
+        query += f' LIMIT {limit}'
     conn = get_db()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    all_pos = cursor.execute('SELECT * FROM generated_pos').fetchall()
-    used_pos = cursor.execute('SELECT po_number, item FROM purchases').fetchall()
-    used_po_item_set = set(f"{row[0]}|{row[1]}" for row in used_pos)
-    available_pos = [dict(po) for po in all_pos if f"{po['po_number']}|{po['item_name']}" not in used_po_item_set]
+    cursor.execute(query, where_args)
+    results = [dict(row) for row in cursor.fetchall()]
     conn.close()
-    return jsonify(available_pos)
+    return page_response(results, limit)
+
+@app.route('/get_available_pos_for_purchase', methods=['GET'])
+def get_available_pos_for_purchase():
+    return fetch_po_fulfilment(open_only=True)
+
+@app.route('/po_fulfilment', methods=['GET'])
+def get_po_fulfilment():
+    return fetch_po_fulfilment(open_only=False)
 
 @app.route('/get_items', methods=['GET'])
+@cached_list('items')
 def get_items():
     conn = get_db()
     cursor = conn.cursor()
@@ -653,6 +2375,7 @@ def get_purchased_items():
     return jsonify(results)
 
 @app.route('/get_vendors', methods=['GET'])
+@cached_list('vendors')
 def get_vendors():
     conn = get_db()
     cursor = conn.cursor()
@@ -662,6 +2385,7 @@ def get_vendors():
     return jsonify(results)
 
 @app.route('/get_vendors_with_details', methods=['GET'])
+@cached_list('vendors')
 def get_vendors_with_details():
     conn = get_db()
     conn.row_factory = sqlite3.Row
@@ -673,6 +2397,7 @@ def get_vendors_with_details():
     return jsonify(results)
 
 @app.route('/get_purchase_vendors', methods=['GET'])
+@cached_list('purchase_vendors')
 def get_purchase_vendors():
     conn = get_db()
     cursor = conn.cursor()
@@ -682,6 +2407,7 @@ def get_purchase_vendors():
     return jsonify(results)
 
 @app.route('/get_b_grade_clients', methods=['GET'])
+@cached_list('b_grade_clients')
 def get_b_grade_clients():
     conn = get_db()
     cursor = conn.cursor()
@@ -696,44 +2422,34 @@ def delete_multiple_entries():
     ids = request.json['ids']
     if not ids:
         return jsonify({'deleted': 0})
-    conn = get_db()
-    cursor = conn.cursor()
-    placeholders = ','.join('?' * len(ids))
-    cursor.execute(f'DELETE FROM {table_name} WHERE id IN ({placeholders})', ids)
-    conn.commit()
-    conn.close()
-    return jsonify({'deleted': cursor.rowcount})
+    def write(cursor):
+        placeholders = ','.join('?' * len(ids))
+        cursor.execute(f'DELETE FROM {table_name} WHERE id IN ({placeholders})', ids)
+        return cursor.rowcount
+    count = run_write(write)
+    return jsonify({'deleted': count})
 
 @app.route('/insert_lmd_data', methods=['POST'])
 def insert_lmd_data():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO lmd_data (client_name, po_number, vehicle_number, driver_name, client_location, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['client_name'], row['po_number'], row['vehicle_number'], row['driver_name'], row['client_location'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], row.get('ctrl_date')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO lmd_data (client_name, po_number, vehicle_number, driver_name, client_location, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['client_name'], row['po_number'], row['vehicle_number'], row['driver_name'], row['client_location'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], row.get('ctrl_date')))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/insert_fmd_data', methods=['POST'])
 def insert_fmd_data():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO fmd_data (vendor_name, vendor_location, vehicle_number, driver_name, po_number, items, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['vendor_name'], row['vendor_location'], row['vehicle_number'], row['driver_name'], row['po_number'], row['items'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], row.get('ctrl_date')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO fmd_data (vendor_name, vendor_location, vehicle_number, driver_name, po_number, items, vehicle_type, booking_person, km, price_per_km, extra_expenses, reason, total_amount, payment_status, mode_of_payment, amount_paid, amount_due, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row['vendor_name'], row['vendor_location'], row['vehicle_number'], row['driver_name'], row['po_number'], row['items'], row['vehicle_type'], row['booking_person'], row['km'], row['price_per_km'], row['extra_expenses'], row['reason'], row['total_amount'], row['payment_status'], row['mode_of_payment'], row['amount_paid'], row['amount_due'], row['date'], row['time'], row.get('ctrl_date')))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/get_all_lmd_data', methods=['GET'])
 def get_all_lmd_data():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM lmd_data ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('lmd_data')
 
 @app.route('/get_latest_lmd_data', methods=['GET'])
 def get_latest_lmd_data():
@@ -748,14 +2464,7 @@ def get_latest_lmd_data():
 
 @app.route('/get_all_fmd_data', methods=['GET'])
 def get_all_fmd_data():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM fmd_data ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('fmd_data')
 
 @app.route('/get_latest_fmd_data', methods=['GET'])
 def get_latest_fmd_data():
@@ -770,14 +2479,7 @@ def get_latest_fmd_data():
 
 @app.route('/get_all_purchases', methods=['GET'])
 def get_all_purchases():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM purchases ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('purchases')
 
 @app.route('/get_latest_purchases', methods=['GET'])
 def get_latest_purchases():
@@ -792,36 +2494,15 @@ def get_latest_purchases():
 
 @app.route('/get_all_stock_updates', methods=['GET'])
 def get_all_stock_updates():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM stock_updates ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('stock_updates')
 
 @app.route('/get_all_b_grade_sales', methods=['GET'])
 def get_all_b_grade_sales():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM b_grade_sales ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('b_grade_sales')
 
 @app.route('/get_all_sales', methods=['GET'])
 def get_all_sales():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM sales ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('sales')
 
 @app.route('/get_waitlisted_sales', methods=['GET'])
 def get_waitlisted_sales():
@@ -847,44 +2528,56 @@ def get_latest_sales():
 
 @app.route('/insert_sale', methods=['POST'])
 def insert_sale():
+    return insert_row('sales', request.json)
+
+@app.route('/insert_sale_batch', methods=['POST'])
+def insert_sale_batch():
+    return insert_batch('sales', request.json)
+
+@app.route('/insert_sale_to_waitlist', methods=['POST'])
+def insert_sale_to_waitlist():
     row = request.json
+    def write(cursor):
+        cursor.execute('INSERT INTO sales_waitlist (item, clint, po_number, quantity, unit, pcs, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('clint'), row.get('po_number'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag')))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
+
+@app.route('/trace/<tag>', methods=['GET'])
+def trace_tag(tag):
+    # Lot genealogy for one crate tag: receipt, grading, then every movement out, each an indexed lookup
     conn = get_db()
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    query = '''INSERT INTO sales
-               (item, clint, po_number, quantity, unit, pcs, date, time, item_tag, payment_status, mode_of_payment, amount_paid, amount_due, rate, total_value)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
-    params = (
-        row.get('item'),
-        row.get('clint'),
-        row.get('po_number'),
-        row.get('quantity'),
-        row.get('unit'),
-        row.get('pcs'),
-        row.get('date'),
-        row.get('time'),
-        row.get('item_tag'),
-        row.get('payment_status', 'Unpaid'),
-        row.get('mode_of_payment'),
-        row.get('amount_paid', 0.0),
-        row.get('amount_due', 0.0),
-        row.get('rate', 0.0),
-        row.get('total_value', 0.0)
-    )
-    cursor.execute(query, params)
-    conn.commit()
-    last_id = cursor.lastrowid
+    results = {'tag': tag}
+    for table in TAGGED_TABLES:
+        cursor.execute(f'SELECT * FROM {table} WHERE item_tag = ? ORDER BY id', (tag,))
+        results[table] = [dict(row) for row in cursor.fetchall()]
+    cursor.execute('SELECT t.grade, t.po_number AS tag_po_number, t.qty, t.pcs, s.* FROM stock_update_tags t JOIN stock_updates s ON s.id = t.stock_update_id WHERE t.tag = ? ORDER BY s.id', (tag,))
+    results['stock_updates'] = [dict(row) for row in cursor.fetchall()]
+    # Tagged vendor returns are found by their tag; untagged ones only through the PO lines the tag was received on
+    cursor.execute('SELECT * FROM vendor_rejections WHERE item_tag = ? ORDER BY id', (tag,))
+    vendor_rejections = [dict(row) for row in cursor.fetchall()]
+    for po_number, item in {(row['po_number'], row['item']) for row in results['purchases'] if row['po_number']}:
+        cursor.execute("SELECT * FROM vendor_rejections WHERE po_number = ? AND item = ? AND COALESCE(item_tag, '') = '' ORDER BY id", (po_number, item))
+        vendor_rejections.extend(dict(row) for row in cursor.fetchall())
+    results['vendor_rejections'] = sorted(vendor_rejections, key=lambda row: row['id'])
     conn.close()
-    return jsonify({'id': last_id})
+    return jsonify(results)
 
-@app.route('/insert_sale_to_waitlist', methods=['POST'])
-def insert_sale_to_waitlist():
-    row = request.json
+@app.route('/get_available_tags_for_item', methods=['GET'])
+def get_available_tags_for_item():
+    # Tags of the item with stock left, oldest receipt first (FIFO); with_balance=1 returns the quantities too
+    item_name = request.args.get('item_name')
     conn = get_db()
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO sales_waitlist (item, clint, po_number, quantity, unit, pcs, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('clint'), row.get('po_number'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag')))
-    conn.commit()
+    cursor.execute(f'SELECT tag, received, dispatched, received - dispatched AS balance, first_date FROM tag_balances WHERE item = ? AND {TAG_OPEN_CONDITION} ORDER BY first_date, tag', (item_name,))
+    rows = cursor.fetchall()
     conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    if request.args.get('with_balance') == '1':
+        return jsonify([dict(row) for row in rows])
+    return jsonify([row['tag'] for row in rows])
 
 @app.route('/get_purchased_tags_for_item', methods=['GET'])
 def get_purchased_tags_for_item():
@@ -899,23 +2592,14 @@ def get_purchased_tags_for_item():
 @app.route('/delete_waitlisted_sale', methods=['DELETE'])
 def delete_waitlisted_sale():
     id = request.json['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM sales_waitlist WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('DELETE FROM sales_waitlist WHERE id = ?', (id,))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/get_all_rejection_received', methods=['GET'])
 def get_all_rejection_received():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM rejection_received ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('rejection_received')
 
 @app.route('/get_latest_rejection_received', methods=['GET'])
 def get_latest_rejection_received():
@@ -931,23 +2615,15 @@ def get_latest_rejection_received():
 @app.route('/insert_rejection_received', methods=['POST'])
 def insert_rejection_received():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO rejection_received (client_name, item, po_number, item_tag, quantity, unit, pcs, sample_quantity, reason, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row.get('client_name'), row.get('item'), row.get('po_number'), row.get('item_tag'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('sample_quantity'), row.get('reason'), row.get('date'), row.get('time'), row.get('ctrl_date')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO rejection_received (client_name, item, po_number, item_tag, quantity, unit, pcs, sample_quantity, reason, date, time, ctrl_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row.get('client_name'), row.get('item'), row.get('po_number'), row.get('item_tag'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('sample_quantity'), row.get('reason'), row.get('date'), row.get('time'), row.get('ctrl_date')))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/get_all_vendor_rejections', methods=['GET'])
 def get_all_vendor_rejections():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM vendor_rejections ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('vendor_rejections')
 
 @app.route('/get_latest_vendor_rejections', methods=['GET'])
 def get_latest_vendor_rejections():
@@ -963,23 +2639,15 @@ def get_latest_vendor_rejections():
 @app.route('/insert_vendor_rejection', methods=['POST'])
 def insert_vendor_rejection():
     row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO vendor_rejections (item, vendor, po_number, quantity_sent, unit, pcs, date, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('vendor'), row.get('po_number'), row.get('quantity_sent'), row.get('unit'), row.get('pcs'), row.get('date'), row.get('time')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    def write(cursor):
+        cursor.execute('INSERT INTO vendor_rejections (item, vendor, po_number, quantity_sent, unit, pcs, date, time, item_tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('vendor'), row.get('po_number'), row.get('quantity_sent'), row.get('unit'), row.get('pcs'), row.get('date'), row.get('time'), row.get('item_tag')))
+        return cursor.lastrowid
+    last_id = run_write(write)
+    return jsonify({'id': last_id})
 
 @app.route('/get_all_dump_sales', methods=['GET'])
 def get_all_dump_sales():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM dump_sales ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('dump_sales')
 
 @app.route('/get_latest_dump_sales', methods=['GET'])
 def get_latest_dump_sales():
@@ -994,34 +2662,23 @@ def get_latest_dump_sales():
 
 @app.route('/insert_dump_sale', methods=['POST'])
 def insert_dump_sale():
-    row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO dump_sales (item, quantity, unit, pcs, item_tag, date, time) VALUES (?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'), row.get('date'), row.get('time')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    return insert_row('dump_sales', request.json)
+
+@app.route('/insert_dump_sale_batch', methods=['POST'])
+def insert_dump_sale_batch():
+    return insert_batch('dump_sales', request.json)
 
 @app.route('/get_all_mandi_resales', methods=['GET'])
 def get_all_mandi_resales():
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM mandi_resales ORDER BY id DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    results = [dict(row) for row in rows]
-    return jsonify(results)
+    return fetch_history_page('mandi_resales')
 
 @app.route('/insert_mandi_resale', methods=['POST'])
 def insert_mandi_resale():
-    row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO mandi_resales (item, quantity, unit, pcs, item_tag, date, time) VALUES (?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'), row.get('date'), row.get('time')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    return insert_row('mandi_resales', request.json)
+
+@app.route('/insert_mandi_resale_batch', methods=['POST'])
+def insert_mandi_resale_batch():
+    return insert_batch('mandi_resales', request.json)
 
 @app.route('/get_latest_mandi_resales', methods=['GET'])
 def get_latest_mandi_resales():
@@ -1063,13 +2720,11 @@ def get_po_number_by_tag():
 
 @app.route('/insert_stock_update', methods=['POST'])
 def insert_stock_update():
-    row = request.json
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO stock_updates (item, a_grade_qty, a_grade_unit, pcs_a_grade, b_grade_qty, b_grade_unit, pcs_b_grade, c_grade_qty, c_grade_unit, pcs_c_grade, ungraded_qty, ungraded_unit, pcs_ungraded, dump_qty, dump_unit, pcs_dump, total_qty, date, time, po_number, a_grade_tags, b_grade_tags, c_grade_tags, ungraded_tags, dump_tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('a_grade_qty'), row.get('a_grade_unit'), row.get('pcs_a_grade'), row.get('b_grade_qty'), row.get('b_grade_unit'), row.get('pcs_b_grade'), row.get('c_grade_qty'), row.get('c_grade_unit'), row.get('pcs_c_grade'), row.get('ungraded_qty'), row.get('ungraded_unit'), row.get('pcs_ungraded'), row.get('dump_qty'), row.get('dump_unit'), row.get('pcs_dump'), row.get('total_qty'), row.get('date'), row.get('time'), row.get('po_number'), row.get('a_grade_tags'), row.get('b_grade_tags'), row.get('c_grade_tags'), row.get('ungraded_tags'), row.get('dump_tags')))
-    conn.commit()
-    conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    return insert_row('stock_updates', request.json)
+
+@app.route('/insert_stock_update_batch', methods=['POST'])
+def insert_stock_update_batch():
+    return insert_batch('stock_updates', request.json)
 
 @app.route('/get_single_value', methods=['GET'])
 def get_single_value():
@@ -1100,207 +2755,351 @@ def get_stock_update_total_for_date():
         return jsonify({'error': 'item and chosen_date are required'}), 400
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT SUM(a_grade_qty + b_grade_qty + c_grade_qty + ungraded_qty + dump_qty) as total FROM stock_updates WHERE item = ? AND date = ?', (item, chosen_date))
+    cursor.execute('SELECT closing as total FROM stock_ledger WHERE item = ? AND date = ?', (item, chosen_date))
     result = cursor.fetchone()
     conn.close()
     return jsonify({'total': result[0] if result and result[0] else 0.0})
 
-@app.route('/insert_purchase', methods=['POST'])
-def insert_purchase():
-    row = request.json
+RECONCILE_MAX_DAYS = 366
+
+def _sum_by_item_date(cursor, query, start_date, end_date, items):
+    args = [start_date, end_date]
+    if items:
+        query += f' AND item IN ({",".join("?" * len(items))})'
+        args.extend(items)
+    cursor.execute(query + ' GROUP BY 1, 2', args)
+    return {(row[0], row[1]): row[2] or 0.0 for row in cursor.fetchall()}
+
+@app.route('/inventory/reconcile', methods=['GET'])
+def inventory_reconcile():
+    items = [i for i in request.args.getlist('item') if i]
+    start_date = request.args.get('start_date') or request.args.get('date')
+    end_date = request.args.get('end_date') or start_date
+    if not start_date:
+        return jsonify({'error': 'start_date or date is required'}), 400
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'dates must be in YYYY-MM-DD format'}), 400
+    if end < start:
+        return jsonify({'error': 'end_date must not be before start_date'}), 400
+    if (end - start).days >= RECONCILE_MAX_DAYS:
+        return jsonify({'error': f'date range cannot exceed {RECONCILE_MAX_DAYS} days'}), 400
+    start_date, end_date = start.isoformat(), end.isoformat()
+    previous_date = (start - timedelta(days=1)).isoformat()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    if not items:
+        cursor.execute('SELECT name FROM items ORDER BY name COLLATE NOCASE')
+        items = [row[0] for row in cursor.fetchall()]
+    totals = {}
+    for key, table, column, date_column in RECONCILE_SOURCES:
+        query = f'SELECT item, {date_column}, SUM({column}) FROM {table} WHERE {date_column} BETWEEN ? AND ?'
+        totals[key] = _sum_by_item_date(cursor, query, start_date, end_date, items)
+    stock = _sum_by_item_date(cursor, f'SELECT item, date, SUM({STOCK_TOTAL_EXPR}) FROM stock_updates WHERE date BETWEEN ? AND ?', previous_date, end_date, items)
+    conn.close()
+
+    results = []
+    for item in items:
+        day = start
+        while day <= end:
+            chosen_date = day.isoformat()
+            previous_day = (day - timedelta(days=1)).isoformat()
+            row = {'item': item, 'date': chosen_date, 'stock_previous_day': stock.get((item, previous_day), 0.0)}
+            for key, _, _, _ in RECONCILE_SOURCES:
+                row[key] = totals[key].get((item, chosen_date), 0.0)
+            row['stock_today'] = stock.get((item, chosen_date), 0.0)
+            row['total_qty'] = row['stock_previous_day'] + row['purchase_received'] + row['rejection_received'] - row['vendor_rejection']
+            row['total_consumption'] = row['sales'] + row['dump_sale'] + row['mandi_resale'] + row['b_grade_sales']
+            row['check_stock'] = row['total_qty'] - row['total_consumption'] - row['stock_today']
+            results.append(row)
+            day += timedelta(days=1)
+    return jsonify(results)
+
+@app.route('/inventory/stock_ledger', methods=['GET'])
+def get_stock_ledger():
+    items = [i for i in request.args.getlist('item') if i]
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    where_clause = []
+    where_args = []
+    if items:
+        where_clause.append(f'item IN ({",".join("?" * len(items))})')
+        where_args.extend(items)
+    if start_date:
+        where_clause.append('date >= ?')
+        where_args.append(start_date)
+    if end_date:
+        where_clause.append('date <= ?')
+        where_args.append(end_date)
     conn = get_db()
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO purchases (item, vendor, po_number, qty_receive, unit_receive, pcs_receive, qty_accept, unit_accept, pcs_accept, qty_reject, unit_reject, pcs_reject, reason_for_rejection, date, time, ctrl_date, item_tag, payment_status, mode_of_payment, amount_paid, amount_due, rate, total_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (row.get('item'), row.get('vendor'), row.get('po_number'), row.get('qty_receive'), row.get('unit_receive'), row.get('pcs_receive'), row.get('qty_accept'), row.get('unit_accept'), row.get('pcs_accept'), row.get('qty_reject'), row.get('unit_reject'), row.get('pcs_reject'), row.get('reason_for_rejection'), row.get('date'), row.get('time'), row.get('ctrl_date'), row.get('item_tag'), row.get('payment_status', 'Unpaid'), row.get('mode_of_payment'), row.get('amount_paid', 0.0), row.get('amount_due', 0.0), row.get('rate', 0.0), row.get('total_value', 0.0)))
-    conn.commit()
+    cursor.execute(f'SELECT item, date, inflow, outflow, closing FROM stock_ledger {"WHERE " + " AND ".join(where_clause) if where_clause else ""} ORDER BY item, date', where_args)
+    rows = cursor.fetchall()
     conn.close()
-    return jsonify({'id': cursor.lastrowid})
+    results = [dict(row) for row in rows]
+    return jsonify(results)
+
+ROLLUP_GROUPS = ['item', 'party']
+
+@app.route('/reports/rollup', methods=['GET'])
+def get_rollup():
+    period = request.args.get('period', 'month')
+    if period not in ROLLUP_PERIODS:
+        return jsonify({'error': f'period must be one of {", ".join(ROLLUP_PERIODS)}'}), 400
+    sources = [source for source in request.args.getlist('source') if source]
+    if any(source not in [table for table, *_ in ROLLUP_SOURCES] for source in sources):
+        return jsonify({'error': f'source must be one of {", ".join(table for table, *_ in ROLLUP_SOURCES)}'}), 400
+    group_by = [column for column in request.args.getlist('group_by') if column]
+    if any(column not in ROLLUP_GROUPS for column in group_by):
+        return jsonify({'error': f'group_by must be one of {", ".join(ROLLUP_GROUPS)}'}), 400
+    where_clause = ['period = ?']
+    where_args = [period]
+    if sources:
+        where_clause.append(f'source IN ({",".join("?" * len(sources))})')
+        where_args.extend(sources)
+    for column in ('item', 'party'):
+        value = request.args.get(column)
+        if value:
+            where_clause.append(f'{column} = ?')
+            where_args.append(value)
+    # Dates inside a period select that whole period
+    if request.args.get('start_date'):
+        where_clause.append(f'period_start >= {ROLLUP_PERIODS[period].format("?")}')
+        where_args.append(request.args['start_date'])
+    if request.args.get('end_date'):
+        where_clause.append(f'period_start <= {ROLLUP_PERIODS[period].format("?")}')
+        where_args.append(request.args['end_date'])
+    # Always split by source, since purchase kg and sales kg do not add up to anything meaningful
+    columns = ', '.join(['period_start', 'source', *group_by])
+    sums = ', '.join(f'SUM({measure}) AS {measure}' for measure in [*ROLLUP_MEASURES, 'entries'])
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {columns}, {sums} FROM rollups WHERE {" AND ".join(where_clause)} GROUP BY {columns} ORDER BY {columns}', where_args)
+    rows = cursor.fetchall()
+    conn.close()
+    results = [dict(row) for row in rows]
+    return jsonify(results)
+
+def rebuild_stock_ledger():
+    def write(cursor):
+        for statement in stock_ledger_rebuild():
+            cursor.execute(statement)
+        return cursor.execute('SELECT COUNT(*) FROM stock_ledger').fetchone()[0]
+    return run_write(write)
+
+@app.route('/admin/rebuild_stock_ledger', methods=['POST'])
+def rebuild_stock_ledger_route():
+    return jsonify({'rows': rebuild_stock_ledger()})
+
+@app.cli.command('rebuild-stock-ledger')
+def rebuild_stock_ledger_command():
+    print(f'stock_ledger rebuilt: {rebuild_stock_ledger()} rows')
+
+def rebuild_rollups():
+    def write(cursor):
+        for statement in rollup_rebuild():
+            cursor.execute(statement)
+        return cursor.execute('SELECT COUNT(*) FROM rollups').fetchone()[0]
+    return run_write(write)
+
+@app.route('/admin/rebuild_rollups', methods=['POST'])
+def rebuild_rollups_route():
+    return jsonify({'rows': rebuild_rollups()})
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    print(f'rollups rebuilt: {rebuild_rollups()} rows')
+
+@app.route('/insert_purchase', methods=['POST'])
+def insert_purchase():
+    return insert_row('purchases', request.json)
+
+@app.route('/insert_purchase_batch', methods=['POST'])
+def insert_purchase_batch():
+    return insert_batch('purchases', request.json)
 
 @app.route('/update_purchase', methods=['PUT'])
 def update_purchase():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE purchases SET item=?, vendor=?, po_number=?, qty_receive=?, unit_receive=?, pcs_receive=?, qty_accept=?, unit_accept=?, pcs_accept=?, qty_reject=?, unit_reject=?, pcs_reject=?, reason_for_rejection=?, date=?, time=?, ctrl_date=?, item_tag=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, rate=?, total_value=? WHERE id=?', (row.get('item'), row.get('vendor'), row.get('po_number'), row.get('qty_receive'), row.get('unit_receive'), row.get('pcs_receive'), row.get('qty_accept'), row.get('unit_accept'), row.get('pcs_accept'), row.get('qty_reject'), row.get('unit_reject'), row.get('pcs_reject'), row.get('reason_for_rejection'), row.get('date'), row.get('time'), row.get('ctrl_date'), row.get('item_tag'), row.get('payment_status', 'Unpaid'), row.get('mode_of_payment'), row.get('amount_paid', 0.0), row.get('amount_due', 0.0), row.get('rate', 0.0), row.get('total_value', 0.0), id))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('UPDATE purchases SET item=?, vendor=?, po_number=?, qty_receive=?, unit_receive=?, pcs_receive=?, qty_accept=?, unit_accept=?, pcs_accept=?, qty_reject=?, unit_reject=?, pcs_reject=?, reason_for_rejection=?, date=?, time=?, ctrl_date=?, item_tag=?, payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=?, rate=?, total_value=? WHERE id=?', (row.get('item'), row.get('vendor'), row.get('po_number'), row.get('qty_receive'), row.get('unit_receive'), row.get('pcs_receive'), row.get('qty_accept'), row.get('unit_accept'), row.get('pcs_accept'), row.get('qty_reject'), row.get('unit_reject'), row.get('pcs_reject'), row.get('reason_for_rejection'), row.get('date'), row.get('time'), row.get('ctrl_date'), row.get('item_tag'), row.get('payment_status', 'Unpaid'), row.get('mode_of_payment'), row.get('amount_paid', 0.0), row.get('amount_due', 0.0), row.get('rate', 0.0), row.get('total_value', 0.0), id))
+    run_write(write)
     return jsonify({'success': True})
 
 # ... other update endpoints remain similar but use proper table mappings ...
 
 @app.route('/get_next_item_tag_sequence', methods=['GET'])
 def get_next_item_tag_sequence():
+    # Peeks at the counter; use /allocate_item_tags to reserve tags
     vendor_prefix = request.args.get('vendor_prefix')
     day_part = request.args.get('day_part')
     conn = get_db()
     cursor = conn.cursor()
-    pattern = f'{vendor_prefix}-{day_part}-%'
-    cursor.execute('SELECT item_tag FROM purchases WHERE item_tag LIKE ? ORDER BY id DESC', (pattern,))
-    results = cursor.fetchall()
+    cursor.execute('SELECT next_value FROM tag_sequences WHERE vendor_prefix = ? AND day_part = ?', (vendor_prefix, day_part))
+    result = cursor.fetchone()
     conn.close()
-    if not results:
-        return jsonify({'sequence': 1})
-    for row in results:
-        tag = row[0]
-        if not tag: continue
-        parts = tag.split('-')
-        if len(parts) == 3:
-            try:
-                last_num = int(parts[2])
-                return jsonify({'sequence': last_num + 1})
-            except ValueError:
-                continue
-    return jsonify({'sequence': 1})
+    return jsonify({'sequence': result[0] if result else 1})
+
+@app.route('/allocate_item_tags', methods=['POST'])
+def allocate_item_tags():
+    data = request.json or {}
+    # Taken as sent: the client pads short vendor names, and the counter trigger keys on the tag's prefix unchanged
+    vendor_prefix = data.get('vendor_prefix') or ''
+    day_part = data.get('day_part') or ''
+    count = data.get('count', 1)
+    if not vendor_prefix.strip() or not day_part.strip() or '-' in vendor_prefix or '-' in day_part:
+        return jsonify({'error': 'vendor_prefix and day_part are required and cannot contain "-"'}), 400
+    if not isinstance(count, int) or not 1 <= count <= MAX_BATCH_ROWS:
+        return jsonify({'error': f'count must be between 1 and {MAX_BATCH_ROWS}'}), 400
+    def write(cursor):
+        cursor.execute('INSERT INTO tag_sequences (vendor_prefix, day_part, next_value) VALUES (?, ?, ?) ON CONFLICT (vendor_prefix, day_part) DO UPDATE SET next_value = next_value + ?', (vendor_prefix, day_part, 1 + count, count))
+        cursor.execute('SELECT next_value FROM tag_sequences WHERE vendor_prefix = ? AND day_part = ?', (vendor_prefix, day_part))
+        return cursor.fetchone()[0] - count
+    first = run_write(write)
+    sequences = range(first, first + count)
+    return jsonify({'sequence': first, 'tags': [f'{vendor_prefix}-{day_part}-{sequence:04d}' for sequence in sequences]})
 
 @app.route('/update_stock_update', methods=['PUT'])
 def update_stock_update():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE stock_updates SET 
-            item=?, a_grade_qty=?, a_grade_unit=?, pcs_a_grade=?, 
-            b_grade_qty=?, b_grade_unit=?, pcs_b_grade=?, 
-            c_grade_qty=?, c_grade_unit=?, pcs_c_grade=?, 
-            ungraded_qty=?, ungraded_unit=?, pcs_ungraded=?, 
-            dump_qty=?, dump_unit=?, pcs_dump=?, 
-            total_qty=?, date=?, time=?, po_number=?, 
-            a_grade_tags=?, b_grade_tags=?, c_grade_tags=?, ungraded_tags=?, dump_tags=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('a_grade_qty'), row.get('a_grade_unit'), row.get('pcs_a_grade'),
-        row.get('b_grade_qty'), row.get('b_grade_unit'), row.get('pcs_b_grade'),
-        row.get('c_grade_qty'), row.get('c_grade_unit'), row.get('pcs_c_grade'),
-        row.get('ungraded_qty'), row.get('ungraded_unit'), row.get('pcs_ungraded'),
-        row.get('dump_qty'), row.get('dump_unit'), row.get('pcs_dump'),
-        row.get('total_qty'), row.get('date'), row.get('time'), row.get('po_number'),
-        row.get('a_grade_tags'), row.get('b_grade_tags'), row.get('c_grade_tags'), row.get('ungraded_tags'), row.get('dump_tags'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE stock_updates SET 
+                item=?, a_grade_qty=?, a_grade_unit=?, pcs_a_grade=?, 
+                b_grade_qty=?, b_grade_unit=?, pcs_b_grade=?, 
+                c_grade_qty=?, c_grade_unit=?, pcs_c_grade=?, 
+                ungraded_qty=?, ungraded_unit=?, pcs_ungraded=?, 
+                dump_qty=?, dump_unit=?, pcs_dump=?, 
+                total_qty=?, date=?, time=?, po_number=?, 
+                a_grade_tags=?, b_grade_tags=?, c_grade_tags=?, ungraded_tags=?, dump_tags=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('a_grade_qty'), row.get('a_grade_unit'), row.get('pcs_a_grade'),
+            row.get('b_grade_qty'), row.get('b_grade_unit'), row.get('pcs_b_grade'),
+            row.get('c_grade_qty'), row.get('c_grade_unit'), row.get('pcs_c_grade'),
+            row.get('ungraded_qty'), row.get('ungraded_unit'), row.get('pcs_ungraded'),
+            row.get('dump_qty'), row.get('dump_unit'), row.get('pcs_dump'),
+            row.get('total_qty'), row.get('date'), row.get('time'), row.get('po_number'),
+            row.get('a_grade_tags'), row.get('b_grade_tags'), row.get('c_grade_tags'), row.get('ungraded_tags'), row.get('dump_tags'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_b_grade_sale', methods=['PUT'])
 def update_b_grade_sale():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE b_grade_sales SET 
-            item=?, clint=?, quantity=?, rate=?, unit=?, total_value=?, 
-            date=?, time=?, po_number=?, pcs=?, item_tag=?, 
-            payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('clint'), row.get('quantity'), row.get('rate'), row.get('unit'), row.get('total_value'),
-        row.get('date'), row.get('time'), row.get('po_number'), row.get('pcs'), row.get('item_tag'),
-        row.get('payment_status'), row.get('mode_of_payment'), row.get('amount_paid'), row.get('amount_due'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE b_grade_sales SET 
+                item=?, clint=?, quantity=?, rate=?, unit=?, total_value=?, 
+                date=?, time=?, po_number=?, pcs=?, item_tag=?, 
+                payment_status=?, mode_of_payment=?, amount_paid=?, amount_due=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('clint'), row.get('quantity'), row.get('rate'), row.get('unit'), row.get('total_value'),
+            row.get('date'), row.get('time'), row.get('po_number'), row.get('pcs'), row.get('item_tag'),
+            row.get('payment_status'), row.get('mode_of_payment'), row.get('amount_paid'), row.get('amount_due'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_sale', methods=['PUT'])
 def update_sale():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE sales SET 
-            item=?, clint=?, po_number=?, quantity=?, unit=?, pcs=?, 
-            date=?, time=?, item_tag=?, payment_status=?, mode_of_payment=?, 
-            amount_paid=?, amount_due=?, rate=?, total_value=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('clint'), row.get('po_number'), row.get('quantity'), row.get('unit'), row.get('pcs'),
-        row.get('date'), row.get('time'), row.get('item_tag'), row.get('payment_status'), row.get('mode_of_payment'),
-        row.get('amount_paid'), row.get('amount_due'), row.get('rate'), row.get('total_value'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE sales SET 
+                item=?, clint=?, po_number=?, quantity=?, unit=?, pcs=?, 
+                date=?, time=?, item_tag=?, payment_status=?, mode_of_payment=?, 
+                amount_paid=?, amount_due=?, rate=?, total_value=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('clint'), row.get('po_number'), row.get('quantity'), row.get('unit'), row.get('pcs'),
+            row.get('date'), row.get('time'), row.get('item_tag'), row.get('payment_status'), row.get('mode_of_payment'),
+            row.get('amount_paid'), row.get('amount_due'), row.get('rate'), row.get('total_value'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_rejection_received', methods=['PUT'])
 def update_rejection_received():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE rejection_received SET 
-            client_name=?, item=?, po_number=?, item_tag=?, quantity=?, unit=?, pcs=?, 
-            sample_quantity=?, reason=?, date=?, time=?, ctrl_date=? 
-        WHERE id=?
-    ''', (
-        row.get('client_name'), row.get('item'), row.get('po_number'), row.get('item_tag'), row.get('quantity'), row.get('unit'), row.get('pcs'),
-        row.get('sample_quantity'), row.get('reason'), row.get('date'), row.get('time'), row.get('ctrl_date'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE rejection_received SET 
+                client_name=?, item=?, po_number=?, item_tag=?, quantity=?, unit=?, pcs=?, 
+                sample_quantity=?, reason=?, date=?, time=?, ctrl_date=? 
+            WHERE id=?
+        ''', (
+            row.get('client_name'), row.get('item'), row.get('po_number'), row.get('item_tag'), row.get('quantity'), row.get('unit'), row.get('pcs'),
+            row.get('sample_quantity'), row.get('reason'), row.get('date'), row.get('time'), row.get('ctrl_date'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_vendor_rejection', methods=['PUT'])
 def update_vendor_rejection():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE vendor_rejections SET 
-            item=?, vendor=?, po_number=?, quantity_sent=?, unit=?, pcs=?, date=?, time=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('vendor'), row.get('po_number'), row.get('quantity_sent'), row.get('unit'), row.get('pcs'),
-        row.get('date'), row.get('time'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE vendor_rejections SET 
+                item=?, vendor=?, po_number=?, quantity_sent=?, unit=?, pcs=?, date=?, time=?, item_tag=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('vendor'), row.get('po_number'), row.get('quantity_sent'), row.get('unit'), row.get('pcs'),
+            row.get('date'), row.get('time'), row.get('item_tag'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_dump_sale', methods=['PUT'])
 def update_dump_sale():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE dump_sales SET 
-            item=?, quantity=?, unit=?, pcs=?, item_tag=?, date=?, time=?, po_number=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'),
-        row.get('date'), row.get('time'), row.get('po_number'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE dump_sales SET 
+                item=?, quantity=?, unit=?, pcs=?, item_tag=?, date=?, time=?, po_number=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'),
+            row.get('date'), row.get('time'), row.get('po_number'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_mandi_resale', methods=['PUT'])
 def update_mandi_resale():
     row = request.json
     id = row['id']
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE mandi_resales SET 
-            item=?, quantity=?, unit=?, pcs=?, item_tag=?, date=?, time=? 
-        WHERE id=?
-    ''', (
-        row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'),
-        row.get('date'), row.get('time'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE mandi_resales SET 
+                item=?, quantity=?, unit=?, pcs=?, item_tag=?, date=?, time=? 
+            WHERE id=?
+        ''', (
+            row.get('item'), row.get('quantity'), row.get('unit'), row.get('pcs'), row.get('item_tag'),
+            row.get('date'), row.get('time'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_so_item', methods=['PUT'])
@@ -1309,20 +3108,18 @@ def update_so_item():
     id = row.get('id')
     if not id:
         return jsonify({'error': 'id is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE so_items SET 
-            item_name=?, quantity_kg=?, quantity_pcs=? 
-        WHERE id=?
-    ''', (
-        row.get('item_name'),
-        row.get('quantity_kg'),
-        row.get('quantity_pcs'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE so_items SET 
+                item_name=?, quantity_kg=?, quantity_pcs=? 
+            WHERE id=?
+        ''', (
+            row.get('item_name'),
+            row.get('quantity_kg'),
+            row.get('quantity_pcs'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_po_item', methods=['PUT'])
@@ -1331,28 +3128,26 @@ def update_po_item():
     id = row.get('id')
     if not id:
         return jsonify({'error': 'id is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE generated_pos SET 
-            product_manager=?, po_number=?, item_name=?, qty_ordered=?, unit=?, 
-            rate=?, vendor_name=?, expected_date=?, quality_specifications=?, note=? 
-        WHERE id=?
-    ''', (
-        row.get('product_manager'),
-        row.get('po_number'),
-        row.get('item_name'),
-        row.get('qty_ordered'),
-        row.get('unit'),
-        row.get('rate'),
-        row.get('vendor_name'),
-        row.get('expected_date'),
-        row.get('quality_specifications'),
-        row.get('note'),
-        id
-    ))
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('''
+            UPDATE generated_pos SET 
+                product_manager=?, po_number=?, item_name=?, qty_ordered=?, unit=?, 
+                rate=?, vendor_name=?, expected_date=?, quality_specifications=?, note=? 
+            WHERE id=?
+        ''', (
+            row.get('product_manager'),
+            row.get('po_number'),
+            row.get('item_name'),
+            row.get('qty_ordered'),
+            row.get('unit'),
+            row.get('rate'),
+            row.get('vendor_name'),
+            row.get('expected_date'),
+            row.get('quality_specifications'),
+            row.get('note'),
+            id
+        ))
+    run_write(write)
     return jsonify({'success': True})
 
 @app.route('/update_so', methods=['PUT'])
@@ -1362,36 +3157,47 @@ def update_so():
     id = row.get('id') or row.get('so_id')
     if not id:
         return jsonify({'error': 'id or so_id is required'}), 400
-    conn = get_db()
-    cursor = conn.cursor()
-    # Update the generated_so record
-    cursor.execute('''
-        UPDATE generated_sos SET 
-            client_name=?, so_number=?, date_of_dispatch=? 
-        WHERE id=?
-    ''', (
-        row.get('client_name'), 
-        row.get('so_number'), 
-        row.get('date_of_dispatch'),
-        id
-    ))
+    def write(cursor):
+        # Update the generated_so record
+        cursor.execute('''
+            UPDATE generated_sos SET 
+                client_name=?, so_number=?, date_of_dispatch=? 
+            WHERE id=?
+        ''', (
+            row.get('client_name'), 
+            row.get('so_number'), 
+            row.get('date_of_dispatch'),
+            id
+        ))
     
-    # Update the items if provided
-    if 'items' in row and row['items']:
-        # Delete existing items for this SO
-        cursor.execute('DELETE FROM so_items WHERE so_id = ?', (id,))
-        # Insert new items
-        for item in row['items']:
-            cursor.execute('''
-                INSERT INTO so_items (so_id, item_name, quantity_kg, quantity_pcs) 
-                VALUES (?, ?, ?, ?)
-            ''', (id, item.get('item_name'), item.get('quantity_kg'), item.get('quantity_pcs')))
+        # Update the items if provided
+        if 'items' in row and row['items']:
+            # Delete existing items for this SO
+            cursor.execute('DELETE FROM so_items WHERE so_id = ?', (id,))
+            # Insert new items
+            for item in row['items']:
+                cursor.execute('''
+                    INSERT INTO so_items (so_id, item_name, quantity_kg, quantity_pcs) 
+                    VALUES (?, ?, ?, ?)
+                ''', (id, item.get('item_name'), item.get('quantity_kg'), item.get('quantity_pcs')))
     
-    conn.commit()
-    conn.close()
+    run_write(write)
     return jsonify({'success': True})
 
-init_db()
+def create_app(database=None, pool_size=None, init=True):
+    # Entry point for WSGI servers (see gunicorn.conf.py); call once per process, after any fork.
+    # init=False skips init_db() when a parent process has already run it.
+    global db_path, db_pool
+    if database or pool_size:
+        writer.stop()
+        close_db_pool()
+        db_path = database or db_path
+        db_pool = ConnectionPool(db_path, pool_size or DB_POOL_SIZE)
+        master_cache.clear()
+    if init:
+        init_db()
+    return app
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)), debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
+
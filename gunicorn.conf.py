@@ -0,0 +1,35 @@
+# Production serving for flask_api.py:
+#   gunicorn -c gunicorn.conf.py
+# Tune with WEB_CONCURRENCY (worker processes), WEB_THREADS (threads per worker),
+# PORT and WAREHOUSE_DB_PATH. SQLite allows one writer at a time; WAL mode and the
+# pool's busy_timeout let every worker read in parallel while writes queue briefly.
+import multiprocessing
+import os
+
+# Workers skip init_db(); on_starting has already run it once in the master
+wsgi_app = 'flask_api:create_app(init=False)'
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Every open /events stream holds one of these threads for up to five minutes. Streams are capped per
+# worker at a quarter of the threads (WAREHOUSE_EVENTS_MAX_STREAMS overrides it) and answered with 503
+# beyond that, so the remaining threads always serve normal requests.
+os.environ.setdefault('WAREHOUSE_EVENTS_MAX_STREAMS', str(max(1, threads // 4)))
+worker_class = 'gthread'
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Each worker must open its own SQLite connections after the fork, so the app is not preloaded
+preload_app = False
+
+
+def on_starting(server):
+    # Create tables and run migrations once in the master before any worker starts
+    import flask_api
+    flask_api.init_db()
+
+
+def worker_exit(server, worker):
+    import flask_api
+    flask_api.writer.stop()
+    flask_api.close_db_pool()
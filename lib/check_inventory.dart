@@ -46,6 +46,18 @@ Future<double> getStockUpdateTotalForDate({required String item, required String
   }
 }
 
+Future<Map<String, dynamic>> getInventoryReconcile({required String item, required String chosenDate}) async {
+  final queryParams = {'item': item, 'date': chosenDate};
+  final uri = Uri.parse('$apiBaseUrl/inventory/reconcile').replace(queryParameters: queryParams);
+  final response = await http.get(uri);
+  if (response.statusCode == 200) {
+    final data = json.decode(response.body) as List<dynamic>;
+    return data.isNotEmpty ? Map<String, dynamic>.from(data.first) : {};
+  } else {
+    throw Exception('Failed to reconcile inventory');
+  }
+}
+
 class CheckInventory extends StatefulWidget {
   const CheckInventory({super.key});  @override
   State<CheckInventory> createState() => _CheckInventoryState();
@@ -117,18 +129,18 @@ class _CheckInventoryState extends State<CheckInventory> {
     try {
       final item = _selectedItem!;
       final date = DateFormat('yyyy-MM-dd').format(_selectedDate!);
-      final previousDate = DateFormat('yyyy-MM-dd').format(_selectedDate!.subtract(const Duration(days: 1)));
-
-      // ✅ 1. 'qty_accept' की जगह 'qty_receive' कर दिया गया है
-      final purchaseReceived = await getSingleValue(table: 'purchases', column: 'qty_receive', where: 'item = ? AND ctrl_date = ?', whereArgs: [item, date]);
-      final rejectionReceived = await getSingleValue(table: 'rejection_received', column: 'quantity', where: 'item = ? AND ctrl_date = ?', whereArgs: [item, date]);
-      final vendorRejectionQty = await getSingleValue(table: 'vendor_rejections', column: 'quantity_sent', where: 'item = ? AND date = ?', whereArgs: [item, date]);
-      final salesQty = await getSingleValue(table: 'sales', column: 'quantity', where: 'item = ? AND date = ?', whereArgs: [item, date]);
-      final dumpSaleQty = await getSingleValue(table: 'dump_sales', column: 'quantity', where: 'item = ? AND date = ?', whereArgs: [item, date]);
-      final mandiResaleQty = await getSingleValue(table: 'mandi_resales', column: 'quantity', where: 'item = ? AND date = ?', whereArgs: [item, date]);
-      final bGradeSalesQty = await getSingleValue(table: 'b_grade_sales', column: 'quantity', where: 'item = ? AND date = ?', whereArgs: [item, date]);
-      final stockUpdateTodayVal = await getStockUpdateTotalForDate(item: item, chosenDate: date);
-      final stockUpdatePreviousDayVal = await getStockUpdateTotalForDate(item: item, chosenDate: previousDate);
+      // ✅ सभी वैल्यूज एक ही रिक्वेस्ट में सर्वर से
+      final reconcile = await getInventoryReconcile(item: item, chosenDate: date);
+      double value(String key) => (reconcile[key] as num?)?.toDouble() ?? 0.0;
+      final purchaseReceived = value('purchase_received');
+      final rejectionReceived = value('rejection_received');
+      final vendorRejectionQty = value('vendor_rejection');
+      final salesQty = value('sales');
+      final dumpSaleQty = value('dump_sale');
+      final mandiResaleQty = value('mandi_resale');
+      final bGradeSalesQty = value('b_grade_sales');
+      final stockUpdateTodayVal = value('stock_today');
+      final stockUpdatePreviousDayVal = value('stock_previous_day');
 
       // ✅ 2. गणना में 'purchaseAccepted' की जगह 'purchaseReceived' का उपयोग
       final totalQty = stockUpdatePreviousDayVal + purchaseReceived + rejectionReceived - vendorRejectionQty;
@@ -259,7 +259,7 @@ class _MandiResaleState extends State<MandiResale> {
                       });
                       if (val != 'Other') {
                         try {
-                          final response = await http.get(Uri.parse('$apiBaseUrl/get_purchased_tags_for_item?item_name=$val'));
+                          final response = await http.get(Uri.parse('$apiBaseUrl/get_available_tags_for_item?item_name=$val'));
                           if (response.statusCode == 200 && mounted && resaleItems.contains(resaleItem)) {
                             List<String> tags = List<String>.from(json.decode(response.body));
                             if (tags.isNotEmpty) {
@@ -81,12 +81,12 @@ class _Page1State extends State<Page1> {
     setState(() => _isLoading = true);
 
     try {
-      final response = await http.get(Uri.parse('$baseUrl/get_available_pos_for_purchase'));
+      // Only POs with Expected Date >= Today
+      final String todayStr = DateFormat('yyyy-MM-dd').format(DateTime.now());
+      final response = await http.get(Uri.parse('$baseUrl/get_available_pos_for_purchase?expected_from=$todayStr'));
       if (response.statusCode == 200) {
         final List<Map<String, dynamic>> dbPOs = List<Map<String, dynamic>>.from(json.decode(response.body));
 
-        // Filter POs: Only those with Expected Date >= Today
-        final String todayStr = DateFormat('yyyy-MM-dd').format(DateTime.now());
         final List<Map<String, dynamic>> filteredPOs = dbPOs.where((po) {
           String? expDate = po['expected_date'];
           if (expDate == null) return false;
@@ -201,13 +201,15 @@ class _Page1State extends State<Page1> {
     String dayPart = DateFormat('dd').format(dateToUse);
     
     try {
-      final response = await http.get(Uri.parse('$baseUrl/get_next_item_tag_sequence?vendor_prefix=$vendorPrefix&day_part=$dayPart'));
+      final response = await http.post(
+        Uri.parse('$baseUrl/allocate_item_tags'),
+        headers: {'Content-Type': 'application/json'},
+        body: json.encode({'vendor_prefix': vendorPrefix, 'day_part': dayPart, 'count': 1}),
+      );
       if (response.statusCode == 200) {
         final data = json.decode(response.body);
-        int sequence = data['sequence'];
-        String paddedSequence = sequence.toString().padLeft(4, '0');
         setState(() {
-          item.itemTagController.text = "$vendorPrefix-$dayPart-$paddedSequence";
+          item.itemTagController.text = data['tags'][0];
         });
       } else {
         ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text("Failed to generate tag")));
@@ -60,7 +60,7 @@ Future<void> insertSaleToWaitlist(Map<String, dynamic> data) async {
 
 Future<List<String>> getPurchasedTagsForItem(String itemName) async {
   final queryParams = {'item_name': itemName};
-  final uri = Uri.parse('$apiBaseUrl/get_purchased_tags_for_item').replace(queryParameters: queryParams);
+  final uri = Uri.parse('$apiBaseUrl/get_available_tags_for_item').replace(queryParameters: queryParams);
   final response = await http.get(uri);
   if (response.statusCode == 200) {
     return List<String>.from(json.decode(response.body));
@@ -0,0 +1,28 @@
+import pytest
+
+import flask_api
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = flask_api.create_app(str(tmp_path / 'warehouse.db'))
+    app.config['TESTING'] = True
+    yield app
+    flask_api.writer.stop()
+    flask_api.close_db_pool()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def query(app):
+    def run(sql, params=()):
+        conn = flask_api.db_pool.acquire()
+        try:
+            return conn.cursor().execute(sql, params).fetchall()
+        finally:
+            conn.close()
+    return run
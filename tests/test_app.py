@@ -0,0 +1,21 @@
+import flask_api
+
+
+def test_init_db_rerun_changes_nothing(app, query):
+    version = query('PRAGMA user_version')[0][0]
+    logged = query('SELECT COUNT(*) FROM change_log')[0][0]
+    vendors = query('SELECT id, name, location, km FROM vendors ORDER BY id')
+    flask_api.init_db()
+    assert query('PRAGMA user_version')[0][0] == version == flask_api.MIGRATIONS[-1][0]
+    assert query('SELECT COUNT(*) FROM change_log')[0][0] == logged
+    assert query('SELECT id, name, location, km FROM vendors ORDER BY id') == vendors
+
+
+def test_create_app_without_init_leaves_schema_alone(tmp_path, app):
+    path = str(tmp_path / 'fresh.db')
+    flask_api.create_app(path, init=False)
+    conn = flask_api.db_pool.acquire()
+    try:
+        assert conn.cursor().execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,97 @@
+import flask_api
+
+SALE = {'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'}
+
+
+def items(result):
+    return [row['item'] for row in result['body']]
+
+
+def test_reads_come_back_in_request_order(client):
+    client.post('/insert_sale', json=SALE)
+    client.post('/insert_sale', json=dict(SALE, item='Fig'))
+    results = client.post('/batch', json=[
+        {'path': '/get_all_sales', 'args': {'limit': 1}},
+        {'path': '/get_items'},
+        {'path': '/get_all_sales?item=Kiwi'},
+    ]).json
+    assert [result['status'] for result in results] == [200, 200, 200]
+    assert items(results[0]) == ['Fig'] and results[0]['headers'] == {'X-Next-Before-Id': '2'}
+    assert items(results[2]) == ['Kiwi']
+
+
+def test_mixed_batches_run_in_order_in_one_transaction(client):
+    results = client.post('/batch', json=[
+        {'path': '/get_all_sales'},
+        {'method': 'POST', 'path': '/insert_sale', 'body': SALE},
+        {'path': '/get_all_sales'},
+    ]).json
+    assert [result['status'] for result in results] == [200, 200, 200]
+    assert items(results[0]) == [] and items(results[2]) == ['Kiwi']
+
+
+def test_writes_see_earlier_writes_in_the_batch(client):
+    so = {'so_data': {'client_name': 'A', 'so_number': 'SO-1', 'date_of_dispatch': '2025-01-02'}, 'items_data': [{'item_name': 'Kiwi', 'quantity_kg': 5, 'quantity_pcs': 0}]}
+    results = client.post('/batch', json=[
+        {'method': 'POST', 'path': '/insert_generated_so', 'body': so},
+        {'method': 'POST', 'path': '/insert_sale', 'body': dict(SALE, po_number='SO-1', quantity=2)},
+        {'path': '/get_available_sos_for_sale'},
+    ]).json
+    assert [(row['so_number'], row['pending_kg']) for row in results[2]['body']] == [('SO-1', 3)]
+
+
+def test_a_failed_write_rolls_back_the_batch(client, query):
+    results = client.post('/batch', json=[
+        {'method': 'POST', 'path': '/insert_sale', 'body': SALE},
+        {'method': 'POST', 'path': '/insert_generated_so', 'body': {'so_data': {}}},
+        {'method': 'POST', 'path': '/insert_sale', 'body': SALE},
+    ]).json
+    assert [result['status'] for result in results] == [409, 500, 409]
+    results = client.post('/batch', json=[
+        {'method': 'POST', 'path': '/insert_sale', 'body': SALE},
+        {'method': 'DELETE', 'path': '/delete_so', 'body': {}},
+    ]).json
+    assert [result['status'] for result in results] == [409, 400]
+    assert query('SELECT COUNT(*) FROM sales') == [(0,)]
+    assert client.post('/insert_sale', json=SALE).status_code == 200
+
+
+def test_unroutable_sub_requests(client):
+    results = client.post('/batch', json=[
+        {'path': '/nope'},
+        {'method': 'GET', 'path': '/insert_sale'},
+        {'path': '/events'},
+        {'path': '/get_items'},
+    ]).json
+    assert [result['status'] for result in results] == [404, 405, 400, 200]
+
+
+def test_malformed_batches_are_rejected(client):
+    assert client.post('/batch', json={}).status_code == 400
+    assert client.post('/batch', json=[]).status_code == 400
+    assert client.post('/batch', json=[{'path': 'get_items'}]).status_code == 400
+    assert client.post('/batch', json=[{'path': '/get_items'}] * (flask_api.BATCH_MAX_REQUESTS + 1)).status_code == 400
+
+
+def test_sync_inside_a_write_batch_sees_the_batch(client):
+    since = client.get('/sync').json['version']
+    results = client.post('/batch', json=[
+        {'method': 'POST', 'path': '/insert_sale', 'body': SALE},
+        {'path': '/sync', 'args': {'since': since}},
+    ]).json
+    assert [result['status'] for result in results] == [200, 200]
+    assert items({'body': results[1]['body']['changes']['sales']}) == ['Kiwi']
+    assert client.get('/sync', query_string={'since': since}).json['changes']['sales'][0]['item'] == 'Kiwi'
+
+
+def test_an_aborted_batch_leaves_nothing_in_the_cache(client):
+    results = client.post('/batch', json=[
+        {'method': 'POST', 'path': '/insert_item', 'body': {'name': 'Ghost'}},
+        {'path': '/get_items'},
+        {'method': 'DELETE', 'path': '/delete_so', 'body': {}},
+    ]).json
+    assert [result['status'] for result in results] == [409, 409, 400]
+    flask_api.run_write(lambda cursor: cursor.execute("INSERT INTO items (name) VALUES ('Real')"))
+    names = client.get('/get_items').get_data(as_text=True)
+    assert 'Real' in names and 'Ghost' not in names
+
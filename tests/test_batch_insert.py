@@ -0,0 +1,24 @@
+import flask_api
+
+
+def test_batch_reports_bad_rows_and_inserts_the_rest(client):
+    rows = [{'item': 'Kiwi', 'qty_receive': 1, 'ctrl_date': '2025-01-02', 'item_tag': f'T-{n}'} for n in range(3)] + [5, {'qty_receive': 1}]
+    assert client.post('/insert_purchase_batch', json=rows).json == {
+        'inserted': 3, 'ids': [1, 2, 3, None, None],
+        'errors': [{'index': 3, 'error': 'Row must be a JSON object'}, {'index': 4, 'error': 'item is required'}],
+    }
+    assert client.get('/get_all_purchases').json[0]['payment_status'] == 'Unpaid'
+
+
+def test_batch_falls_back_to_per_row_inserts_on_a_failing_row(client):
+    conn = flask_api.db_pool.acquire()
+    conn.execute("CREATE TRIGGER reject_negative BEFORE INSERT ON sales WHEN NEW.quantity < 0 BEGIN SELECT RAISE(ABORT, 'negative'); END")
+    conn.commit()
+    conn.close()
+    result = client.post('/insert_sale_batch', json=[{'item': 'Kiwi', 'quantity': 1}, {'item': 'Kiwi', 'quantity': -1}, {'item': 'Kiwi', 'quantity': 2}]).json
+    assert result == {'inserted': 2, 'ids': [1, None, 2], 'errors': [{'index': 1, 'error': 'negative'}]}
+    assert [row['quantity'] for row in client.get('/get_all_sales').json] == [2, 1]
+
+
+def test_batch_body_must_be_a_list(client):
+    assert client.post('/insert_sale_batch', json={'item': 'Kiwi'}).status_code == 400
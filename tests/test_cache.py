@@ -0,0 +1,37 @@
+import flask_api
+
+
+def aging_keys():
+    return [key for key in flask_api.master_cache._entries if key[0] == 'get_payment_aging']
+
+
+def test_report_parameter_sets_are_cached_side_by_side(client):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'vendor': 'V', 'qty_receive': 1, 'date': '2025-01-01', 'payment_status': 'Unpaid', 'total_value': 100})
+    early = client.get('/reports/payment_aging', query_string={'as_of': '2025-01-10'})
+    late = client.get('/reports/payment_aging', query_string={'as_of': '2025-06-01'})
+    assert early.get_data() != late.get_data()
+    assert len(aging_keys()) == 2
+    assert client.get('/reports/payment_aging', query_string={'as_of': '2025-01-10'}).get_data() == early.get_data()
+    assert client.get('/reports/payment_aging', query_string={'as_of': '2025-06-01'}).get_data() == late.get_data()
+
+
+def test_writes_drop_cached_entries(client):
+    assert client.get('/get_items').status_code == 200
+    client.post('/insert_item', json={'name': 'Dragonfruit'})
+    assert 'Dragonfruit' in client.get('/get_items').get_data(as_text=True)
+
+
+def test_cache_holds_a_bounded_number_of_entries():
+    cache = flask_api.ListCache(max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, ('items',), b'[]', 'v', cache.generation)
+    assert cache.get('a', 'v') is None
+    assert cache.get('b', 'v') and cache.get('c', 'v')
+
+
+def test_master_list_is_served_from_cache_with_an_etag(client):
+    first = client.get('/get_vendors_with_details')
+    assert client.get('/get_vendors_with_details', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    client.post('/insert_vendor', json={'name': 'Qwarto Foods', 'location': 'Pune', 'km': 12})
+    second = client.get('/get_vendors_with_details', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200 and 'Qwarto Foods' in second.get_data(as_text=True)
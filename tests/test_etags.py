@@ -0,0 +1,24 @@
+import gzip
+import json
+
+
+def test_etag_changes_only_when_the_table_does(client):
+    etag = client.get('/get_all_sales').headers['ETag']
+    assert client.get('/get_all_sales', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/insert_purchase', json={'item': 'Kiwi'})
+    assert client.get('/get_all_sales', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1})
+    assert client.get('/get_all_sales', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_gzip_response_has_its_own_etag(client):
+    client.post('/insert_sale_batch', json=[{'item': 'Kiwi', 'quantity': n} for n in range(40)])
+    response = client.get('/get_all_sales', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].endswith('-gzip"')
+    assert len(json.loads(gzip.decompress(response.data))) == 40
+    assert client.get('/get_all_sales', headers={'If-None-Match': response.headers['ETag'], 'Accept-Encoding': 'gzip'}).status_code == 304
+
+
+def test_streams_are_not_compressed(client):
+    assert 'Content-Encoding' not in client.get('/get_all_sales?format=ndjson', headers={'Accept-Encoding': 'gzip'}).headers
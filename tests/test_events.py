@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+import flask_api
+
+
+@pytest.fixture(autouse=True)
+def short_streams(monkeypatch):
+    monkeypatch.setattr(flask_api, 'EVENTS_MAX_SECONDS', 1)
+    monkeypatch.setattr(flask_api, 'EVENTS_POLL_SECONDS', 0.05)
+
+
+def read_events(response, count):
+    # Parse 'event:'/'data:' blocks off the stream until `count` events have arrived
+    events, buffer = [], ''
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        *blocks, buffer = buffer.split('\n\n')
+        for block in blocks:
+            fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line and not line.startswith(':'))
+            if 'event' in fields:
+                events.append(fields)
+        if len(events) >= count:
+            break
+    response.close()
+    return events
+
+
+def add_sales(client, *items):
+    for item in items:
+        client.post('/insert_sale', json={'item': item, 'quantity': 1, 'date': '2025-01-01'})
+
+
+def test_resume_from_since_replays_later_changes(client):
+    add_sales(client, 'Kiwi')
+    since = client.get('/sync').json['version']
+    add_sales(client, 'Fig', 'Melon')
+    events = read_events(client.get('/events', query_string={'since': since}, buffered=False), 3)
+    assert events[0]['event'] == 'ready' and events[0]['id'] == str(since)
+    assert [event['event'] for event in events[1:]] == ['change', 'change']
+    assert int(events[-1]['id']) > int(events[1]['id']) > since
+
+
+def test_last_event_id_header_resumes(client):
+    add_sales(client, 'Kiwi', 'Fig')
+    events = read_events(client.get('/events', headers={'Last-Event-ID': '1'}, buffered=False), 2)
+    assert events[0]['id'] == '1'
+    assert int(events[1]['id']) > 1
+
+
+def test_table_filter(client):
+    client.post('/insert_item', json={'name': 'Starfruit'})
+    add_sales(client, 'Kiwi')
+    events = read_events(client.get('/events', query_string={'since': 0, 'table': 'items'}, buffered=False), 2)
+    assert '"table": "items"' in events[1]['data']
+    assert client.get('/events', query_string={'table': 'nope'}).status_code == 400
+
+
+def test_a_live_write_is_pushed(client, app):
+    response = client.get('/events', buffered=False)
+    threading.Timer(0.1, lambda: add_sales(app.test_client(), 'Kiwi')).start()
+    events = read_events(response, 2)
+    assert events[1]['event'] == 'change'
+
+
+def test_streams_beyond_the_cap_get_503(client, monkeypatch):
+    monkeypatch.setattr(flask_api, 'events_slots', threading.BoundedSemaphore(1))
+    first = client.get('/events', buffered=False)
+    second = client.get('/events', buffered=False)
+    assert second.status_code == 503
+    assert second.headers['Retry-After'] == '10'
+    assert second.get_data(as_text=True).startswith('retry: ')
+    first.close()
+    third = client.get('/events', buffered=False)
+    assert third.status_code == 200
+    third.close()
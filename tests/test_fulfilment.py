@@ -0,0 +1,88 @@
+import flask_api
+
+
+def add_po(client, po_number, qty, unit, item='Kiwi'):
+    client.post('/insert_generated_po', json={'product_manager': 'A', 'item_name': item, 'po_number': po_number, 'qty_ordered': qty, 'rate': 1, 'unit': unit, 'vendor_name': 'V', 'expected_date': '2025-01-01', 'quality_specifications': '', 'note': ''})
+
+
+def receive(client, po_number, qty, pcs, item='Kiwi'):
+    client.post('/insert_purchase', json={'item': item, 'vendor': 'V', 'po_number': po_number, 'qty_receive': qty, 'pcs_receive': pcs, 'date': '2025-01-01'})
+
+
+def open_pos(client):
+    return {row['po_number']: (row['status'], row['qty_pending']) for row in client.get('/get_available_pos_for_purchase').json}
+
+
+def test_pcs_po_is_measured_in_pieces(client):
+    add_po(client, 'PO-P', 10, 'pcs')
+    receive(client, 'PO-P', 50, 4)
+    assert open_pos(client) == {'PO-P': ('partial', 6)}
+    receive(client, 'PO-P', 5, 6)
+    assert open_pos(client) == {}
+    assert client.get('/po_fulfilment').json[0]['status'] == 'received'
+
+
+def test_kg_po_is_measured_by_quantity(client):
+    add_po(client, 'PO-K', 10, 'kg')
+    receive(client, 'PO-K', 4, 40)
+    assert open_pos(client) == {'PO-K': ('partial', 6)}
+    receive(client, 'PO-K', 6, 0)
+    assert open_pos(client) == {}
+
+
+def test_open_po_query_uses_the_partial_index(app, query):
+    plan = [row[3] for row in query(f'EXPLAIN QUERY PLAN SELECT po_id FROM po_fulfilment f WHERE {flask_api.PO_OPEN_CONDITION.format("f.")}')]
+    assert any('idx_po_fulfilment_open' in step for step in plan)
+
+
+def test_po_rebuild_matches_the_triggers(client, query):
+    add_po(client, 'PO-P', 10, 'pcs')
+    add_po(client, 'PO-K', 10, 'kg', item='Fig')
+    receive(client, 'PO-P', 50, 4)
+    receive(client, 'PO-K', 3, 0, item='Fig')
+    maintained = query('SELECT * FROM po_fulfilment ORDER BY po_id')
+    flask_api.run_write(lambda cursor: [cursor.execute(statement) for statement in flask_api.po_fulfilment_rebuild()])
+    assert query('SELECT * FROM po_fulfilment ORDER BY po_id') == maintained
+
+
+def test_migration_adds_by_pcs_to_an_existing_table(client, query):
+    add_po(client, 'PO-P', 10, 'pcs')
+    receive(client, 'PO-P', 50, 10)
+
+    def downgrade(cursor):
+        # The table as migration 4 first created it, before by_pcs
+        cursor.execute('DROP TABLE po_fulfilment')
+        cursor.execute('CREATE TABLE po_fulfilment (po_id INTEGER PRIMARY KEY, qty_ordered REAL NOT NULL DEFAULT 0, qty_received REAL NOT NULL DEFAULT 0, qty_accepted REAL NOT NULL DEFAULT 0, qty_rejected REAL NOT NULL DEFAULT 0, pcs_received REAL NOT NULL DEFAULT 0, pcs_accepted REAL NOT NULL DEFAULT 0, pcs_rejected REAL NOT NULL DEFAULT 0, receipts INTEGER NOT NULL DEFAULT 0, last_received_date TEXT)')
+        cursor.execute('PRAGMA user_version = 15')
+    flask_api.run_write(downgrade)
+    flask_api.init_db()
+    assert query('SELECT by_pcs, pcs_received, receipts FROM po_fulfilment') == [(1, 10, 1)]
+    assert open_pos(client) == {}
+
+
+def add_so(client, so_number, lines):
+    items = [{'item_name': item, 'quantity_kg': kg, 'quantity_pcs': pcs} for item, kg, pcs in lines]
+    client.post('/insert_generated_so', json={'so_data': {'client_name': 'A', 'so_number': so_number, 'date_of_dispatch': '2025-01-02'}, 'items_data': items})
+
+
+def sell(client, so_number, item, kg, pcs):
+    client.post('/insert_sale', json={'item': item, 'po_number': so_number, 'quantity': kg, 'pcs': pcs, 'date': '2025-01-02'})
+
+
+def open_lines(client):
+    return {(row['so_number'], row['item_name']): (row['pending_kg'], row['pending_pcs']) for row in client.get('/get_available_sos_for_sale').json}
+
+
+def test_so_lines_close_on_the_dimension_they_were_ordered_in(client):
+    add_so(client, 'SO-1', [('Kiwi', 10, 0), ('Melon', 0, 5), ('Fig', 4, 2)])
+    sell(client, 'SO-1', 'Kiwi', 10, 0)
+    sell(client, 'SO-1', 'Melon', 30, 5)
+    sell(client, 'SO-1', 'Fig', 4, 0)
+    assert open_lines(client) == {('SO-1', 'Fig'): (0, 2)}
+    sell(client, 'SO-1', 'Fig', 0, 2)
+    assert open_lines(client) == {}
+
+
+def test_open_so_query_uses_the_partial_index(app, query):
+    plan = [row[3] for row in query(f'EXPLAIN QUERY PLAN SELECT so_id FROM so_fulfilment f WHERE {flask_api.SO_OPEN_CONDITION.format("f.")}')]
+    assert any('idx_so_fulfilment_open' in step for step in plan)
@@ -0,0 +1,3 @@
+def test_filtered_queries_use_their_indexes(client):
+    report = client.get('/admin/check_indexes').json
+    assert report['ok'], [query for query in report['queries'] if not query['uses_index']]
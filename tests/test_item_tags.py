@@ -0,0 +1,44 @@
+import threading
+
+import flask_api
+
+
+def test_sequence_starts_after_existing_tags(client):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'item_tag': 'VE-07-0012', 'date': '2025-01-07'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'item_tag': 'bad-tag', 'date': '2025-01-07'})
+    assert client.get('/get_next_item_tag_sequence?vendor_prefix=VE&day_part=07').json == {'sequence': 13}
+    assert client.post('/allocate_item_tags', json={'vendor_prefix': 'VE', 'day_part': '07', 'count': 2}).json == {'sequence': 13, 'tags': ['VE-07-0013', 'VE-07-0014']}
+    assert client.get('/get_next_item_tag_sequence?vendor_prefix=VE&day_part=07').json == {'sequence': 15}
+
+
+def test_allocate_rejects_a_bad_count(client):
+    assert client.post('/allocate_item_tags', json={'vendor_prefix': 'AB', 'day_part': '01', 'count': 0}).status_code == 400
+
+
+def test_concurrent_allocations_never_repeat_a_tag(app):
+    tags = []
+
+    def allocate():
+        worker = app.test_client()
+        for _ in range(10):
+            tags.extend(worker.post('/allocate_item_tags', json={'vendor_prefix': 'ZZ', 'day_part': '02', 'count': 2}).json['tags'])
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(tags) == len(set(tags)) == 80
+
+
+def test_rebuild_seeds_counters_from_purchase_tags(client, query):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'item_tag': 'VE-07-0003', 'date': '2025-01-07'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'item_tag': 'VE-07-0011', 'date': '2025-01-07'})
+    flask_api.run_write(lambda cursor: [cursor.execute(statement) for statement in flask_api.tag_sequence_rebuild()])
+    assert query('SELECT vendor_prefix, day_part, next_value FROM tag_sequences') == [('VE', '07', 12)]
+
+
+def test_padded_prefix_continues_the_existing_counter(client, query):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'item_tag': 'B -26-0001', 'date': '2025-01-26'})
+    result = client.post('/allocate_item_tags', json={'vendor_prefix': 'B ', 'day_part': '26'}).json
+    assert result == {'sequence': 2, 'tags': ['B -26-0002']}
+    assert query('SELECT vendor_prefix, next_value FROM tag_sequences') == [('B ', 3)]
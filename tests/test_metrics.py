@@ -0,0 +1,34 @@
+import pytest
+
+import flask_api
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(flask_api, 'metrics', flask_api.Metrics())
+
+
+def metric_lines(client):
+    return client.get('/metrics').get_data(as_text=True).splitlines()
+
+
+def test_nothing_is_collected_before_the_first_scrape(client):
+    client.get('/get_all_purchases')
+    assert not any(line.startswith('http_requests_total{endpoint="get_all_purchases"') for line in metric_lines(client))
+
+
+def test_requests_and_statements_are_counted_per_endpoint(client):
+    metric_lines(client)
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 1, 'date': '2025-01-01'})
+    client.get('/get_all_purchases')
+    lines = metric_lines(client)
+    assert 'http_requests_total{endpoint="insert_purchase",method="POST",status="200"} 1' in lines
+    assert 'sqlite_statement_duration_seconds_count{endpoint="insert_purchase",statement="INSERT"} 1' in lines
+    assert any(line.startswith('sqlite_rows_fetched_total{endpoint="get_all_purchases"}') for line in lines)
+    assert any(line.startswith('sqlite_write_queue_wait_seconds_count{endpoint="insert_purchase"}') for line in lines)
+
+
+def test_metrics_are_prometheus_text(client):
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert any(line.startswith('# TYPE http_request_duration_seconds histogram') for line in response.get_data(as_text=True).splitlines())
@@ -0,0 +1,24 @@
+def test_keyset_pages_and_filters(client):
+    for day in range(1, 8):
+        client.post('/insert_sale', json={'item': 'Kiwi' if day % 2 == 0 else 'Apple', 'quantity': 1, 'date': f'2025-01-0{day}'})
+    first = client.get('/get_all_sales?limit=3')
+    assert [row['id'] for row in first.json] == [7, 6, 5]
+    assert first.headers['X-Next-Before-Id'] == '5'
+    second = client.get('/get_all_sales?limit=3&before_id=5')
+    assert [row['id'] for row in second.json] == [4, 3, 2]
+    filtered = client.get('/get_all_sales', query_string={'item': 'Kiwi', 'start_date': '2025-01-03'})
+    assert [row['id'] for row in filtered.json] == [6, 4]
+
+
+def test_last_page_has_no_cursor(client):
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'})
+    response = client.get('/get_all_sales?limit=5')
+    assert len(response.json) == 1 and 'X-Next-Before-Id' not in response.headers
+
+
+def test_so_pages_keep_their_items_together(client):
+    for number in range(3):
+        client.post('/insert_generated_so', json={'so_data': {'client_name': 'B2B', 'so_number': f'SO{number}', 'date_of_dispatch': '2025-01-01'}, 'items_data': [{'item_name': 'Kiwi', 'quantity_kg': 1, 'quantity_pcs': 0}, {'item_name': 'Apple', 'quantity_kg': 1, 'quantity_pcs': 0}]})
+    response = client.get('/get_all_generated_sos_with_items?limit=2')
+    assert [row['so_id'] for row in response.json] == [3, 3, 2, 2]
+    assert response.headers['X-Next-Before-Id'] == '2'
@@ -0,0 +1,25 @@
+import threading
+
+import flask_api
+
+
+def test_connections_use_wal_and_return_to_the_pool(client, query):
+    assert query('PRAGMA journal_mode')[0][0] == 'wal'
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 1, 'date': '2025-01-01'})
+    idle = flask_api.db_pool._idle.qsize()
+    client.get('/get_all_purchases')
+    assert flask_api.db_pool._idle.qsize() == idle
+
+
+def test_concurrent_writes_and_reads(app, client):
+    def work():
+        worker = app.test_client()
+        for _ in range(20):
+            assert worker.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'}).status_code == 200
+            worker.get('/get_all_sales')
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(client.get('/get_all_sales').json) == 80
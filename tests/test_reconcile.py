@@ -0,0 +1,12 @@
+def test_reconcile_one_item_over_a_range(client):
+    client.post('/insert_stock_update', json={'item': 'Kiwi', 'a_grade_qty': 5, 'b_grade_qty': 0, 'c_grade_qty': 0, 'ungraded_qty': 0, 'dump_qty': 0, 'date': '2025-01-01'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 10, 'ctrl_date': '2025-01-02', 'date': '2025-01-02'})
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-02'})
+    rows = client.get('/inventory/reconcile', query_string={'item': 'Kiwi', 'start_date': '2025-01-02', 'end_date': '2025-01-03'}).json
+    assert [row['date'] for row in rows] == ['2025-01-02', '2025-01-03']
+    day = rows[0]
+    assert (day['stock_previous_day'], day['purchase_received'], day['sales'], day['total_qty'], day['check_stock']) == (5, 10, 3, 15, 12)
+
+
+def test_reconcile_rejects_bad_dates(client):
+    assert client.get('/inventory/reconcile?date=bad').status_code == 400
@@ -0,0 +1,23 @@
+import flask_api
+
+
+def test_rebuild_matches_the_trigger_maintained_rollups(client, query):
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 4, 'date': '2025-01-01'})
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 6, 'date': '2025-01-20'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'vendor': 'V', 'qty_receive': 9, 'date': '2025-02-03'})
+    maintained = query('SELECT * FROM rollups ORDER BY 1, 2, 3, 4, 5')
+    flask_api.run_write(lambda cursor: cursor.execute('DELETE FROM rollups'))
+    assert client.post('/admin/rebuild_rollups').json == {'rows': len(maintained)}
+    assert query('SELECT * FROM rollups ORDER BY 1, 2, 3, 4, 5') == maintained
+
+
+def test_monthly_sales_rollup(client):
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 4, 'date': '2025-01-01'})
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 6, 'date': '2025-01-20'})
+    rows = client.get('/reports/rollup', query_string={'period': 'month', 'source': 'sales', 'group_by': 'item'}).json
+    assert [(row['period_start'], row['item'], row['kg'], row['entries']) for row in rows] == [('2025-01-01', 'Kiwi', 10, 2)]
+
+
+def test_rebuild_command(app):
+    result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+    assert result.exit_code == 0 and 'rollups rebuilt' in result.output
@@ -0,0 +1,47 @@
+import flask_api
+
+
+def refs(query, kind, term):
+    rows = query('SELECT refs FROM search_terms WHERE kind = ? AND term = ?', (kind, term))
+    return rows[0][0] if rows else None
+
+
+def test_seeded_vendor_refs_survive_init_db_rerun(app, query):
+    assert refs(query, 'vendor', 'ZOMATO LUDHIANA') == 1
+    flask_api.init_db()
+    flask_api.init_db()
+    assert refs(query, 'vendor', 'ZOMATO LUDHIANA') == 1
+
+
+def test_vendor_reinsert_keeps_refs_and_delete_removes_term(client, query):
+    client.post('/insert_vendor', json={'name': 'Qwarto Foods', 'location': 'A', 'km': 5})
+    vendor_id = query("SELECT id FROM vendors WHERE name = 'Qwarto Foods'")[0][0]
+    client.post('/insert_vendor', json={'name': 'Qwarto Foods', 'location': 'B', 'km': 7})
+    assert query("SELECT id, location FROM vendors WHERE name = 'Qwarto Foods'") == [(vendor_id, 'B')]
+    assert refs(query, 'vendor', 'Qwarto Foods') == 1
+
+    client.delete('/delete_vendor', json={'name': 'Qwarto Foods', 'password': '1008'})
+    assert refs(query, 'vendor', 'Qwarto Foods') is None
+    assert client.get('/search', query_string={'q': 'Qwarto', 'kind': 'vendor'}).json == []
+
+
+def test_search_finds_prefix_and_substring(client):
+    client.post('/insert_item', json={'name': 'Papaya'})
+    prefix = client.get('/search', query_string={'q': 'Pap', 'kind': 'item'}).json
+    assert [hit['term'] for hit in prefix] == ['Papaya']
+    inner = client.get('/search', query_string={'q': 'aya', 'kind': 'item'}).json
+    assert 'Papaya' in [hit['term'] for hit in inner]
+
+
+def test_substring_filter_matches_fts_once(app, query):
+    clause, args = flask_api.search_contains('po_number', 'po_number', 'PO-1')
+    plan = [row[3] for row in query(f'EXPLAIN QUERY PLAN SELECT * FROM generated_pos WHERE {clause}', args)]
+    scans = [detail for detail in plan if 'search_fts' in detail or ' t ' in f' {detail} ']
+    assert 'search_fts' in scans[0]
+
+
+def test_po_number_filter_uses_search_terms(client):
+    for number in ('PO-1001', 'PO-1002', 'PO-2001'):
+        client.post('/insert_generated_po', json={'product_manager': 'A', 'item_name': 'Kiwi', 'po_number': number, 'qty_ordered': 1, 'rate': 1, 'unit': 'Kg', 'vendor_name': 'V', 'expected_date': '2025-01-01', 'quality_specifications': '', 'note': ''})
+    rows = client.get('/get_all_generated_pos', query_string={'po_number': '-100'}).json
+    assert sorted(row['po_number'] for row in rows) == ['PO-1001', 'PO-1002']
@@ -0,0 +1,40 @@
+import json
+import logging
+import os
+
+import pytest
+
+import flask_api
+
+
+@pytest.fixture
+def slow_log(tmp_path, monkeypatch):
+    # Everything counts as slow, logged to a scratch file
+    log = flask_api.SlowQueryLog(0.000001, str(tmp_path / 'slow.log'))
+    monkeypatch.setattr(flask_api, 'slow_log', log)
+    yield log
+    logger = logging.getLogger('warehouse.slow_queries')
+    for handler in list(logger.handlers):
+        handler.close()
+        logger.removeHandler(handler)
+
+
+def logged(log):
+    with open(log.path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_executemany_is_timed_as_one_statement(app, client, slow_log):
+    rows = [{'item': 'Kiwi', 'quantity': quantity, 'date': '2025-01-01'} for quantity in range(3)]
+    assert client.post('/insert_sale_batch', json=rows).status_code == 200
+    inserts = [entry for entry in logged(slow_log) if entry['sql'].startswith('INSERT INTO sales')]
+    assert inserts[0]['executions'] == 3
+    summary = client.get('/admin/slow_queries', query_string={'order_by': 'count'}).json
+    assert any(query['sql'].startswith('INSERT INTO sales') for query in summary['queries'])
+
+
+def test_log_is_reopened_after_external_rotation(app, client, slow_log):
+    client.get('/get_items')
+    os.rename(slow_log.path, slow_log.path + '.1')
+    client.get('/get_all_sales')
+    assert any('FROM sales' in entry['sql'] for entry in logged(slow_log))
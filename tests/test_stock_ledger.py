@@ -0,0 +1,53 @@
+import flask_api
+
+
+def ledger(client, item=None):
+    return [(row['date'], row['item'], row['inflow'], row['outflow'], row['closing']) for row in client.get('/inventory/stock_ledger', query_string={'item': item} if item else {}).json]
+
+
+def test_ledger_follows_inserts_updates_and_deletes(client):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 10, 'ctrl_date': '2025-01-02', 'date': '2025-01-02'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 4, 'ctrl_date': '2025-01-02', 'date': '2025-01-02'})
+    sale = client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-02'}).json['id']
+    client.post('/insert_stock_update', json={'item': 'Kiwi', 'a_grade_qty': 5, 'b_grade_qty': 1, 'c_grade_qty': 0, 'ungraded_qty': 0, 'dump_qty': 0, 'date': '2025-01-02'})
+    assert ledger(client, 'Kiwi') == [('2025-01-02', 'Kiwi', 14, 3, 6)]
+    client.put('/update_sale', json={'id': sale, 'item': 'Kiwi', 'quantity': 2, 'date': '2025-01-03'})
+    client.delete('/delete_multiple_entries', json={'table_name': 'purchases', 'ids': [1]})
+    assert ledger(client) == [('2025-01-02', 'Kiwi', 4, 0, 6), ('2025-01-03', 'Kiwi', 0, 2, 0)]
+
+
+def test_rebuild_matches_the_triggers(client, query):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'qty_receive': 10, 'ctrl_date': '2025-01-02', 'date': '2025-01-02'})
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-03'})
+    maintained = query('SELECT * FROM stock_ledger ORDER BY 1, 2')
+    conn = flask_api.db_pool.acquire()
+    conn.execute('DELETE FROM stock_ledger')
+    conn.commit()
+    conn.close()
+    assert client.post('/admin/rebuild_stock_ledger').json == {'rows': len(maintained)}
+    assert query('SELECT * FROM stock_ledger ORDER BY 1, 2') == maintained
+
+
+def test_ledger_rows_are_recomputed_not_adjusted(client, query):
+    ids = [client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': quantity, 'date': '2025-01-02'}).json['id'] for quantity in (0.1, 0.2)]
+    client.delete('/delete_multiple_entries', json={'table_name': 'sales', 'ids': ids[:1]})
+    assert query('SELECT outflow FROM stock_ledger') == [(0.2,)]
+
+
+def test_a_day_with_no_entries_left_is_dropped(client, query):
+    sale = client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-02'}).json['id']
+    client.put('/update_sale', json={'id': sale, 'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-03'})
+    assert query('SELECT date FROM stock_ledger') == [('2025-01-03',)]
+    client.delete('/delete_multiple_entries', json={'table_name': 'sales', 'ids': [sale]})
+    assert query('SELECT COUNT(*) FROM stock_ledger') == [(0,)]
+
+
+def test_migration_clears_rows_left_by_delta_triggers(client, query):
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'date': '2025-01-02'})
+
+    def downgrade(cursor):
+        cursor.execute("INSERT INTO stock_ledger (item, date) VALUES ('Fig', '2025-01-01')")
+        cursor.execute('PRAGMA user_version = 17')
+    flask_api.run_write(downgrade)
+    flask_api.init_db()
+    assert query('SELECT item, date, outflow FROM stock_ledger') == [('Kiwi', '2025-01-02', 3)]
@@ -0,0 +1,31 @@
+import json
+
+import flask_api
+
+
+def add_sales(count):
+    conn = flask_api.db_pool.acquire()
+    conn.executemany('INSERT INTO sales (item, quantity, date) VALUES (?, ?, ?)', [('Kiwi', 1, '2025-01-01')] * count)
+    conn.commit()
+    conn.close()
+
+
+def test_ndjson_export_streams_every_row(client):
+    add_sales(1203)
+    response = client.get('/get_all_sales?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.decode().splitlines()
+    assert len(lines) == 1203 and json.loads(lines[0])['id'] == 1203
+
+
+def test_json_stream_is_a_valid_array(client):
+    assert json.loads(client.get('/get_all_purchases?format=json_stream').data) == []
+    add_sales(5)
+    assert len(json.loads(client.get('/get_all_sales?format=json_stream&limit=3').data)) == 3
+
+
+def test_stream_returns_its_connection(client):
+    client.get('/get_all_sales')
+    idle = flask_api.db_pool._idle.qsize()
+    client.get('/get_all_sales?format=ndjson').data
+    assert flask_api.db_pool._idle.qsize() == idle
@@ -0,0 +1,80 @@
+import sqlite3
+
+import flask_api
+
+
+def sync(client, since, **args):
+    return client.get('/sync', query_string={'since': since, **args}).json
+
+
+def test_sync_without_since_asks_for_a_reset(client):
+    body = client.get('/sync').json
+    assert body['reset'] is True
+    assert body['changes'] == {} and body['deleted'] == {}
+
+
+def test_sync_returns_changed_rows_and_tombstones(client):
+    version = client.get('/sync').json['version']
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'})
+    client.post('/insert_sale', json={'item': 'Fig', 'quantity': 2, 'date': '2025-01-01'})
+    body = sync(client, version)
+    assert [row['item'] for row in body['changes']['sales']] == ['Kiwi', 'Fig']
+    assert body['deleted'] == {}
+
+    client.delete('/delete_multiple_entries', json={'table_name': 'sales', 'ids': [1]})
+    after = sync(client, body['version'])
+    assert after['changes'] == {}
+    assert after['deleted'] == {'sales': [1]}
+
+
+def test_deleting_an_so_tombstones_its_items(client):
+    version = client.get('/sync').json['version']
+    so = {'so_data': {'client_name': 'A', 'so_number': 'SO1', 'date_of_dispatch': '2025-01-02'}, 'items_data': [{'item_name': 'Kiwi', 'quantity_kg': 1, 'quantity_pcs': 0}, {'item_name': 'Fig', 'quantity_kg': 2, 'quantity_pcs': 0}]}
+    first = client.post('/insert_generated_so', json=so).json['so_id']
+    second = client.post('/insert_generated_so', json=so).json['so_id']
+    client.delete('/delete_so', json={'id': first})
+    client.delete('/delete_multiple_entries', json={'table_name': 'generated_sos', 'ids': [second]})
+    body = sync(client, version)
+    assert body['deleted'] == {'generated_sos': [first, second], 'so_items': [1, 2, 3, 4]}
+
+
+def test_vendor_reinsert_syncs_as_an_update_of_the_same_row(client, query):
+    client.post('/insert_vendor', json={'name': 'Qwarto Foods', 'location': 'A', 'km': 5})
+    version = client.get('/sync').json['version']
+    client.post('/insert_vendor', json={'name': 'Qwarto Foods', 'location': 'B', 'km': 7})
+    flask_api.init_db()
+    body = sync(client, version)
+    vendor_id = query("SELECT id FROM vendors WHERE name = 'Qwarto Foods'")[0][0]
+    assert [(row['id'], row['location']) for row in body['changes']['vendors']] == [(vendor_id, 'B')]
+    assert body['deleted'] == {}
+
+
+def test_pruned_since_asks_for_a_reset(client):
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'})
+    version = client.get('/sync').json['version']
+    client.post('/insert_sale', json={'item': 'Fig', 'quantity': 1, 'date': '2025-01-01'})
+    assert client.post('/admin/prune_change_log', json={'days': 0}).json['deleted'] > 0
+    assert sync(client, version)['reset'] is True
+
+
+def test_sync_pages_and_filters_by_table(client):
+    version = client.get('/sync').json['version']
+    for quantity in range(3):
+        client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': quantity, 'date': '2025-01-01'})
+    client.post('/insert_item', json={'name': 'Kiwi'})
+    page = sync(client, version, table='sales', limit=2)
+    assert page['more'] is True and len(page['changes']['sales']) == 2
+    rest = sync(client, page['version'], table='sales')
+    assert list(rest['changes']) == ['sales'] and len(rest['changes']['sales']) == 1
+    assert client.get('/sync', query_string={'since': version, 'table': 'nope'}).status_code == 400
+
+
+def test_migration_tombstones_rows_replaced_without_a_delete(app, query):
+    # Simulate the old REPLACE: the row vanishes while change_log only saw its insert
+    conn = sqlite3.connect(flask_api.db_path)
+    conn.execute("INSERT INTO change_log (table_name, row_id, op) VALUES ('vendors', 9999, 'insert')")
+    conn.execute('PRAGMA user_version = 14')
+    conn.commit()
+    conn.close()
+    flask_api.init_db()
+    assert query("SELECT op FROM change_log WHERE table_name = 'vendors' AND row_id = 9999 ORDER BY version") == [('insert',), ('delete',)]
@@ -0,0 +1,34 @@
+import flask_api
+
+
+def purchase(client, tag, qty, date, item='Kiwi'):
+    client.post('/insert_purchase', json={'item': item, 'item_tag': tag, 'qty_receive': qty, 'qty_accept': qty, 'date': date})
+
+
+def test_only_tags_with_stock_left_are_listed(client):
+    purchase(client, 'T-01-0002', 10, '2025-01-02')
+    purchase(client, 'T-01-0001', 5, '2025-01-01')
+    purchase(client, 'T-01-0003', 8, '2025-01-03')
+    purchase(client, 'T-01-0009', 8, '2025-01-03', item='Apple')
+    client.post('/insert_sale', json={'item': 'Kiwi', 'item_tag': 'T-01-0001', 'quantity': 5, 'date': '2025-01-04'})
+    dump = client.post('/insert_dump_sale', json={'item': 'Kiwi', 'item_tag': 'T-01-0002', 'quantity': 4, 'date': '2025-01-04'}).json['id']
+    client.post('/insert_vendor_rejection', json={'item': 'Kiwi', 'item_tag': 'T-01-0003', 'quantity_sent': 8, 'date': '2025-01-04'})
+    assert client.get('/get_available_tags_for_item?item_name=Kiwi').json == ['T-01-0002']
+    assert client.get('/get_available_tags_for_item?item_name=Kiwi&with_balance=1').json == [
+        {'tag': 'T-01-0002', 'received': 10, 'dispatched': 4, 'balance': 6, 'first_date': '2025-01-02'},
+    ]
+    client.delete('/delete_multiple_entries', json={'table_name': 'dump_sales', 'ids': [dump]})
+    assert client.get('/get_available_tags_for_item?item_name=Kiwi&with_balance=1').json[0]['balance'] == 10
+
+
+def test_rebuild_matches_the_triggers(client, query):
+    purchase(client, 'T-01-0001', 5, '2025-01-01')
+    client.post('/insert_sale', json={'item': 'Kiwi', 'item_tag': 'T-01-0001', 'quantity': 2, 'date': '2025-01-04'})
+    maintained = query('SELECT * FROM tag_balances ORDER BY 1, 2')
+    flask_api.run_write(lambda cursor: [cursor.execute(statement) for statement in flask_api.tag_balance_rebuild()])
+    assert query('SELECT * FROM tag_balances ORDER BY 1, 2') == maintained
+
+
+def test_open_tag_lookup_uses_the_partial_index(app, query):
+    plan = [row[3] for row in query(f'EXPLAIN QUERY PLAN SELECT tag FROM tag_balances WHERE item = ? AND {flask_api.TAG_OPEN_CONDITION} ORDER BY first_date, tag', ('Kiwi',))]
+    assert any('idx_tag_balances_open' in step for step in plan)
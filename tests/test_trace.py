@@ -0,0 +1,37 @@
+import json
+
+import flask_api
+
+
+def tags(*names):
+    return json.dumps([{'tag': name, 'po': 'PO1', 'qty': '4', 'pcs': '2'} for name in names])
+
+
+def test_trace_follows_a_tag_across_tables(client):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'vendor': 'V1', 'po_number': 'PO1', 'item_tag': 'VE-07-0001', 'qty_receive': 10, 'date': '2025-01-07'})
+    client.post('/insert_stock_update', json={'item': 'Kiwi', 'a_grade_qty': 4, 'a_grade_tags': tags('VE-07-0001'), 'b_grade_tags': tags('VE-07-0001', 'XX-01-0001'), 'dump_tags': 'not json', 'date': '2025-01-08'})
+    client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 3, 'item_tag': 'VE-07-0001', 'date': '2025-01-09'})
+    trace = client.get('/trace/VE-07-0001').json
+    assert (len(trace['purchases']), len(trace['stock_updates']), len(trace['sales'])) == (1, 2, 1)
+    assert (trace['stock_updates'][0]['grade'], trace['stock_updates'][0]['qty']) == ('a', 4)
+    unknown = client.get('/trace/NOPE').json
+    assert not any(unknown[table] for table in ('purchases', 'stock_updates', 'sales', 'vendor_rejections'))
+
+
+def test_stock_update_tags_follow_updates_and_rebuild(client, query):
+    stock_id = client.post('/insert_stock_update', json={'item': 'Kiwi', 'a_grade_tags': tags('VE-07-0001'), 'date': '2025-01-08'}).json['id']
+    client.put('/update_stock_update', json={'id': stock_id, 'item': 'Kiwi', 'a_grade_tags': tags('ZZ-01-0001'), 'date': '2025-01-08'})
+    maintained = query('SELECT stock_update_id, grade, tag, po_number, qty, pcs FROM stock_update_tags ORDER BY 1, 2, 3')
+    assert maintained == [(stock_id, 'a', 'ZZ-01-0001', 'PO1', 4, 2)]
+    flask_api.run_write(lambda cursor: [cursor.execute(statement) for statement in flask_api.stock_tag_rebuild()])
+    assert query('SELECT stock_update_id, grade, tag, po_number, qty, pcs FROM stock_update_tags ORDER BY 1, 2, 3') == maintained
+
+
+def test_vendor_returns_are_traced_by_their_own_tag(client, query):
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'vendor': 'V1', 'po_number': 'PO1', 'item_tag': 'VE-07-0001', 'qty_receive': 10, 'date': '2025-01-07'})
+    client.post('/insert_purchase', json={'item': 'Kiwi', 'vendor': 'V1', 'po_number': 'PO1', 'item_tag': 'VE-07-0002', 'qty_receive': 10, 'date': '2025-01-07'})
+    for tag, po_number in (('VE-07-0001', 'PO1'), ('VE-07-0002', 'PO1'), (None, 'PO1'), ('VE-07-0001', None)):
+        client.post('/insert_vendor_rejection', json={'item': 'Kiwi', 'vendor': 'V1', 'po_number': po_number, 'item_tag': tag, 'quantity_sent': 1, 'date': '2025-01-09'})
+    assert [row['id'] for row in client.get('/trace/VE-07-0001').json['vendor_rejections']] == [1, 3, 4]
+    plan = [row[3] for row in query('EXPLAIN QUERY PLAN SELECT * FROM vendor_rejections WHERE item_tag = ? ORDER BY id', ('x',))]
+    assert any('idx_vendor_rejections_tag' in step for step in plan)
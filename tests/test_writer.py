@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+import flask_api
+
+
+def sale_count(query):
+    return query('SELECT COUNT(*) FROM sales')[0][0]
+
+
+def test_a_failing_job_only_rolls_back_itself(app, query):
+    def good(cursor):
+        cursor.execute("INSERT INTO sales (item, quantity) VALUES ('Kiwi', 1)")
+        return cursor.lastrowid
+
+    def bad(cursor):
+        cursor.execute("INSERT INTO sales (item, quantity) VALUES ('Fig', 1)")
+        raise ValueError('boom')
+
+    futures = [flask_api.writer.submit(job) for job in (good, bad, good)]
+    assert futures[0].result() and futures[2].result()
+    assert isinstance(futures[1].exception(), ValueError)
+    assert query('SELECT item FROM sales ORDER BY id') == [('Kiwi',), ('Kiwi',)]
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_jobs_queued_when_the_writer_dies_run_after_restart(app, query):
+    started, release = threading.Event(), threading.Event()
+
+    def crash(cursor):
+        started.set()
+        release.wait(5)
+        raise SystemExit()
+
+    crashed = flask_api.writer.submit(crash)
+    started.wait(5)
+    queued = flask_api.writer.submit(lambda cursor: cursor.execute("INSERT INTO sales (item) VALUES ('Kiwi')").lastrowid)
+    release.set()
+    assert isinstance(crashed.exception(5), SystemExit)
+    flask_api.writer._thread.join(5)
+    assert flask_api.run_write(lambda cursor: cursor.execute("INSERT INTO sales (item) VALUES ('Fig')").lastrowid)
+    assert queued.result(5)
+    assert sale_count(query) == 2
+
+
+def test_a_write_stuck_in_the_queue_is_cancelled_with_503(app, client, query, monkeypatch):
+    monkeypatch.setattr(flask_api, 'WRITE_TIMEOUT_SECONDS', 0.2)
+    started, release = threading.Event(), threading.Event()
+
+    def block(cursor):
+        started.set()
+        release.wait(5)
+
+    blocker = flask_api.writer.submit(block)
+    started.wait(5)
+    response = client.post('/insert_sale', json={'item': 'Kiwi', 'quantity': 1, 'date': '2025-01-01'})
+    release.set()
+    blocker.result(5)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    time.sleep(0.05)
+    assert flask_api.run_write(lambda cursor: cursor.execute('SELECT COUNT(*) FROM sales').fetchone()[0]) == 0